@@ -0,0 +1,279 @@
+"""
+Micro-benchmarks for the backend's hot functions
+
+Times detect_priority, simple_rule_classifier, predict_category (with the
+Groq call stubbed out, so only the matching is measured),
+generate_tracking_id, get_last_timeline_update, should_send_reminder,
+encode_json on a department listing and find_similar_grievances against
+in-memory similarity indexes of increasing size. Nothing talks to MongoDB or
+the network.
+
+Every benchmark is calibrated to run for about --min-time seconds per
+repeat; the per-call median, minimum, mean and standard deviation of the
+repeats are reported. --output writes them as JSON together with the commit
+and library versions, and --compare checks a run against such a file, so
+two commits can be compared on the same machine:
+
+    git checkout main && python benchmark.py --output base.json
+    git checkout my-branch && python benchmark.py --compare base.json --fail-above 1.25
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 100,1000 --filter similar --quick
+    python benchmark.py --output results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+# Benchmark the default in-memory code paths, whatever the local .env enables
+os.environ["SIMILARITY_INDEX_DIR"] = ""
+os.environ["SIMILARITY_INDEX"] = "true"
+os.environ["TRACE_EXPORTER"] = ""
+os.environ["PROFILING_TOKEN"] = ""
+
+import numpy as np
+import sklearn
+from bson import ObjectId
+
+import main
+
+DEFAULT_SIZES = "100,1000,10000,100000"
+DEFAULT_MIN_TIME = 0.2
+DEFAULT_REPEATS = 5
+BENCHMARK_DEPARTMENT = "Public Works Department"
+LISTING_SIZE = 1000
+RESULTS_FORMAT = 1
+
+SUBJECTS = [
+    "Road damaged near the bus stand", "No water supply for a week", "Street lights not working",
+    "Garbage not collected", "Power outage in the village", "School building needs repair",
+    "Hospital lacks doctors", "Drainage overflowing onto the street", "Ration card not issued",
+    "Bridge cracked after the flood", "Pension not received", "Illegal sand mining near the river"
+]
+WORDS = (
+    "road water supply street light garbage drainage power school hospital bridge pension ration "
+    "village ward colony bus stand repair broken damaged overflowing pothole leak tank pipeline "
+    "electricity transformer teacher doctor nurse officer complaint request urgent weeks months "
+    "residents children elderly farmers market temple canal lake flood rain sewage mosquito"
+).split()
+
+# Answers the stubbed LLM gives, one per matching branch of predict_category
+LLM_ANSWERS = [
+    "Public Works Department",                 # exact
+    "The Public Works Department of Tamil Nadu",  # partial
+    "Public Work Departmnt",                   # fuzzy
+    "General",                                 # falls through to the rule-based classifier
+    "",                                        # no answer
+]
+
+def synthetic_text(rng):
+    return f"{rng.choice(SUBJECTS)} {' '.join(rng.choices(WORDS, k=rng.randint(15, 60)))}"
+
+def synthetic_petitions(rng, count):
+    """Petitions in the shapes the reminder code meets: summary field, legacy timeline, bare created_at"""
+    now = datetime.now()
+    petitions = []
+    for i in range(count):
+        created = now - timedelta(days=rng.randint(0, 30))
+        kind = i % 3
+        petition = {"status": rng.choice(["pending", "in_progress", "resolved"]), "tracking_id": f"GR-2024-{i:06d}"}
+        if kind == 0:
+            petition["last_activity_at"] = created
+        elif kind == 1:
+            petition["timeline"] = [
+                {"timestamp": (created + timedelta(hours=h)).isoformat(), "status": "pending"}
+                for h in range(rng.randint(1, 20))
+            ]
+        else:
+            petition["created_at"] = created.strftime("%d-%b-%Y")
+        if rng.random() < 0.3:
+            petition["last_reminded_at"] = (now - timedelta(days=rng.randint(0, 6))).isoformat()
+        petitions.append(petition)
+    return petitions
+
+def synthetic_listing(rng, count):
+    """Petition documents as a department listing reads them from MongoDB"""
+    now = datetime.now()
+    return [
+        {"_id": ObjectId(), "tracking_id": f"GR-2024-{i:06d}", "name": "Benchmark Petitioner", "phone": "9876543210",
+         "address": "12 Main Road, Chennai", "petition_type": "Complaint", "petition_subject": rng.choice(SUBJECTS),
+         "petition_description": synthetic_text(rng), "status": rng.choice(["pending", "in_progress", "resolved"]),
+         "priority": "Medium", "created_at": now.strftime("%d-%b-%Y"), "created_at_utc": now,
+         "department": BENCHMARK_DEPARTMENT, "last_status": "pending", "last_activity_at": now,
+         "timeline_count": 1, "last_updated": now, "similarity_detected": False}
+        for i in range(count)
+    ]
+
+def cycle(items):
+    """A function returning the next item on every call"""
+    state = {"i": -1}
+    def next_item():
+        state["i"] = (state["i"] + 1) % len(items)
+        return items[state["i"]]
+    return next_item
+
+def load_similarity_index(rng, size):
+    """Replace the shared similarity index with one of size synthetic grievances"""
+    index = main.SimilarityIndex(directory="")
+    texts = [synthetic_text(rng) for _ in range(size)]
+    entries = [
+        {"tracking_id": f"GR-BENCH-{i:06d}", "department": BENCHMARK_DEPARTMENT, "status": "pending",
+         "subject": text[:40], "description": text[:100] + "..."}
+        for i, text in enumerate(texts)
+    ]
+    index._append_segment(None, index._vectorize(texts), entries)
+    index.built_at = time.time()
+    main.similarity_index = index
+    return texts
+
+def measure(fn, min_time, repeats):
+    """Per-call seconds of each repeat, after calibrating the number of calls to about min_time"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or number >= 1_000_000:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return number, timings
+
+def benchmarks(rng, sizes, wanted):
+    """(name, params, function) for every benchmark, set up lazily by the generator"""
+    texts = cycle([synthetic_text(rng) + (" urgent" if i % 5 == 0 else "") for i in range(200)])
+    yield "detect_priority", {}, lambda: main.detect_priority(texts())
+    yield "simple_rule_classifier", {}, lambda: main.simple_rule_classifier(texts())
+    yield "generate_tracking_id", {}, main.generate_tracking_id
+
+    answers = cycle(LLM_ANSWERS)
+    main.classify_with_groq = lambda petition_text: answers()
+    main.SINGLEFLIGHT_ENABLED = False
+    yield "predict_category", {"llm": "stub"}, lambda: main.predict_category(texts())
+
+    petitions = cycle(synthetic_petitions(rng, 300))
+    yield "get_last_timeline_update", {}, lambda: main.get_last_timeline_update(petitions())
+    yield "should_send_reminder", {}, lambda: main.should_send_reminder(petitions())
+
+    listing = synthetic_listing(rng, LISTING_SIZE)
+    yield "encode_json", {"documents": LISTING_SIZE, "orjson": main.orjson is not None}, lambda: main.encode_json(listing)
+
+    for size in sizes if wanted("find_similar_grievances") else []:
+        corpus = load_similarity_index(rng, size)
+        # Half the queries are near-duplicates of indexed grievances, half are new text
+        queries = cycle([
+            corpus[rng.randrange(len(corpus))] if i % 2 else synthetic_text(rng)
+            for i in range(100)
+        ])
+        yield "find_similar_grievances", {"corpus_size": size}, \
+            lambda: main.find_similar_grievances(queries(), BENCHMARK_DEPARTMENT, scope="department")
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_key(result):
+    return result["name"] + "".join(f" {key}={value}" for key, value in sorted(result["params"].items()))
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.0f} ns"
+
+def compare(results, baseline_path, fail_above):
+    """Print the ratio of each median to the baseline's; True if any exceeds fail_above"""
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (ratio > 1 is slower):")
+    regressed = False
+    for result in results:
+        key = result_key(result)
+        if key not in baseline:
+            print(f"  {key:48} new")
+            continue
+        ratio = result["median_s"] / baseline[key]["median_s"]
+        flag = ""
+        if fail_above and ratio > fail_above:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"  {key:48} {format_time(baseline[key]['median_s'])} -> {format_time(result['median_s'])}  x{ratio:.2f}{flag}")
+    return regressed
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the grievance backend")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated similarity corpus sizes")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="Seconds per repeat")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--quick", action="store_true", help="One short repeat per benchmark (smoke test)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--fail-above", type=float, help="With --compare, exit 1 if a median is this many times slower")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.quick:
+        args.min_time, args.repeats = 0.02, 1
+
+    rng = random.Random(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = []
+    wanted = lambda name: not args.filter or args.filter in name
+    for name, params, fn in benchmarks(rng, sizes, wanted):
+        if not wanted(name):
+            continue
+        number, timings = measure(fn, args.min_time, args.repeats)
+        result = {
+            "name": name,
+            "params": params,
+            "calls_per_repeat": number,
+            "repeats": len(timings),
+            "median_s": statistics.median(timings),
+            "min_s": min(timings),
+            "mean_s": statistics.mean(timings),
+            "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0
+        }
+        results.append(result)
+        print(f"{result_key(result):48} median {format_time(result['median_s'])}  min {format_time(result['min_s'])}"
+              f"  ({number} calls x {len(timings)})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "format_version": RESULTS_FORMAT,
+                "commit": git_commit(),
+                "created_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "scikit_learn": sklearn.__version__,
+                "results": results
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.fail_above):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,221 @@
+"""
+Nightly batch job that finds duplicate grievances within each department
+
+Submission-time checks only compare one new grievance with the existing
+ones, so duplicates that were submitted before similarity detection existed,
+or that only connect through a third grievance, are never linked. This job
+vectorizes each department once, computes the pairwise cosine similarity in
+row chunks (so memory stays bounded by CLUSTER_CHUNK_SIZE rows of the product,
+not n x n), and groups the pairs above the threshold into connected
+components. related_to, cluster_id and cluster_member are written back to
+the petitions, and grievance_clusters is rebuilt for the department.
+
+Existing cluster links are kept as edges, so the clusters made at
+submission time are only ever merged, never split. related_to and cluster
+members are added to what is stored, never replaced, so links recorded at
+submission (cross-department ones included) and members added by concurrent
+submissions survive a run.
+
+Usage:
+    python cluster_duplicates.py                                   # every department
+    python cluster_duplicates.py "Public Works Department" --dry-run
+    python cluster_duplicates.py --threshold 0.85 --chunk-size 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+from dotenv import load_dotenv
+load_dotenv()
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from sklearn.feature_extraction.text import TfidfVectorizer
+from pymongo import UpdateOne
+from datetime import datetime
+
+from migrate_tracking_ids import connect_to_db, department_tables, UNIFIED_COLLECTION
+
+CLUSTERS_COLLECTION = "grievance_clusters"
+PETITION_STORAGE_MODE = os.environ.get("PETITION_STORAGE_MODE", "per_department")
+CLUSTER_THRESHOLD = float(os.environ.get("CLUSTER_THRESHOLD", "0.8"))
+CLUSTER_CHUNK_SIZE = int(os.environ.get("CLUSTER_CHUNK_SIZE", "1000"))
+CLUSTER_WRITE_BATCH = int(os.environ.get("CLUSTER_WRITE_BATCH", "500"))
+MAX_RELATED = 20
+
+def petition_collections(db, department):
+    """The collection to read a department from and the collections to write it to"""
+    if PETITION_STORAGE_MODE == "unified":
+        return db[UNIFIED_COLLECTION], {"department": department}, [db[UNIFIED_COLLECTION]]
+    read = db[department_tables[department]]
+    if PETITION_STORAGE_MODE == "dual_write":
+        return read, {}, [read, db[UNIFIED_COLLECTION]]
+    return read, {}, [read]
+
+def peak_memory_mb():
+    """Peak resident memory of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def similar_pairs(matrix, threshold, chunk_size):
+    """
+    Pairs (i, j, score) with i < j and cosine similarity >= threshold
+
+    Rows are L2-normalized, so a chunk's similarities are one sparse product
+    with the transposed matrix; only the entries above the threshold are kept.
+    """
+    rows, cols, scores = [], [], []
+    transposed = matrix.T.tocsc()
+    for start in range(0, matrix.shape[0], chunk_size):
+        block = (matrix[start:start + chunk_size] @ transposed).tocoo()
+        keep = (block.data >= threshold) & (block.col > block.row + start)
+        rows.append(block.row[keep] + start)
+        cols.append(block.col[keep])
+        scores.append(block.data[keep])
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+def cluster_department(db, department, threshold, chunk_size, dry_run=False):
+    """
+    Cluster one department's live grievances and write the results back
+
+    Returns a dict of statistics for the throughput report.
+    """
+    start = time.monotonic()
+    read, scope, writes = petition_collections(db, department)
+    petitions = list(read.find(
+        scope,
+        {"tracking_id": 1, "petition_subject": 1, "petition_description": 1, "cluster_id": 1}
+    ).sort("_id", 1))
+    petitions = [p for p in petitions if p.get("tracking_id")]
+    stats = {"department": department, "documents": len(petitions), "pairs": 0, "clusters": 0, "updated": 0}
+    if len(petitions) < 2:
+        stats["seconds"] = time.monotonic() - start
+        return stats
+
+    texts = [f"{p.get('petition_subject', '')} {p.get('petition_description', '')}".lower().strip() for p in petitions]
+    try:
+        matrix = TfidfVectorizer(stop_words='english', ngram_range=(1, 2), dtype=np.float32).fit_transform(texts).tocsr()
+    except ValueError:
+        # Every text was empty or only stop words
+        stats["seconds"] = time.monotonic() - start
+        return stats
+
+    rows, cols, scores = similar_pairs(matrix, threshold, chunk_size)
+    stats["pairs"] = len(rows)
+
+    # Links made at submission time are edges too, so existing clusters are only merged
+    position = {p["tracking_id"]: i for i, p in enumerate(petitions)}
+    linked = [(i, position[p["cluster_id"]]) for i, p in enumerate(petitions) if p.get("cluster_id") in position]
+    edge_rows = np.concatenate([rows, np.array([i for i, _ in linked], dtype=np.int64)])
+    edge_cols = np.concatenate([cols, np.array([j for _, j in linked], dtype=np.int64)])
+    n = len(petitions)
+    graph = sp.coo_matrix((np.ones(len(edge_rows)), (edge_rows, edge_cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    # Highest-scoring neighbours of each grievance become its related_to
+    neighbours = {}
+    for i, j, score in zip(rows.tolist(), cols.tolist(), scores.tolist()):
+        neighbours.setdefault(i, []).append((score, j))
+        neighbours.setdefault(j, []).append((score, i))
+
+    components = {}
+    for i, label in enumerate(labels):
+        components.setdefault(label, []).append(i)
+
+    now = datetime.now()
+    petition_updates = []
+    cluster_documents = []
+    canonical_ids = []
+    merged_ids = []
+    for members in components.values():
+        if len(members) < 2:
+            continue
+        # Keep the canonical grievance of an existing cluster; otherwise the oldest one leads
+        existing = [petitions[i]["cluster_id"] for i in members if petitions[i].get("cluster_id") in position]
+        canonical = max(set(existing), key=existing.count) if existing else petitions[members[0]]["tracking_id"]
+        member_ids = [petitions[i]["tracking_id"] for i in members if petitions[i]["tracking_id"] != canonical]
+        canonical_ids.append(canonical)
+        merged_ids.extend(cluster_id for cluster_id in set(existing) if cluster_id != canonical)
+        cluster_documents.append(UpdateOne(
+            {"_id": canonical},
+            {
+                "$set": {"department": department, "updated_at": now, "batch_clustered_at": now},
+                "$addToSet": {"members": {"$each": member_ids}},
+                "$setOnInsert": {"created_at": now}
+            },
+            upsert=True
+        ))
+        for i in members:
+            petition = petitions[i]
+            update = {"$set": {
+                "cluster_id": canonical,
+                "cluster_member": petition["tracking_id"] != canonical,
+                "last_updated": now
+            }}
+            related = [petitions[j]["tracking_id"] for _, j in sorted(neighbours.get(i, []), reverse=True)[:MAX_RELATED]]
+            if related:
+                update["$set"]["similarity_detected"] = True
+                update["$addToSet"] = {"related_to": {"$each": related}}
+            petition_updates.append(UpdateOne({"_id": petition["_id"]}, update))
+    stats["clusters"] = len(cluster_documents)
+    stats["updated"] = len(petition_updates)
+
+    if not dry_run:
+        for collection in writes:
+            for batch_start in range(0, len(petition_updates), CLUSTER_WRITE_BATCH):
+                collection.bulk_write(petition_updates[batch_start:batch_start + CLUSTER_WRITE_BATCH], ordered=False)
+        clusters = db[CLUSTERS_COLLECTION]
+        if cluster_documents:
+            clusters.bulk_write(cluster_documents, ordered=False)
+            # Sizes follow the stored members, which may include ones added since the petitions were read
+            clusters.update_many(
+                {"_id": {"$in": canonical_ids}},
+                [{"$set": {"size": {"$add": [{"$size": {"$ifNull": ["$members", []]}}, 1]}}}]
+            )
+        # Clusters this run merged into another one no longer have a canonical grievance of
+        # their own; clusters of archived grievances were not read, so they are left alone
+        if merged_ids:
+            clusters.delete_many({"department": department, "_id": {"$in": merged_ids}})
+
+    stats["seconds"] = time.monotonic() - start
+    return stats
+
+def cluster_duplicates(departments=None, threshold=CLUSTER_THRESHOLD, chunk_size=CLUSTER_CHUNK_SIZE, dry_run=False):
+    """Cluster every department (or the given ones) and print a throughput report"""
+    db = connect_to_db()
+    departments = departments or list(department_tables)
+    unknown = [d for d in departments if d not in department_tables]
+    if unknown:
+        raise SystemExit(f"Unknown department(s): {', '.join(unknown)}")
+
+    print(f"Clustering {len(departments)} department(s) at threshold {threshold}, chunk size {chunk_size}"
+          f"{' (dry run)' if dry_run else ''}\n")
+    total = {"documents": 0, "pairs": 0, "clusters": 0, "updated": 0, "seconds": 0.0}
+    for department in departments:
+        stats = cluster_department(db, department, threshold, chunk_size, dry_run)
+        for key in total:
+            total[key] += stats[key]
+        if stats["documents"]:
+            rate = stats["documents"] / stats["seconds"] if stats["seconds"] else 0
+            print(f"{department}: {stats['documents']} docs, {stats['pairs']} pairs, {stats['clusters']} clusters, "
+                  f"{stats['updated']} updated in {stats['seconds']:.2f}s ({rate:.0f} docs/s)")
+
+    rate = total["documents"] / total["seconds"] if total["seconds"] else 0
+    print(f"\nClustered {total['documents']} grievances into {total['clusters']} clusters "
+          f"({total['pairs']} similar pairs, {total['updated']} petitions updated)")
+    print(f"Throughput: {rate:.0f} docs/s over {total['seconds']:.2f}s, peak memory {peak_memory_mb():.1f} MB")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster duplicate grievances within each department")
+    parser.add_argument("departments", nargs="*", help="Departments to cluster (default: all)")
+    parser.add_argument("--threshold", type=float, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--chunk-size", type=int, default=CLUSTER_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Report clusters without writing them")
+    args = parser.parse_args()
+    cluster_duplicates(args.departments, args.threshold, args.chunk_size, args.dry_run)
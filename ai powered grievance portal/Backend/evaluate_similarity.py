@@ -0,0 +1,223 @@
+"""
+Offline evaluation of similarity thresholds and vectorizer settings
+
+Takes a labeled set of grievance pairs and reports, for every vectorizer
+setting and corpus size, precision/recall/F1 across a threshold sweep
+together with per-query latency and peak memory. Use it to back any change
+to the 0.8 cutoff in find_similar_grievances (or the 0.5 one used by
+/admin/test_similarity) with data.
+
+Labeled pairs are JSON lines:
+    {"a": "text of one grievance", "b": "text of another", "duplicate": true}
+
+Corpora of each size are made of the labeled texts plus distractors, read
+from --distractors (one text per line, e.g. an export of real grievances)
+or, if none are given, generated by shuffling words of the labeled texts.
+
+Usage:
+    python evaluate_similarity.py pairs.jsonl
+    python evaluate_similarity.py pairs.jsonl --sizes 1000,10000 --distractors texts.txt --output results.json
+"""
+
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+DEFAULT_SIZES = "1000,5000,20000"
+DEFAULT_THRESHOLDS = [round(t, 2) for t in np.arange(0.3, 0.96, 0.05)]
+LATENCY_QUERIES = 50
+LEGACY_LATENCY_QUERIES = 10  # the legacy setting refits per query, so keep its sample small
+
+class FittedTfidf:
+    """TF-IDF fitted once on the corpus; queries are transformed with the fitted vocabulary"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+
+    def index(self, corpus):
+        self.vectorizer = TfidfVectorizer(stop_words='english', **self.settings)
+        self.matrix = self.vectorizer.fit_transform(corpus)
+        return self.matrix
+
+    def query(self, text):
+        return (self.matrix @ self.vectorizer.transform([text]).T).toarray().ravel()
+
+class LegacyTfidf(FittedTfidf):
+    """
+    What scan_similar_grievances does: refit TF-IDF (max 1000 features) on the
+    corpus plus the new text for every single check
+    """
+
+    def __init__(self):
+        super().__init__(max_features=1000, ngram_range=(1, 2), min_df=1, max_df=0.95)
+
+    def query(self, text):
+        matrix = TfidfVectorizer(stop_words='english', **self.settings).fit_transform([text] + self.corpus)
+        return cosine_similarity(matrix[0:1], matrix[1:]).flatten()
+
+    def index(self, corpus):
+        self.corpus = corpus
+        return super().index(corpus)
+
+class HashedTfidf:
+    """The shared similarity index in main.py: hashed features with IDF applied at query time"""
+
+    def __init__(self, n_features=2 ** 18):
+        self.vectorizer = HashingVectorizer(
+            stop_words='english', ngram_range=(1, 2), n_features=n_features, alternate_sign=False, norm=None
+        )
+
+    def index(self, corpus):
+        counts = self.vectorizer.transform(corpus).tocsr()
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        self.idf = np.log((1 + counts.shape[0]) / (1 + df)) + 1
+        self.matrix = normalize(counts.multiply(self.idf).tocsr())
+        return self.matrix
+
+    def query(self, text):
+        vector = normalize(self.vectorizer.transform([text]).multiply(self.idf).tocsr())
+        return (self.matrix @ vector.T).toarray().ravel()
+
+SETTINGS = {
+    "legacy_tfidf_1000": LegacyTfidf,
+    "tfidf_unigram": lambda: FittedTfidf(ngram_range=(1, 1)),
+    "tfidf_bigram": lambda: FittedTfidf(ngram_range=(1, 2)),
+    "tfidf_bigram_sublinear": lambda: FittedTfidf(ngram_range=(1, 2), sublinear_tf=True),
+    "hashed_bigram": HashedTfidf,
+}
+
+def load_pairs(path):
+    pairs = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if "a" not in row or "b" not in row or "duplicate" not in row:
+                raise SystemExit(f"{path}:{line_number}: expected a, b and duplicate")
+            pairs.append((row["a"].lower().strip(), row["b"].lower().strip(), bool(row["duplicate"])))
+    if not any(duplicate for _, _, duplicate in pairs):
+        raise SystemExit("The labeled set needs at least one duplicate pair")
+    return pairs
+
+def build_corpus(labeled_texts, size, distractors, rng):
+    """Labeled texts first, then distractors up to size"""
+    corpus = list(labeled_texts)
+    if distractors:
+        pool = distractors
+    else:
+        words = " ".join(labeled_texts).split()
+        pool = [" ".join(rng.sample(words, min(len(words), 15))) for _ in range(max(0, size - len(corpus)))]
+    while len(corpus) < size and pool:
+        corpus.extend(pool[:size - len(corpus)])
+    return corpus
+
+def sweep(scores, labels, thresholds):
+    rows = []
+    for threshold in thresholds:
+        predicted = scores >= threshold
+        true_positives = int(np.sum(predicted & labels))
+        precision = true_positives / int(np.sum(predicted)) if np.any(predicted) else 1.0
+        recall = true_positives / int(np.sum(labels))
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        rows.append({"threshold": threshold, "precision": precision, "recall": recall, "f1": f1})
+    return rows
+
+def evaluate(name, factory, pairs, corpus, position, thresholds, rng):
+    # Pair scores come from the corpus index, as if each grievance had been checked against the other
+    scorer = factory()
+    matrix = scorer.index(corpus)
+    rows_a = matrix[[position[a] for a, _, _ in pairs]]
+    rows_b = matrix[[position[b] for _, b, _ in pairs]]
+    scores = np.asarray(rows_a.multiply(rows_b).sum(axis=1)).ravel()
+    labels = np.array([duplicate for _, _, duplicate in pairs])
+
+    sample_size = LEGACY_LATENCY_QUERIES if isinstance(scorer, LegacyTfidf) else LATENCY_QUERIES
+    queries = rng.sample([a for a, _, _ in pairs], min(sample_size, len(pairs)))
+    latencies = []
+    for text in queries:
+        start = time.perf_counter()
+        scorer.query(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Memory is measured in a separate pass because tracing slows everything down
+    tracemalloc.start()
+    traced = factory()
+    traced.index(corpus)
+    traced.query(queries[0])
+    peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+
+    curve = sweep(scores, labels, thresholds)
+    best = max(curve, key=lambda row: row["f1"])
+    return {
+        "setting": name,
+        "corpus_size": len(corpus),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "peak_memory_mb": peak_mb,
+        "best_threshold": best["threshold"],
+        "best_f1": best["f1"],
+        "curve": curve
+    }
+
+def print_result(result):
+    print(f"\n{result['setting']} @ {result['corpus_size']} docs: "
+          f"p50 {result['latency_ms_p50']:.2f} ms, p95 {result['latency_ms_p95']:.2f} ms, "
+          f"peak {result['peak_memory_mb']:.1f} MB, best F1 {result['best_f1']:.3f} at {result['best_threshold']}")
+    print("  threshold  precision  recall  f1")
+    for row in result["curve"]:
+        print(f"  {row['threshold']:9.2f}  {row['precision']:9.3f}  {row['recall']:6.3f}  {row['f1']:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate similarity thresholds on labeled grievance pairs")
+    parser.add_argument("pairs", help="JSON lines of {a, b, duplicate}")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus sizes")
+    parser.add_argument("--settings", default=",".join(SETTINGS), help="Comma-separated vectorizer settings")
+    parser.add_argument("--distractors", help="File with one distractor text per line")
+    parser.add_argument("--output", help="Write all results as JSON to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pairs = load_pairs(args.pairs)
+    labeled_texts = list(dict.fromkeys(text for a, b, _ in pairs for text in (a, b)))
+    distractors = None
+    if args.distractors:
+        with open(args.distractors) as f:
+            distractors = [line.lower().strip() for line in f if line.strip()]
+
+    settings = args.settings.split(",")
+    unknown = [name for name in settings if name not in SETTINGS]
+    if unknown:
+        raise SystemExit(f"Unknown setting(s): {', '.join(unknown)}; expected {', '.join(SETTINGS)}")
+
+    print(f"{len(pairs)} labeled pairs ({sum(d for _, _, d in pairs)} duplicates), {len(labeled_texts)} distinct texts")
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        corpus = build_corpus(labeled_texts, size, distractors, rng)
+        position = {text: i for i, text in enumerate(corpus[:len(labeled_texts)])}
+        for name in settings:
+            result = evaluate(name, SETTINGS[name], pairs, corpus, position, DEFAULT_THRESHOLDS, rng)
+            print_result(result)
+            results.append(result)
+
+    print("\nSummary (best F1 per setting and corpus size):")
+    for result in results:
+        print(f"  {result['setting']:24} {result['corpus_size']:>7}  F1 {result['best_f1']:.3f} at {result['best_threshold']:.2f}"
+              f"  p95 {result['latency_ms_p95']:8.2f} ms  {result['peak_memory_mb']:7.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+"""
+End-to-end load test: synthetic data, a stub Groq endpoint and a traffic driver
+
+Commands, meant to be run against a local mongod:
+
+    seed      Fill every department collection (in the layout PETITION_STORAGE_MODE
+              selects) with synthetic grievances and their submission timeline
+              events, and write a sample of tracking IDs for the driver.
+    unseed    Remove every document seed and the submissions of run created.
+    stub-llm  Serve an OpenAI-compatible /openai/v1/chat/completions that answers
+              with a department after a configurable latency. Point the API at it
+              with GROQ_API_URL (and any GROQ_API_KEY).
+    run       Replay a mix of submit, classify, track, dashboard listing and status
+              update calls against a running API and report throughput and
+              p50/p95/p99 latency per route. With --start-server it starts the
+              stub and uvicorn itself and stops them afterwards.
+
+With --rate the driver sends an open-loop Poisson stream and measures latency
+from each request's scheduled start, so a saturated server shows up as
+latency instead of silently lowering the offered load. Without it,
+--concurrency users send requests back to back.
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017 python load_test.py seed --per-department 2000
+    python load_test.py run --start-server --workers 4 --duration 60 --rate 200 --output run.json
+    python load_test.py stub-llm --port 8099 --latency-ms 400 --jitter-ms 150
+    python load_test.py run --base-url http://localhost:8000 --concurrency 50 --mix submit=1,track=5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+load_dotenv()
+
+DEFAULT_IDS_FILE = "load_test_ids.json"
+DEFAULT_MIX = "submit=15,classify=10,track=40,list=25,status=10"
+DEFAULT_STUB_PORT = 8099
+DEFAULT_API_PORT = 8000
+SEED_BATCH_SIZE = 1000
+SAMPLE_IDS_PER_DEPARTMENT = 200
+DRIVER_PETITIONER = "Load Test Driver"
+STATUSES = ["pending", "in_progress", "resolved", "rejected"]
+STATUS_WEIGHTS = [50, 25, 20, 5]
+
+# Typical problems per department; the rest fall back to GENERIC_PROBLEMS
+DEPARTMENT_PROBLEMS = {
+    "Public Works Department": ["road full of potholes", "bridge railing broken", "government building roof leaking"],
+    "Municipal Administration and Water Supply Department": ["no drinking water supply", "garbage not collected", "sewage overflowing onto the street", "street lights not working"],
+    "Energy Department": ["frequent power cuts", "transformer burnt out", "electricity bill wrongly calculated", "low voltage every evening"],
+    "Health and Family Welfare Department": ["primary health centre has no doctor", "ambulance did not arrive", "medicines out of stock at the hospital"],
+    "School Education Department": ["school has no toilets for girls", "teacher posts vacant", "noon meal quality is poor"],
+    "Revenue and Disaster Management Department": ["patta transfer pending", "flood relief not received", "encroachment on government land"],
+    "Transport Department": ["bus service to the village stopped", "buses overcrowded and late", "driving licence not issued"],
+    "Home Prohibition and Excise Department": ["illicit liquor sold near the school", "police not registering complaint", "chain snatching in the area"],
+    "Agriculture and Farmers welfares Department": ["crop insurance claim rejected", "fertilizer not available at the depot", "drought compensation pending"],
+    "Co-operation Food and Consumer Protection Department": ["ration card not issued", "ration shop closed on working days", "short weight of rice at the ration shop"],
+    "Rural Development and Panchayat Raj Department": ["village road not laid", "100 day work wages pending", "panchayat not cleaning the canal"],
+    "Social Welfare and Women Empowerment Department": ["old age pension stopped", "marriage assistance not received", "widow pension application pending"],
+}
+GENERIC_PROBLEMS = ["application pending for months", "officials not responding", "scheme benefit not received", "certificate not issued"]
+PLACES = ["Ward 12", "Anna Nagar", "Kottur village", "the bus stand", "Gandhi Street", "the market road", "Velachery", "Tambaram", "Madurai east", "the old colony"]
+DURATIONS = ["two weeks", "a month", "three months", "six months", "over a year"]
+DETAILS = [
+    "Residents have complained many times but no action has been taken.",
+    "Elderly people and children are the worst affected.",
+    "We request the department to take urgent action.",
+    "Earlier petitions were not answered.",
+    "This is causing great hardship to the families here.",
+    "There is a danger of an accident if this is not fixed.",
+]
+
+def synthetic_grievance(rng, department):
+    problem = rng.choice(DEPARTMENT_PROBLEMS.get(department, GENERIC_PROBLEMS))
+    place = rng.choice(PLACES)
+    subject = f"{problem.capitalize()} in {place}"
+    description = (
+        f"The {problem} in {place} has continued for {rng.choice(DURATIONS)}. "
+        + " ".join(rng.sample(DETAILS, rng.randint(1, 3)))
+    )
+    return subject, description
+
+def synthetic_phone(rng):
+    return f"9{rng.randrange(10 ** 9):09d}"
+
+def department_weights(departments, rng):
+    """Skewed volumes: a few departments receive most grievances, as in production"""
+    weights = [1 / (rank + 1) for rank in range(len(departments))]
+    order = list(departments)
+    rng.shuffle(order)
+    return order, weights
+
+# --------------------------- Seed ---------------------------
+
+def seed(args):
+    from migrate_tracking_ids import connect_to_db, department_tables, TIMELINE_COLLECTION, generate_tracking_id
+    from cluster_duplicates import petition_collections
+
+    rng = random.Random(args.seed)
+    db = connect_to_db()
+    now = datetime.now()
+    samples = []
+    total = 0
+    start = time.monotonic()
+    for department in department_tables:
+        _, _, writes = petition_collections(db, department)
+        count = args.per_department
+        if args.skew:
+            count = max(1, int(count * rng.choice([0.1, 0.3, 1, 1, 2, 4])))
+        seen = set()
+        sampled = 0
+        for batch_start in range(0, count, SEED_BATCH_SIZE):
+            petitions, events = [], []
+            for _ in range(min(SEED_BATCH_SIZE, count - batch_start)):
+                tracking_id = generate_tracking_id()
+                while tracking_id in seen:
+                    tracking_id = generate_tracking_id()
+                seen.add(tracking_id)
+                subject, description = synthetic_grievance(rng, department)
+                created = now - timedelta(days=rng.randint(0, args.days), seconds=rng.randrange(86400))
+                status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+                last_activity = created + timedelta(days=rng.randint(0, 10)) if status != "pending" else created
+                phone = synthetic_phone(rng)
+                petitions.append({
+                    "tracking_id": tracking_id,
+                    "name": f"Petitioner {rng.randrange(100000)}",
+                    "phone": phone,
+                    "address": f"{rng.randint(1, 200)}, {rng.choice(PLACES)}",
+                    "petition_type": rng.choice(["Complaint", "Request", "Grievance"]),
+                    "petition_subject": subject,
+                    "petition_description": description,
+                    "status": status,
+                    "priority": rng.choices(["High", "Medium", "Low"], [15, 45, 40])[0],
+                    "created_at": created.strftime("%d-%b-%Y"),
+                    "created_at_utc": created,
+                    "department": department,
+                    "last_status": status,
+                    "last_activity_at": min(last_activity, now),
+                    "timeline_count": 1,
+                    "last_updated": min(last_activity, now),
+                    "similarity_detected": False,
+                    "load_test": True
+                })
+                events.append({
+                    "timestamp": created, "date": created.strftime("%d-%b-%Y"), "time": created.strftime("%H:%M:%S"),
+                    "status": "pending", "comment": "Grievance submitted successfully", "update_type": "submission",
+                    "tracking_id": tracking_id, "department": department, "load_test": True
+                })
+                if sampled < SAMPLE_IDS_PER_DEPARTMENT:
+                    samples.append({"tracking_id": tracking_id, "department": department, "phone": phone})
+                    sampled += 1
+            for collection in writes:
+                collection.insert_many([dict(p) for p in petitions], ordered=False)
+            db[TIMELINE_COLLECTION].insert_many(events, ordered=False)
+        total += count
+        print(f"{department}: {count} grievances")
+
+    with open(args.ids_file, "w") as f:
+        json.dump(samples, f)
+    elapsed = time.monotonic() - start
+    print(f"\nSeeded {total} grievances in {elapsed:.1f}s ({total / elapsed:.0f}/s); "
+          f"{len(samples)} sample IDs written to {args.ids_file}")
+    print("Rebuild the dashboard counters with POST /admin/stats/reconcile before measuring dashboards.")
+
+def unseed(args):
+    from migrate_tracking_ids import connect_to_db, department_tables, TIMELINE_COLLECTION, UNIFIED_COLLECTION
+
+    db = connect_to_db()
+    removed = 0
+    # Grievances submitted by the driver go through the API, so they are recognised by name
+    created = {"$or": [{"load_test": True}, {"name": DRIVER_PETITIONER}]}
+    for collection in set(department_tables.values()) | {UNIFIED_COLLECTION}:
+        submitted = [p["tracking_id"] for p in db[collection].find({"name": DRIVER_PETITIONER}, {"tracking_id": 1})]
+        if submitted:
+            removed += db[TIMELINE_COLLECTION].delete_many({"tracking_id": {"$in": submitted}}).deleted_count
+        removed += db[collection].delete_many(created).deleted_count
+    removed += db[TIMELINE_COLLECTION].delete_many({"load_test": True}).deleted_count
+    print(f"Removed {removed} load test documents")
+
+# --------------------------- Stub LLM ---------------------------
+
+def stub_llm(args):
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+    from migrate_tracking_ids import department_tables
+
+    rng = random.Random(args.seed)
+    departments = list(department_tables)
+    stub = FastAPI()
+
+    def answer(prompt):
+        # The petition text is the last quoted part of the classification prompt
+        text = prompt.rsplit("Petition: '", 1)[-1].lower()
+        for department, problems in DEPARTMENT_PROBLEMS.items():
+            if any(problem in text for problem in problems):
+                return department
+        return rng.choice(departments)
+
+    @stub.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(max(0.0, rng.gauss(args.latency_ms, args.jitter_ms)) / 1000)
+        if rng.random() < args.error_rate:
+            return JSONResponse(status_code=503, content={"error": {"message": "stub overloaded"}})
+        prompt = body["messages"][-1]["content"]
+        return {
+            "id": f"stub-{rng.randrange(10 ** 9)}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer(prompt)}, "finish_reason": "stop"}]
+        }
+
+    uvicorn.run(stub, host=args.host, port=args.port, log_level="warning")
+
+# --------------------------- Traffic driver ---------------------------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+class Driver:
+    """Issues the operations of the mix and records latency per route"""
+
+    def __init__(self, client, rng, identities, departments, weights):
+        self.client = client
+        self.rng = rng
+        self.identities = identities
+        self.departments = departments
+        self.weights = weights
+        self.latencies = {}
+        self.errors = {}
+        self.measuring = False
+
+    def _record(self, route, seconds, ok):
+        if not self.measuring:
+            return
+        self.latencies.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    async def _call(self, route, method, path, scheduled, **kwargs):
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+            ok = response.status_code < 400 and not (isinstance(body, dict) and (body.get("error") or body.get("success") is False))
+        except Exception:
+            response, body, ok = None, {}, False
+        self._record(route, time.perf_counter() - scheduled, ok)
+        return body
+
+    def _department(self):
+        return self.rng.choices(self.departments, self.weights)[0]
+
+    def _identity(self):
+        return self.rng.choice(self.identities) if self.identities else None
+
+    async def submit(self, scheduled):
+        department = self._department()
+        subject, description = synthetic_grievance(self.rng, department)
+        phone = synthetic_phone(self.rng)
+        body = await self._call("submit", "POST", "/submit_to_department", scheduled, data={
+            "name": DRIVER_PETITIONER, "phone": phone, "address": self.rng.choice(PLACES), "petition_type": "Complaint",
+            "petition_subject": subject, "petition_description": description, "category": department
+        })
+        if isinstance(body, dict) and body.get("tracking_id"):
+            self.identities.append({"tracking_id": body["tracking_id"], "department": department, "phone": phone})
+
+    async def classify(self, scheduled):
+        subject, description = synthetic_grievance(self.rng, self._department())
+        await self._call("classify", "POST", "/classify", scheduled, data={"petition_text": f"{subject}. {description}"})
+
+    async def track(self, scheduled):
+        identity = self._identity()
+        if identity is None:
+            return await self.submit(scheduled)
+        await self._call("track", "POST", "/track_grievance", scheduled,
+                         data={"grievance_id": identity["tracking_id"], "phone": identity["phone"]})
+
+    async def list_petitions(self, scheduled):
+        await self._call("list", "GET", "/admin/petitions", scheduled, params={"department": self._department()})
+
+    async def status(self, scheduled):
+        identity = self._identity()
+        if identity is None:
+            return await self.submit(scheduled)
+        await self._call("status", "POST", "/update_grievance_status", scheduled, data={
+            "grievance_id": identity["tracking_id"], "department": identity["department"],
+            "status": self.rng.choice(["in_progress", "resolved", "pending"]), "comment": "load test update"
+        })
+
+# Names used in --mix and the Driver methods that perform them
+OPERATIONS = {"submit": "submit", "classify": "classify", "track": "track", "list": "list_petitions", "status": "status"}
+
+def parse_mix(mix):
+    operations, weights = [], []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name}; expected {', '.join(OPERATIONS)}")
+        operations.append(OPERATIONS[name])
+        weights.append(float(weight or 1))
+    return operations, weights
+
+async def drive(args, identities, departments, weights):
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("The traffic driver needs httpx: pip install httpx")
+
+    rng = random.Random(args.seed)
+    operations, operation_weights = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        driver = Driver(client, rng, identities, departments, weights)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        measure_from = started + args.warmup
+        stop_at = measure_from + args.duration
+        in_flight = set()
+
+        def next_operation():
+            return getattr(driver, rng.choices(operations, operation_weights)[0])
+
+        async def user():
+            while loop.time() < stop_at:
+                await next_operation()(time.perf_counter())
+                if args.think_ms:
+                    await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+        async def measure_switch():
+            await asyncio.sleep(args.warmup)
+            driver.measuring = True
+            print(f"Warm-up done, measuring for {args.duration}s")
+
+        switch = asyncio.create_task(measure_switch())
+        if args.rate:
+            # Open loop: requests keep coming at the offered rate however slow the server gets
+            semaphore = asyncio.Semaphore(args.concurrency * 10)
+            async def bounded(operation, scheduled):
+                async with semaphore:
+                    await operation(scheduled)
+            next_at = loop.time()
+            while next_at < stop_at:
+                delay = next_at - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                scheduled = time.perf_counter() + min(0.0, delay)
+                task = asyncio.create_task(bounded(next_operation(), scheduled))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                next_at += rng.expovariate(args.rate)
+            if in_flight:
+                await asyncio.wait(in_flight, timeout=args.timeout)
+        else:
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        await switch
+        return driver
+
+def report(driver, args):
+    results = {"duration_s": args.duration, "rate": args.rate, "concurrency": args.concurrency, "mix": args.mix, "routes": {}}
+    print(f"\n{'route':10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    all_latencies = []
+    for route in sorted(driver.latencies):
+        latencies = sorted(driver.latencies[route])
+        all_latencies.extend(latencies)
+        row = {
+            "requests": len(latencies),
+            "errors": driver.errors.get(route, 0),
+            "throughput_rps": len(latencies) / args.duration,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000
+        }
+        results["routes"][route] = row
+        print(f"{route:10} {row['requests']:9} {row['errors']:7} {row['throughput_rps']:8.1f} "
+              f"{row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f} {row['max_ms']:9.1f}")
+    all_latencies.sort()
+    if all_latencies:
+        results["total"] = {
+            "requests": len(all_latencies),
+            "errors": sum(driver.errors.values()),
+            "throughput_rps": len(all_latencies) / args.duration,
+            "p50_ms": percentile(all_latencies, 0.50) * 1000,
+            "p95_ms": percentile(all_latencies, 0.95) * 1000,
+            "p99_ms": percentile(all_latencies, 0.99) * 1000
+        }
+        total = results["total"]
+        print(f"{'total':10} {total['requests']:9} {total['errors']:7} {total['throughput_rps']:8.1f} "
+              f"{total['p50_ms']:9.1f} {total['p95_ms']:9.1f} {total['p99_ms']:9.1f}")
+    if args.output:
+        results["created_at"] = datetime.now().isoformat()
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+def wait_until_up(url, timeout=60):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+def start_servers(args):
+    """Start the stub LLM and uvicorn; returns the processes to stop afterwards"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(here, "load_test.py"), "stub-llm",
+        "--port", str(args.stub_port), "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms)
+    ])
+    env = dict(
+        os.environ,
+        GROQ_API_URL=f"http://127.0.0.1:{args.stub_port}/openai/v1/chat/completions",
+        GROQ_API_KEY=os.environ.get("GROQ_API_KEY") or "load-test"
+    )
+    api = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port),
+        "--workers", str(args.workers), "--log-level", "warning"
+    ], cwd=here, env=env)
+    args.base_url = f"http://127.0.0.1:{args.api_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.stub_port}/docs")
+        wait_until_up(args.base_url + "/")
+    except SystemExit:
+        stop_servers([stub, api])
+        raise
+    return [stub, api]
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def run(args):
+    from migrate_tracking_ids import department_tables
+
+    identities = []
+    if os.path.exists(args.ids_file):
+        with open(args.ids_file) as f:
+            identities = json.load(f)
+    else:
+        print(f"{args.ids_file} not found; track and status calls will use grievances submitted during the run")
+    departments, weights = department_weights(department_tables, random.Random(args.seed))
+
+    processes = start_servers(args) if args.start_server else []
+    try:
+        print(f"Driving {args.base_url} for {args.warmup}s warm-up + {args.duration}s "
+              f"({'%g req/s open loop' % args.rate if args.rate else '%d users closed loop' % args.concurrency}), mix {args.mix}")
+        driver = asyncio.run(drive(args, identities, departments, weights))
+    finally:
+        stop_servers(processes)
+    report(driver, args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the grievance portal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ids-file", default=DEFAULT_IDS_FILE, help="Sample tracking IDs written by seed and read by run")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Populate MongoDB with synthetic grievances")
+    seed_parser.add_argument("--per-department", type=int, default=1000)
+    seed_parser.add_argument("--days", type=int, default=180, help="Spread creation dates over this many days")
+    seed_parser.add_argument("--skew", action="store_true", help="Vary volume between departments")
+    seed_parser.set_defaults(handler=seed)
+
+    unseed_parser = commands.add_parser("unseed", help="Remove everything seed (and run) created")
+    unseed_parser.set_defaults(handler=unseed)
+
+    stub_parser = commands.add_parser("stub-llm", help="Serve a stub Groq chat completions endpoint")
+    stub_parser.add_argument("--host", default="127.0.0.1")
+    stub_parser.add_argument("--port", type=int, default=DEFAULT_STUB_PORT)
+    stub_parser.add_argument("--latency-ms", type=float, default=300)
+    stub_parser.add_argument("--jitter-ms", type=float, default=100)
+    stub_parser.add_argument("--error-rate", type=float, default=0.0)
+    stub_parser.set_defaults(handler=stub_llm)
+
+    run_parser = commands.add_parser("run", help="Drive traffic against the API and report latencies")
+    run_parser.add_argument("--base-url", default=f"http://127.0.0.1:{DEFAULT_API_PORT}")
+    run_parser.add_argument("--duration", type=float, default=60)
+    run_parser.add_argument("--warmup", type=float, default=10)
+    run_parser.add_argument("--concurrency", type=int, default=20, help="Users (closed loop) or connections (open loop)")
+    run_parser.add_argument("--rate", type=float, help="Requests per second, open loop")
+    run_parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a user's requests")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. submit=1,track=4")
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--output", help="Write the results as JSON to this file")
+    run_parser.add_argument("--start-server", action="store_true", help="Start the stub LLM and uvicorn for the run")
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--api-port", type=int, default=DEFAULT_API_PORT)
+    run_parser.add_argument("--stub-port", type=int, default=DEFAULT_STUB_PORT)
+    run_parser.add_argument("--latency-ms", type=float, default=300, help="Stub LLM latency with --start-server")
+    run_parser.add_argument("--jitter-ms", type=float, default=100)
+    run_parser.set_defaults(handler=run)
+
+    args = parser.parse_args()
+    args.handler(args)
@@ -1,52 +1,908 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, Form, UploadFile, File, HTTPException
+from fastapi import FastAPI, APIRouter, Form, UploadFile, File, HTTPException, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import mysql.connector
 import bcrypt
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta, timezone
 import requests
 import difflib
-from pymongo import MongoClient
-from pydantic import BaseModel
+from pymongo import MongoClient, ReplaceOne, UpdateOne, CursorType
+from pymongo.errors import BulkWriteError
+from pymongo import monitoring
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.concurrency import run_in_threadpool
+import anyio
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from pydantic import BaseModel, ConfigDict, Field, BeforeValidator, TypeAdapter, ValidationError
+from typing import Annotated, List, Optional, Union
 import random
 import string
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-import pytz
 import logging
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+import itertools
+import asyncio
+import json
+import threading
+import hashlib
+import shutil
+import functools
+import inspect
+import concurrent.futures
+import importlib
+import bisect
+import contextvars
+import gc
+import tracemalloc
+import hmac
+import sys
+import uuid
+import queue
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+try:
+    import fcntl
+except ImportError:  # Windows: index files are then only safe with a single worker
+    fcntl = None
+try:
+    import resource
+except ImportError:  # Windows: /admin/memory then has no peak RSS
+    resource = None
+try:
+    import orjson
+except ImportError:  # Responses are then encoded with the json module
+    orjson = None
 
 # Setup logging for scheduler
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --------------------------- Features ---------------------------
+
+# Optional parts of the API, chosen with APP_FEATURES ("all", or a comma
+# separated list; empty for a worker that only serves submission, tracking
+# and dashboards):
+#   similarity      - duplicate detection on submission and the similarity routes
+#   scheduler       - the APScheduler jobs for reminders, archiving and counters
+#   classification  - /classify through the LLM
+#   notifications   - petitioner notifications and their admin routes
+# Each app built by create_app() keeps its own features in app.state.features.
+# Code outside a request (scheduler jobs, the event bus, the similarity index)
+# follows the features of the app the worker started, or APP_FEATURES before
+# any app has started.
+FEATURES = ("similarity", "scheduler", "classification", "notifications")
+
+def parse_features(value):
+    value = (value or "").strip().lower()
+    if value == "all":
+        return set(FEATURES)
+    features = {feature.strip() for feature in value.split(",") if feature.strip()}
+    unknown = features - set(FEATURES)
+    if unknown:
+        raise RuntimeError(f"Unknown APP_FEATURES: {', '.join(sorted(unknown))}; expected all or any of {', '.join(FEATURES)}")
+    return features
+
+ENABLED_FEATURES = parse_features(os.environ.get("APP_FEATURES", "all"))
+APP_WARMUP = os.environ.get("APP_WARMUP", "true").lower() == "true"
+
+# Set by startup_event() to the features of the app being served
+running_features = None
+
+def feature_enabled(feature):
+    return feature in (running_features if running_features is not None else ENABLED_FEATURES)
+
+# --------------------------- Lazy Imports ---------------------------
+
+# scikit-learn, numpy, scipy and APScheduler account for most of a worker's
+# import time and memory, and only some features use them. They are bound
+# here as proxies that import the module on first attribute access; with
+# APP_WARMUP the modules of the enabled features are imported during startup
+# instead, before the worker takes traffic. The time and resident memory
+# each import took are kept for /admin/startup.
+module_loads = {}
+_module_load_lock = threading.Lock()
+
+class LazyModule:
+    """
+    A module imported on first use, charged to the feature that needs it
+    """
+
+    def __init__(self, name, feature):
+        self._name = name
+        self._feature = feature
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with _module_load_lock:
+                if self._module is None:
+                    rss_before = process_memory().get("rss_mb", 0)
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    module_loads[self._name] = {
+                        "feature": self._feature,
+                        "seconds": round(time.perf_counter() - start, 3),
+                        "rss_mb": round(process_memory().get("rss_mb", 0) - rss_before, 1),
+                        "loaded_at": datetime.now().isoformat()
+                    }
+                    logger.info(f"Imported {self._name} for {self._feature} in {module_loads[self._name]['seconds']:.2f}s")
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+np = LazyModule("numpy", "similarity")
+sp = LazyModule("scipy.sparse", "similarity")
+sklearn_text = LazyModule("sklearn.feature_extraction.text", "similarity")
+sklearn_preprocessing = LazyModule("sklearn.preprocessing", "similarity")
+sklearn_pairwise = LazyModule("sklearn.metrics.pairwise", "similarity")
+apscheduler_background = LazyModule("apscheduler.schedulers.background", "scheduler")
+apscheduler_cron = LazyModule("apscheduler.triggers.cron", "scheduler")
+pytz = LazyModule("pytz", "scheduler")
+LAZY_MODULES = [np, sp, sklearn_text, sklearn_preprocessing, sklearn_pairwise, apscheduler_background, apscheduler_cron, pytz]
+
+def warm_up(features):
+    """Import the heavy modules of the given features now rather than on first use"""
+    for module in LAZY_MODULES:
+        if module._feature in features:
+            module._load()
+
 # --------------------------- FastAPI Setup ---------------------------
 
-app = FastAPI()
+# Routes are declared on routers and assembled by create_app() at the end of
+# this module; the routers of disabled features are not mounted.
+router = APIRouter()
+similarity_router = APIRouter()
+classification_router = APIRouter()
+notifications_router = APIRouter()
+FEATURE_ROUTERS = {
+    "similarity": similarity_router,
+    "classification": classification_router,
+    "notifications": notifications_router
+}
+
+# --------------------------- Metrics ----------------------------
+
+# Prometheus-style metrics kept in process memory and served at /metrics.
+# Recording is a dict lookup and a few additions under a lock, so it stays
+# on in production. Every worker keeps its own numbers; scrape each worker
+# (or run one worker per container) to see them all.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+class Metric:
+    """
+    A counter, gauge or histogram with a fixed set of label names
+    """
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @staticmethod
+    def _labels(pairs):
+        if not pairs:
+            return ""
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            pairs = list(zip(self.labelnames, key))
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{self._labels(pairs)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(pairs)} {total}")
+            lines.append(f"{self.name}_count{self._labels(pairs)} {count}")
+        return lines
+
+REQUEST_DURATION = Metric("histogram", "http_request_duration_seconds", "Request latency by route", ("route", "method", "status"), LATENCY_BUCKETS)
+OPERATION_DURATION = Metric("histogram", "grievance_operation_duration_seconds", "Latency of internal operations", ("operation",), LATENCY_BUCKETS)
+MONGO_OPERATIONS = Metric("counter", "mongo_operations_total", "MongoDB commands sent, by collection", ("collection", "command"))
+CLASSIFICATIONS = Metric("counter", "classification_total", "Petition classifications by how the department was found", ("outcome",))
+SIMILARITY_CANDIDATES = Metric("histogram", "similarity_corpus_size", "Grievances compared per similarity check", (), SIZE_BUCKETS)
+SIMILARITY_INDEX_ROWS = Metric("gauge", "similarity_index_rows", "Grievances in the shared similarity index")
+COALESCING_CALLS = Metric("counter", "coalescing_calls_total", "Calls through request coalescing", ("name", "result"))
+METRICS = [
+    REQUEST_DURATION, OPERATION_DURATION, MONGO_OPERATIONS, CLASSIFICATIONS,
+    SIMILARITY_CANDIDATES, SIMILARITY_INDEX_ROWS, COALESCING_CALLS
+]
+
+@contextmanager
+def timed(operation):
+    """Record how long the block takes under grievance_operation_duration_seconds, in a span of the same name"""
+    start = time.perf_counter()
+    try:
+        with span(operation):
+            yield
+    finally:
+        OPERATION_DURATION.observe(time.perf_counter() - start, operation=operation)
+
+def timed_operation(operation):
+    """Decorator form of timed()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Count MongoDB commands per collection
+    
+    Passed to every client through event_listeners; the callbacks run on the
+    thread that issued the command, so they only do a counter increment.
+    """
+
+    IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo", "saslStart", "saslContinue"}
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        MONGO_OPERATIONS.inc(collection=target if isinstance(target, str) else "", command=event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+mongo_command_metrics = MongoCommandMetrics()
+
+# The ASGI scope of the request being served, for attributing work done on
+# its behalf (the route is only filled in once the router has matched it).
+# Copied into threadpool and motor executor threads with the rest of the context.
+current_request_scope = contextvars.ContextVar("current_request_scope", default=None)
+
+def current_route():
+    """Route template of the current request, or 'background' outside of one"""
+    scope = current_request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "unmatched")
+
+async def record_request_metrics(request: Request, call_next):
+    """Time every request by its route template (not the raw path, which would explode the label set)"""
+    start = time.perf_counter()
+    status = 500
+    token = current_request_scope.set(request.scope)
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            route=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=status
+        )
+        current_request_scope.reset(token)
+
+# --------------------------- Slow Query Log ----------------------------
+
+# Every MongoDB command slower than SLOW_QUERY_MS is recorded with its
+# collection, filter shape (values replaced by their type), duration,
+# documents returned and the route that issued it. The last
+# SLOW_QUERY_BUFFER entries are kept in memory; set SLOW_QUERY_COLLECTION to
+# also keep them in MongoDB (expired after SLOW_QUERY_TTL_DAYS).
+SLOW_QUERY_ENABLED = os.environ.get("SLOW_QUERY_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_BUFFER = int(os.environ.get("SLOW_QUERY_BUFFER", "500"))
+SLOW_QUERY_COLLECTION = os.environ.get("SLOW_QUERY_COLLECTION", "")
+SLOW_QUERY_TTL_DAYS = int(os.environ.get("SLOW_QUERY_TTL_DAYS", "7"))
+
+def query_shape(value):
+    """
+    The structure of a filter with every value replaced by its type name, so
+    {"phone": "98..."} and {"phone": "99..."} group together
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Operators like $in take lists of values; the distinct shapes are enough
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return type(value).__name__
+
+def command_filter(command_name, command):
+    """The filter (or pipeline) of a command, wherever that command keeps it"""
+    if command_name == "find":
+        return command.get("filter", {})
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query", {})
+    if command_name == "aggregate":
+        return command.get("pipeline", [])
+    if command_name == "update":
+        return [update.get("q", {}) for update in command.get("updates", [])]
+    if command_name == "delete":
+        return [delete.get("q", {}) for delete in command.get("deletes", [])]
+    return None
+
+def documents_returned(command_name, reply):
+    """Documents in a reply: the cursor batch for reads, n for counts and writes"""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if "n" in reply:
+        return reply["n"]
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    return None
+
+class SlowQueryLog(monitoring.CommandListener):
+    """
+    Record MongoDB commands that take longer than SLOW_QUERY_MS
+
+    started() keeps the parts of the command needed for the entry, keyed by
+    request and connection, and succeeded()/failed() decide whether it was
+    slow. Writes to SLOW_QUERY_COLLECTION go through a queue drained by one
+    background thread, so the command that was slow is not made slower.
+    """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_BUFFER):
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=size)
+        self._writer = None
+        self.dropped = 0
+
+    def started(self, event):
+        if not SLOW_QUERY_ENABLED or event.command_name in MongoCommandMetrics.IGNORED_COMMANDS:
+            return
+        command = event.command
+        target = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        if target == SLOW_QUERY_COLLECTION:
+            return
+        pending = {
+            "database": event.database_name,
+            "collection": target if isinstance(target, str) else "",
+            "command": event.command_name,
+            "filter_shape": query_shape(command_filter(event.command_name, command)),
+            "route": current_route(),
+            "trace_id": getattr(current_span.get(), "trace_id", None)
+        }
+        # Listeners are called from every thread that runs commands
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = pending
+
+    def succeeded(self, event):
+        self._finish(event, documents_returned(event.command_name, event.reply))
+
+    def failed(self, event):
+        self._finish(event, None, error=str(event.failure.get("errmsg", event.failure)))
+
+    def _finish(self, event, documents, error=None):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+        entry = dict(pending, duration_ms=round(duration_ms, 3), documents_returned=documents, recorded_at=datetime.now(timezone.utc))
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self.entries.append(entry)
+        logger.warning(
+            f"Slow query: {entry['command']} on {entry['collection']} took {entry['duration_ms']:.1f} ms "
+            f"({documents} documents) from {entry['route']}"
+        )
+        if SLOW_QUERY_COLLECTION:
+            self._persist(entry)
+
+    def _persist(self, entry):
+        try:
+            self._queue.put_nowait(dict(entry))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_entries, name="slow-query-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_entries(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                connect_to_db()[SLOW_QUERY_COLLECTION].insert_one(entry)
+            except Exception as e:
+                logger.error(f"Error saving slow query entry: {str(e)}")
+
+    def recent(self, limit=100, collection=None, route=None):
+        """Newest entries first, optionally only those for one collection or route"""
+        with self._lock:
+            entries = list(self.entries)
+        entries.reverse()
+        if collection:
+            entries = [entry for entry in entries if entry["collection"] == collection]
+        if route:
+            entries = [entry for entry in entries if entry["route"] == route]
+        return entries[:limit]
+
+slow_query_log = SlowQueryLog()
+
+def ensure_slow_query_indexes(db):
+    if SLOW_QUERY_COLLECTION:
+        db[SLOW_QUERY_COLLECTION].create_index("recorded_at", expireAfterSeconds=SLOW_QUERY_TTL_DAYS * 86400)
+
+def summarize_slow_queries(entries):
+    """Group entries by collection, command and filter shape, worst total time first"""
+    groups = {}
+    for entry in entries:
+        key = (entry["collection"], entry["command"], json.dumps(entry["filter_shape"], sort_keys=True))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "collection": entry["collection"],
+                "command": entry["command"],
+                "filter_shape": entry["filter_shape"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "routes": []
+            }
+        group["count"] += 1
+        group["total_ms"] = round(group["total_ms"] + entry["duration_ms"], 3)
+        group["max_ms"] = max(group["max_ms"], entry["duration_ms"])
+        if entry["route"] not in group["routes"]:
+            group["routes"].append(entry["route"])
+    return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
+
+# --------------------------- Tracing ----------------------------
+
+# OpenTelemetry-shaped spans: W3C trace context in and out (traceparent),
+# OTLP/JSON on export. TRACE_EXPORTER=file appends one OTLP export request
+# per line to TRACE_FILE (the collector's file exporter format);
+# TRACE_EXPORTER=otlp posts the same payload to TRACE_OTLP_ENDPOINT, e.g. an
+# OpenTelemetry Collector or Jaeger listening on 4318. Unset, span() is a
+# no-op and neither the middleware nor the Mongo listener is installed.
+# Only TRACE_SAMPLE_RATE of new traces are exported; incoming traceparent
+# headers keep the caller's sampling decision.
+TRACE_EXPORTERS = ("", "file", "otlp")
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "").lower()
+if TRACE_EXPORTER not in TRACE_EXPORTERS:
+    raise RuntimeError("TRACE_EXPORTER must be empty, file or otlp")
+TRACING_ENABLED = bool(TRACE_EXPORTER)
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "grievance-portal")
+TRACE_BATCH_SIZE = 512
+TRACE_QUEUE_SIZE = 8192
+TRACE_EXPORT_INTERVAL = 2.0
+
+SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, SPAN_KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed operation of a trace"""
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": self._value(value)} for key, value in self.attributes.items() if value is not None],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def parse_traceparent(header):
+    """(trace_id, parent span id, sampled) from a W3C traceparent header, or None"""
+    parts = (header or "").strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+def start_span(name, kind=SPAN_KIND_INTERNAL, attributes=None, parent=None, remote=None):
+    """
+    A span that is a child of parent (default: the current span), of a
+    remote (trace_id, span_id, sampled) context, or the root of a new trace
+    """
+    parent = parent or current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, parent.sampled, kind, attributes)
+    if remote is not None:
+        return Span(name, remote[0], remote[1], remote[2], kind, attributes)
+    return Span(name, os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE, kind, attributes)
+
+def finish_span(span, error=None):
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    if span.sampled:
+        span_exporter.export(span)
+
+@contextmanager
+def span(name, kind=SPAN_KIND_INTERNAL, attributes=None):
+    """
+    Run the block in a span that is the current span for everything it calls
+
+    Yields None when tracing is off.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    new_span = start_span(name, kind, attributes)
+    token = current_span.set(new_span)
+    error = None
+    try:
+        yield new_span
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        current_span.reset(token)
+        finish_span(new_span, error)
+
+def current_traceparent():
+    """traceparent header for outgoing calls, or None outside a trace"""
+    active = current_span.get()
+    return active.traceparent if active is not None else None
+
+class SpanExporter:
+    """
+    Batches finished spans on a background thread and writes them as OTLP/JSON
+
+    When the queue is full new spans are dropped (and counted) rather than
+    slowing requests down.
+    """
+
+    def __init__(self, exporter=TRACE_EXPORTER):
+        self.exporter = exporter
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                    self._thread.start()
+
+    def _drain(self, timeout):
+        spans = []
+        try:
+            spans.append(self._queue.get(timeout=timeout))
+            while len(spans) < TRACE_BATCH_SIZE:
+                spans.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return spans
+
+    def _run(self):
+        while True:
+            spans = self._drain(TRACE_EXPORT_INTERVAL)
+            if spans:
+                self._write(spans)
+
+    def flush(self):
+        """Write out every queued span (at shutdown)"""
+        while True:
+            spans = self._drain(0.01)
+            if not spans:
+                return
+            self._write(spans)
+
+    def payload(self, spans):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}}
+                ]},
+                "scopeSpans": [{"scope": {"name": "grievance-portal"}, "spans": [s.to_otlp() for s in spans]}]
+            }]
+        }
+
+    def _write(self, spans):
+        try:
+            if self.exporter == "file":
+                line = json.dumps(self.payload(spans)) + "\n"
+                with self._lock:
+                    with open(TRACE_FILE, "a") as f:
+                        f.write(line)
+            elif self.exporter == "otlp":
+                response = requests.post(TRACE_OTLP_ENDPOINT, json=self.payload(spans), timeout=5)
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Failed to export {len(spans)} spans: {str(e)}")
+
+span_exporter = SpanExporter()
+
+class MongoCommandTracing(monitoring.CommandListener):
+    """
+    A client span for every MongoDB command issued inside a trace
+
+    Commands outside a trace (e.g. index creation at startup) are not traced.
+    """
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        parent = current_span.get()
+        if parent is None or event.command_name in MongoCommandMetrics.IGNORED_COMMANDS:
+            return
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        self._spans[(event.request_id, event.connection_id)] = start_span(
+            f"mongodb.{event.command_name}",
+            SPAN_KIND_CLIENT,
+            {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": target if isinstance(target, str) else None,
+                "net.peer.name": event.connection_id[0] if isinstance(event.connection_id, tuple) else None
+            },
+            parent=parent
+        )
+
+    def succeeded(self, event):
+        mongo_span = self._spans.pop((event.request_id, event.connection_id), None)
+        if mongo_span is not None:
+            mongo_span.set_attribute("db.mongodb.documents", documents_returned(event.command_name, event.reply))
+            finish_span(mongo_span)
+
+    def failed(self, event):
+        mongo_span = self._spans.pop((event.request_id, event.connection_id), None)
+        if mongo_span is not None:
+            mongo_span.error = str(event.failure.get("errmsg", event.failure))
+            finish_span(mongo_span)
+
+mongo_command_tracing = MongoCommandTracing()
 
-# CORS Middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"]
-)
+async def trace_request(request: Request, call_next):
+    """Server span for the request, continuing the caller's trace if it sent a traceparent"""
+    server_span = start_span(
+        f"{request.method} {request.url.path}",
+        SPAN_KIND_SERVER,
+        {"http.method": request.method, "http.target": request.url.path},
+        remote=parse_traceparent(request.headers.get("traceparent"))
+    )
+    token = current_span.set(server_span)
+    status = 500
+    error = None
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["traceparent"] = server_span.traceparent
+        return response
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        current_span.reset(token)
+        route = request.scope.get("route")
+        if route is not None:
+            server_span.name = f"{request.method} {route.path}"
+            server_span.set_attribute("http.route", route.path)
+        server_span.set_attribute("http.status_code", status)
+        if status >= 500 and error is None:
+            server_span.error = f"HTTP {status}"
+        finish_span(server_span, error)
 
 # --------------------------- DB Connection ----------------------------
 
+# One client (and so one connection pool) per process for each driver. Sync
+# routes and the scheduler share the pymongo pool; async routes use motor on
+# the event loop. The threadpool (THREADPOOL_SIZE, AnyIO's default of 40)
+# only runs CPU-bound work and the remaining sync routes.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", "40"))
+_mongo_clients = {}
+_mongo_clients_lock = threading.Lock()
+
+def _mongo_client(kind, client_class):
+    client = _mongo_clients.get(kind)
+    if client is None:
+        with _mongo_clients_lock:
+            client = _mongo_clients.get(kind)
+            if client is None:
+                mongo_uri = os.environ.get("MONGODB_URI")
+                if not mongo_uri:
+                    raise RuntimeError("MONGODB_URI environment variable not set.")
+                client = client_class(
+                    mongo_uri,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    event_listeners=[mongo_command_metrics, slow_query_log] + ([mongo_command_tracing] if TRACING_ENABLED else [])
+                )
+                _mongo_clients[kind] = client
+    return client
+
 def connect_to_db():
-    mongo_uri = os.environ.get("MONGODB_URI")
-    if not mongo_uri:
-        raise RuntimeError("MONGODB_URI environment variable not set.")
-    client = MongoClient(mongo_uri)
-    return client.petition_db
+    return _mongo_client("sync", MongoClient).petition_db
+
+def connect_to_async_db():
+    """
+    The motor database for async routes; only call it from the event loop
+    """
+    return _mongo_client("async", AsyncIOMotorClient).petition_db
+
+def close_db_clients():
+    with _mongo_clients_lock:
+        for client in _mongo_clients.values():
+            client.close()
+        _mongo_clients.clear()
+
+def ensure_indexes():
+    """
+    Create all indexes the API relies on (idempotent)
+    """
+    db = connect_to_db()
+    PetitionRepository(db).ensure_indexes()
+    ensure_timeline_indexes(db)
+    ensure_counter_indexes(db)
+    ensure_cache_indexes(db)
+    ensure_cluster_indexes(db)
+    ensure_slow_query_indexes(db)
+
+def utc_to_local(value):
+    """
+    Convert a naive UTC datetime read from MongoDB to naive local time
+    """
+    return value.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def parse_date_param(value):
+    """
+    Parse an ISO date or datetime query parameter into an aware UTC datetime
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def encode_cursor(timestamp, object_id):
+    """
+    Encode a (timestamp, ObjectId) position as an opaque paging cursor
+    """
+    return f"{timestamp.isoformat()}_{object_id}"
+
+def decode_cursor(cursor):
+    """
+    Decode a paging cursor into a (timestamp, ObjectId) pair
+    
+    Raises ValueError if the cursor is malformed.
+    """
+    timestamp, _, object_id = cursor.rpartition('_')
+    if not ObjectId.is_valid(object_id):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return datetime.fromisoformat(timestamp), ObjectId(object_id)
+
+def after_cursor_query(field, cursor):
+    """
+    Filter for documents positioned after a cursor, ordered by (field, _id)
+    """
+    after_timestamp, after_id = decode_cursor(cursor)
+    return {'$or': [
+        {field: {'$gt': after_timestamp}},
+        {field: after_timestamp, '_id': {'$gt': after_id}}
+    ]}
+
+def created_range_query(created_from=None, created_to=None):
+    """
+    Build a created_at_utc range filter; created_to is exclusive
+    """
+    created_range = {}
+    if created_from:
+        created_range['$gte'] = parse_date_param(created_from)
+    if created_to:
+        created_range['$lt'] = parse_date_param(created_to)
+    return {'created_at_utc': created_range} if created_range else {}
 
 # --------------------------- Department Mapping ----------------------------
 
@@ -98,121 +954,1243 @@ department_tables = {
     "Special Programme Implementation": "petitions_special_programme_implementation"
 }
 
-# --------------------------- Basic Routes ----------------------------
+# --------------------------- Petition Repository ----------------------------
 
-@app.get("/")
-def index():
-    return {"message": "API up and running."}
+# Storage layout for petitions:
+#   per_department - one petitions_* collection per department (default)
+#   dual_write     - writes go to both layouts, reads still use per_department;
+#                    run `migrate_tracking_ids.py unify` to backfill, then switch
+#   unified        - a single collection keyed and indexed by department
+STORAGE_MODES = ("per_department", "dual_write", "unified")
+PETITION_STORAGE_MODE = os.environ.get("PETITION_STORAGE_MODE", "per_department")
+if PETITION_STORAGE_MODE not in STORAGE_MODES:
+    raise RuntimeError(f"PETITION_STORAGE_MODE must be one of {', '.join(STORAGE_MODES)}")
+UNIFIED_COLLECTION = "petitions"
 
-# --------------------------- Rule-Based Classifier ----------------------------
+# Closed grievances older than ARCHIVE_AFTER_DAYS are moved from the live
+# ("hot") collections into <collection>_archive; 0 disables the archiver
+ARCHIVE_SUFFIX = "_archive"
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+OPEN_STATUSES = ["pending", "in_progress"]
+CLOSED_STATUSES = ["resolved", "rejected"]
 
-def simple_rule_classifier(text):
-    text = text.lower()
-    if any(term in text for term in ["budget", "finance", "fund", "loan", "startup", "tax"]):
-        return "Finance Department"
-    if any(term in text for term in ["teacher", "student", "college", "university", "school", "library"]):
-        return "Education Department"
-    # Tamil Nadu Water Supply and Drainage Board specific terms
-    if any(term in text for term in [
-        "water supply", "drinking water", "water connection", "water pipeline", "drainage system", 
-        "sewage treatment", "water quality", "water board", "water tank", "water distribution", 
-        "water bill", "water meter", "water leakage", "sewage block", "drainage block", "sewage overflow"
-    ]):
-        return "Tamil Nadu Water Supply and Drainage Board"
-    if any(term in text for term in [
-        "bridge", "road", "pipeline", "building", "stormwater", "area", "street", "home",
-        "maintenance", "borewell", "repair", "infrastructure", "public toilet", "canals", "irrigation"
-    ]):
-        return "Public Works Department"
-    return "General"  # Fallback category
+class PetitionRepository:
+    """
+    Petition data access that hides which storage layout is active
+    
+    Every method takes a department name rather than a collection, so callers
+    never touch department_tables, the unified collection or the archive
+    collections directly.
+    """
 
-def classify_with_groq(petition_text):
-    api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
-        return "General"  # fallback if no API key
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    prompt = (
-        "You are a classifier that maps petitions to the correct Tamil Nadu government department. Based on the petition text below, return only the single most appropriate department name from this list. If unsure, pick the closest match from the list. Never return 'General', 'Unknown', or anything not in the list.\n\n"
-        "Adi Dravidar and Tribal Welfare Department\n"
-        "Agriculture and Farmers welfares Department\n"
-        "Animal Husbandry and Dairying and Fisheries and Fishermen Welfare Department\n"
-        "BC MBC and Minorities Welfare Department\n"
-        "Co-operation Food and Consumer Protection Department\n"
-        "Commercial Taxes and Registration Department\n"
-        "Energy Department\n"
-        "Environment Climate Change and Forests Department\n"
-        "Finance Department\n"
-        "Handlooms Handicrafts Textiles and Khadi Department\n"
-        "Health and Family Welfare Department\n"
-        "Higher Education Department\n"
-        "Highways and Minor Ports Department\n"
-        "Human Resources Management Department\n"
-        "Home Prohibition and Excise Department\n"
-        "Housing and Urban Development Department\n"
-        "Industries Department\n"
-        "Information Technology Department\n"
-        "Labour Welfare and Skill Development Department\n"
-        "Law Department\n"
-        "Legislative Assembly Department\n"
-        "Micro Small and Medium Enterprises Department\n"
-        "Municipal Administration and Water Supply Department\n"
-        "Public Elections Department\n"
-        "Public Department\n"
-        "Public Works Department\n"
-        "Revenue and Disaster Management Department\n"
-        "Rural Development and Panchayat Raj Department\n"
-        "School Education Department\n"
-        "Social Welfare and Women Empowerment Department\n"
-        "Tamil Dev. and Information Department\n"
-        "Tamil Nadu Water Supply and Drainage Board\n"
-        "Tourism Culture and Religious Endowments Department\n"
-        "Transport Department\n"
-        "Welfare of Differently Abled Persons\n"
-        "Youth Welfare and Sports Development Department\n"
-        "Water Resources Department\n"
-        "Planning Development Department\n"
-        "Special Programme Implementation\n\n"
-        f"Petition: '{petition_text}'\nDepartment:"
-    )
-    data = {
-        "model": "llama3-8b-8192",
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0,
-        "max_tokens": 50
-    }
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        result = response.json()
-        department = result["choices"][0]["message"]["content"].strip()
-        return department
-    except Exception:
-        return "General"  # fallback on error
+    def __init__(self, db, mode=None):
+        self.db = db
+        self.mode = mode or PETITION_STORAGE_MODE
 
-# --------------------------- Auth: Register ----------------------------
+    @property
+    def unified(self):
+        """True when reads are served from the unified collection"""
+        return self.mode == "unified"
 
-@app.post("/register")
-def register_account(
-    full_name: str = Form(...),
+    def _read_collection(self, department):
+        if self.unified:
+            return self.db[UNIFIED_COLLECTION]
+        return self.db[department_tables[department]]
+
+    def _write_collections(self, department):
+        if self.mode == "dual_write":
+            return [self.db[department_tables[department]], self.db[UNIFIED_COLLECTION]]
+        return [self._read_collection(department)]
+
+    def _archive_of(self, collection):
+        return self.db[collection.name + ARCHIVE_SUFFIX]
+
+    def _all_collections(self, include_archive=False):
+        # (collection, department) pairs; department is None for the unified layout
+        if self.unified:
+            pairs = [(self.db[UNIFIED_COLLECTION], None)]
+        else:
+            pairs = [(self.db[table_name], department) for department, table_name in department_tables.items()]
+        if include_archive:
+            pairs += [(self._archive_of(collection), department) for collection, department in pairs]
+        return pairs
+
+    @staticmethod
+    def _with_department(projection):
+        # Inclusion projections must still return the department in unified mode
+        if projection and all(projection.values()):
+            return dict(projection, department=1)
+        return projection
+
+    @staticmethod
+    def _filter(collection, department, query=None):
+        # Unified collections hold every department, so scope queries to one
+        query = dict(query or {})
+        if collection.name in (UNIFIED_COLLECTION, UNIFIED_COLLECTION + ARCHIVE_SUFFIX):
+            query["department"] = department
+        return query
+
+    def find(self, department, query=None, projection=None):
+        """Find petitions of one department"""
+        collection = self._read_collection(department)
+        return collection.find(self._filter(collection, department, query), projection)
+
+    def find_one(self, department, query, projection=None, include_archive=False):
+        """Find a single petition of one department, optionally falling back to the archive"""
+        collection = self._read_collection(department)
+        scoped = self._filter(collection, department, query)
+        petition = collection.find_one(scoped, projection)
+        if petition is None and include_archive:
+            petition = self._archive_of(collection).find_one(scoped, projection)
+        return petition
+
+    def count(self, department, query=None):
+        """Count petitions of one department"""
+        collection = self._read_collection(department)
+        return collection.count_documents(self._filter(collection, department, query))
+
+    def aggregate(self, department, pipeline, include_archive=False):
+        """
+        Run an aggregation over one department, scoping its leading $match
+        
+        With include_archive the pipeline also runs over the archive and the
+        results of both are chained; merging grouped rows is up to the caller.
+        """
+        collection = self._read_collection(department)
+        pipeline = self._scoped_pipeline(collection, department, pipeline)
+        if include_archive:
+            return itertools.chain(collection.aggregate(pipeline), self._archive_of(collection).aggregate(pipeline))
+        return collection.aggregate(pipeline)
+
+    def _scoped_pipeline(self, collection, department, pipeline):
+        pipeline = list(pipeline)
+        if pipeline and "$match" in pipeline[0]:
+            pipeline[0] = {"$match": self._filter(collection, department, pipeline[0]["$match"])}
+        elif self.unified:
+            pipeline.insert(0, {"$match": {"department": department}})
+        return pipeline
+
+    def insert_one(self, department, document):
+        """Insert a petition, stamping its department"""
+        document["department"] = department
+        collections = self._write_collections(department)
+        result = collections[0].insert_one(document)
+        response_cache.invalidate(f"department:{department}")
+        for mirror in collections[1:]:
+            try:
+                mirror.insert_one(dict(document))
+            except Exception as e:
+                logger.warning(f"Dual-write insert failed for {document.get('tracking_id')}: {str(e)}")
+        return result
+
+    def update_one(self, department, query, update):
+        """Update a single petition; the result reflects the collection reads use"""
+        collections = self._write_collections(department)
+        result = collections[0].update_one(self._filter(collections[0], department, query), update)
+        if result.matched_count:
+            response_cache.invalidate(f"department:{department}")
+        for mirror in collections[1:]:
+            try:
+                mirror.update_one(self._filter(mirror, department, query), update)
+            except Exception as e:
+                logger.warning(f"Dual-write update failed for {department}: {str(e)}")
+        return result
+
+    def bulk_update(self, department, operations):
+        """
+        Apply (query, update) pairs with one unordered bulk_write per collection
+        
+        Returns the BulkWriteResult of the collection reads use. A BulkWriteError
+        from that collection is re-raised after the mirrors are written, so the
+        caller can map its writeErrors back to the operations by index.
+        """
+        collections = self._write_collections(department)
+        primary = collections[0]
+        error = None
+        result = None
+        try:
+            result = primary.bulk_write(
+                [UpdateOne(self._filter(primary, department, query), update) for query, update in operations],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            error = e
+        response_cache.invalidate(f"department:{department}")
+        for mirror in collections[1:]:
+            try:
+                mirror.bulk_write(
+                    [UpdateOne(self._filter(mirror, department, query), update) for query, update in operations],
+                    ordered=False
+                )
+            except Exception as e:
+                logger.warning(f"Dual-write bulk update failed for {department}: {str(e)}")
+        if error:
+            raise error
+        return result
+
+    def find_any(self, query, projection=None, include_archive=False):
+        """
+        Find petitions across all departments
+        
+        Yields (petition, department) pairs. In unified mode this is a single
+        indexed query instead of one query per department collection.
+        """
+        for collection, department in self._all_collections(include_archive):
+            for petition in collection.find(query, self._with_department(projection) if department is None else projection):
+                yield petition, department or petition.get("department")
+
+    def find_one_any(self, query, projection=None, include_archive=False):
+        """Find the first petition matching query in any department, as (petition, department)"""
+        for collection, department in self._all_collections(include_archive):
+            petition = collection.find_one(query, self._with_department(projection) if department is None else projection)
+            if petition:
+                return petition, department or petition.get("department")
+        return None, None
+
+    def tracking_id_exists(self, tracking_id):
+        """Check whether a tracking ID is already used by any department, archived or not"""
+        petition, _ = self.find_one_any({"tracking_id": tracking_id}, {"_id": 1}, include_archive=True)
+        return petition is not None
+
+    @staticmethod
+    def _closed_query(cutoff):
+        # Legacy petitions were never stamped with last_updated; their creation time stands in
+        return {
+            "status": {"$in": CLOSED_STATUSES},
+            "$or": [
+                {"last_updated": {"$lt": cutoff}},
+                {"last_updated": {"$exists": False}, "created_at_utc": {"$lt": cutoff}}
+            ]
+        }
+
+    def archive_closed(self, department, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+        """
+        Move one batch of closed petitions last updated (or, without last_updated,
+        created) before cutoff into the archive
+        
+        Returns the number of petitions moved; call repeatedly until it returns 0.
+        """
+        closed_query = self._closed_query(cutoff)
+        collections = self._write_collections(department)
+        primary = collections[0]
+        ids = [
+            doc["_id"]
+            for doc in primary.find(self._filter(primary, department, closed_query), {"_id": 1}).limit(batch_size)
+        ]
+        if not ids:
+            return 0
+
+        moved = 0
+        archived_at = datetime.now()
+        for collection in collections:
+            archive = self._archive_of(collection)
+            documents = list(collection.find({"_id": {"$in": ids}}))
+            if not documents:
+                continue
+            # Copy first, then delete only what is still closed, so a grievance
+            # reopened mid-batch stays live and its archive copy is dropped
+            archive.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, dict(doc, archived_at=archived_at), upsert=True) for doc in documents],
+                ordered=False
+            )
+            result = collection.delete_many(dict(closed_query, _id={"$in": ids}))
+            kept = [doc["_id"] for doc in collection.find({"_id": {"$in": ids}}, {"_id": 1})]
+            if kept:
+                archive.delete_many({"_id": {"$in": kept}})
+            if collection is primary:
+                moved = result.deleted_count
+        response_cache.invalidate(f"department:{department}")
+        return moved
+
+    def restore_from_archive(self, department, query):
+        """Move an archived petition back into the live collection; returns True if one was restored"""
+        restored = False
+        for collection in self._write_collections(department):
+            archive = self._archive_of(collection)
+            petition = archive.find_one(self._filter(archive, department, query))
+            if not petition:
+                continue
+            petition.pop("archived_at", None)
+            collection.replace_one({"_id": petition["_id"]}, petition, upsert=True)
+            archive.delete_one({"_id": petition["_id"]})
+            restored = True
+        if restored:
+            response_cache.invalidate(f"department:{department}")
+        return restored
+
+    def ensure_indexes(self):
+        """Create the indexes for every layout that is written to (idempotent)"""
+        if self.mode in ("per_department", "dual_write"):
+            for table_name in department_tables.values():
+                collection = self.db[table_name]
+                collection.create_index([('tracking_id', 1)], name='tracking_id')
+                collection.create_index([('phone', 1)], name='phone')
+                collection.create_index([('created_at_utc', 1)], name='created_at_utc')
+                collection.create_index([('status', 1), ('created_at_utc', 1)], name='status_created_at_utc')
+                collection.create_index([('status', 1), ('last_updated', 1)], name='status_last_updated')
+                collection.create_index([('last_updated', 1), ('_id', 1)], name='last_updated_id')
+                collection.create_index([('cluster_id', 1)], name='cluster_id', sparse=True)
+                archive = self._archive_of(collection)
+                archive.create_index([('tracking_id', 1)], name='tracking_id')
+                archive.create_index([('phone', 1)], name='phone')
+        if self.mode in ("dual_write", "unified"):
+            # department leads every compound index, so {department: 1, tracking_id: 1}
+            # can double as the shard key if the collection is ever sharded
+            collection = self.db[UNIFIED_COLLECTION]
+            collection.create_index([('department', 1), ('tracking_id', 1)], name='department_tracking_id')
+            collection.create_index([('tracking_id', 1)], name='tracking_id')
+            collection.create_index([('phone', 1)], name='phone')
+            collection.create_index([('department', 1), ('created_at_utc', 1)], name='department_created_at_utc')
+            collection.create_index(
+                [('department', 1), ('status', 1), ('created_at_utc', 1)],
+                name='department_status_created_at_utc'
+            )
+            collection.create_index(
+                [('department', 1), ('status', 1), ('last_updated', 1)],
+                name='department_status_last_updated'
+            )
+            collection.create_index(
+                [('department', 1), ('last_updated', 1), ('_id', 1)],
+                name='department_last_updated_id'
+            )
+            collection.create_index([('status', 1), ('last_reminded_at', 1)], name='status_last_reminded_at')
+            collection.create_index([('department', 1), ('cluster_id', 1)], name='department_cluster_id', sparse=True)
+            archive = self._archive_of(collection)
+            archive.create_index([('department', 1), ('tracking_id', 1)], name='department_tracking_id')
+            archive.create_index([('tracking_id', 1)], name='tracking_id')
+            archive.create_index([('phone', 1)], name='phone')
+
+# --------------------------- Async Data Access ----------------------------
+
+# Async routes read and write petitions, users and notifications on motor, so
+# they never block the event loop. These routes are async:
+#   /register, /login, /submit_to_department, /update_grievance_status,
+#   /admin/petitions/bulk_status, /track_grievance, /grievance/timeline,
+#   /grievance/events, /admin/petitions (and its changes, by_priority, aging
+#   and volume views), /admin/clusters, /admin/reminders,
+#   /admin/reminder_stats, /admin/send_individual_reminder,
+#   /admin/notifications and /admin/test_notifications.
+# Their CPU-bound steps (similarity search and indexing, bcrypt) run in the
+# threadpool. These routes stay sync and run in the threadpool:
+#   /admin/send_reminders, /admin/archive_closed, /admin/stats/reconcile - the
+#     batch sweeps the scheduler runs from its own thread, on pymongo
+#   /admin/stats - reads the dashboard counters, not petitions
+#   /classify, /grievance/similar and the similarity, memory, profiling and
+#     metrics admin routes - CPU-bound or in-process only
+
+class AsyncPetitionRepository:
+    """
+    PetitionRepository on motor, for async routes
+    
+    Layout and scoping come from a PetitionRepository on the same database,
+    which is only used to pick collections and build queries; every method
+    that does I/O is a coroutine here. find() returns a motor cursor, so
+    callers await cursor.to_list(...). Index creation stays on the sync
+    repository, it only runs at startup.
+    """
+
+    def __init__(self, db, mode=None):
+        self.db = db
+        self.layout = PetitionRepository(db, mode)
+
+    @property
+    def unified(self):
+        return self.layout.unified
+
+    def find(self, department, query=None, projection=None):
+        """Find petitions of one department"""
+        collection = self.layout._read_collection(department)
+        return collection.find(self.layout._filter(collection, department, query), projection)
+
+    async def find_one(self, department, query, projection=None, include_archive=False):
+        """Find a single petition of one department, optionally falling back to the archive"""
+        collection = self.layout._read_collection(department)
+        scoped = self.layout._filter(collection, department, query)
+        petition = await collection.find_one(scoped, projection)
+        if petition is None and include_archive:
+            petition = await self.layout._archive_of(collection).find_one(scoped, projection)
+        return petition
+
+    async def aggregate(self, department, pipeline, include_archive=False):
+        """
+        Run an aggregation over one department and return its rows as a list
+        
+        With include_archive the rows of the archive follow the live ones.
+        """
+        collection = self.layout._read_collection(department)
+        pipeline = self.layout._scoped_pipeline(collection, department, pipeline)
+        rows = await collection.aggregate(pipeline).to_list(length=None)
+        if include_archive:
+            rows += await self.layout._archive_of(collection).aggregate(pipeline).to_list(length=None)
+        return rows
+
+    async def insert_one(self, department, document):
+        """Insert a petition, stamping its department"""
+        document["department"] = department
+        collections = self.layout._write_collections(department)
+        result = await collections[0].insert_one(document)
+        await invalidate_cache_async(f"department:{department}")
+        for mirror in collections[1:]:
+            try:
+                await mirror.insert_one(dict(document))
+            except Exception as e:
+                logger.warning(f"Dual-write insert failed for {document.get('tracking_id')}: {str(e)}")
+        return result
+
+    async def update_one(self, department, query, update):
+        """Update a single petition; the result reflects the collection reads use"""
+        collections = self.layout._write_collections(department)
+        result = await collections[0].update_one(self.layout._filter(collections[0], department, query), update)
+        if result.matched_count:
+            await invalidate_cache_async(f"department:{department}")
+        for mirror in collections[1:]:
+            try:
+                await mirror.update_one(self.layout._filter(mirror, department, query), update)
+            except Exception as e:
+                logger.warning(f"Dual-write update failed for {department}: {str(e)}")
+        return result
+
+    async def bulk_update(self, department, operations):
+        """Apply (query, update) pairs with one unordered bulk_write per collection, as PetitionRepository.bulk_update"""
+        collections = self.layout._write_collections(department)
+        primary = collections[0]
+        error = None
+        result = None
+        try:
+            result = await primary.bulk_write(
+                [UpdateOne(self.layout._filter(primary, department, query), update) for query, update in operations],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            error = e
+        await invalidate_cache_async(f"department:{department}")
+        for mirror in collections[1:]:
+            try:
+                await mirror.bulk_write(
+                    [UpdateOne(self.layout._filter(mirror, department, query), update) for query, update in operations],
+                    ordered=False
+                )
+            except Exception as e:
+                logger.warning(f"Dual-write bulk update failed for {department}: {str(e)}")
+        if error:
+            raise error
+        return result
+
+    async def find_any(self, query, projection=None, include_archive=False):
+        """Find petitions across all departments, yielding (petition, department) pairs"""
+        for collection, department in self.layout._all_collections(include_archive):
+            projected = self.layout._with_department(projection) if department is None else projection
+            async for petition in collection.find(query, projected):
+                yield petition, department or petition.get("department")
+
+    async def find_one_any(self, query, projection=None, include_archive=False):
+        """Find the first petition matching query in any department, as (petition, department)"""
+        for collection, department in self.layout._all_collections(include_archive):
+            projected = self.layout._with_department(projection) if department is None else projection
+            petition = await collection.find_one(query, projected)
+            if petition:
+                return petition, department or petition.get("department")
+        return None, None
+
+    async def tracking_id_exists(self, tracking_id):
+        """Check whether a tracking ID is already used by any department, archived or not"""
+        petition, _ = await self.find_one_any({"tracking_id": tracking_id}, {"_id": 1}, include_archive=True)
+        return petition is not None
+
+    async def restore_from_archive(self, department, query):
+        """Move an archived petition back into the live collection; returns True if one was restored"""
+        restored = False
+        for collection in self.layout._write_collections(department):
+            archive = self.layout._archive_of(collection)
+            petition = await archive.find_one(self.layout._filter(archive, department, query))
+            if not petition:
+                continue
+            petition.pop("archived_at", None)
+            await collection.replace_one({"_id": petition["_id"]}, petition, upsert=True)
+            await archive.delete_one({"_id": petition["_id"]})
+            restored = True
+        if restored:
+            await invalidate_cache_async(f"department:{department}")
+        return restored
+
+async def invalidate_cache_async(*scopes):
+    """response_cache.invalidate without blocking the event loop when versions live in MongoDB"""
+    if RESPONSE_CACHE_SHARED:
+        await run_in_threadpool(response_cache.invalidate, *scopes)
+    else:
+        response_cache.invalidate(*scopes)
+
+# --------------------------- JSON Responses ----------------------------
+
+# Listings are encoded straight from the MongoDB documents: ObjectId and
+# datetime values are handled by the encoder, so routes no longer convert
+# them field by field and FastAPI's jsonable_encoder walk is skipped by
+# returning a json_response(). orjson is used when installed.
+#
+# The models below are the contract of those payloads. They document the
+# routes in OpenAPI and, with RESPONSE_VALIDATION=true (for development and
+# CI), every payload is checked against them before it is sent; a mismatch
+# is logged, the payload is still sent as it is.
+RESPONSE_VALIDATION = os.environ.get("RESPONSE_VALIDATION", "false").lower() == "true"
+
+def bson_default(value):
+    """Encode the BSON and Python types the JSON encoders don't know"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "dtype") and hasattr(value, "item"):
+        return value.item()  # numpy scalars, e.g. similarity scores
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_json(content):
+    """Serialize content (MongoDB documents included) to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, default=bson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=bson_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+class BSONJSONResponse(JSONResponse):
+    """JSONResponse rendered with encode_json"""
+
+    def render(self, content):
+        return encode_json(content)
+
+_response_adapters = {}
+
+def validate_response(content, model):
+    """Check content against a response model (only with RESPONSE_VALIDATION)"""
+    if not RESPONSE_VALIDATION or model is None:
+        return
+    adapter = _response_adapters.get(model)
+    if adapter is None:
+        adapter = _response_adapters[model] = TypeAdapter(model)
+    try:
+        adapter.validate_python(content)
+    except ValidationError as e:
+        logger.warning(f"Response does not match {model.__name__ if isinstance(model, type) else model}: {e}")
+
+def json_response(content, model=None, **kwargs):
+    """
+    Respond with content encoded by encode_json, bypassing jsonable_encoder
+    
+    Args:
+        content: The payload, MongoDB documents may be included as they are
+        model: Response model the payload should match
+    """
+    validate_response(content, model)
+    return BSONJSONResponse(content=content, **kwargs)
+
+def documented(model):
+    """Route keyword arguments documenting a json_response() payload in OpenAPI"""
+    return {"responses": {200: {"model": model}}}
+
+# Accepts an ObjectId as read from MongoDB; serialized as its hex string
+ObjectIdStr = Annotated[str, BeforeValidator(lambda value: str(value) if isinstance(value, ObjectId) else value)]
+
+class MongoDocument(BaseModel):
+    """A document as stored; fields added later or by migrations pass through"""
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    id: ObjectIdStr = Field(alias="_id")
+
+class PetitionOut(MongoDocument):
+    tracking_id: Optional[str] = None
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    petition_type: Optional[str] = None
+    petition_subject: Optional[str] = None
+    petition_description: Optional[str] = None
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    department: Optional[str] = None
+    created_at: Optional[str] = None
+    created_at_utc: Optional[datetime] = None
+    last_status: Optional[str] = None
+    last_activity_at: Optional[datetime] = None
+    timeline_count: Optional[int] = None
+    last_updated: Optional[datetime] = None
+    last_reminded_at: Optional[datetime] = None
+    similarity_detected: Optional[bool] = None
+    related_to: Optional[List[str]] = None
+    cluster_id: Optional[str] = None
+    cluster_member: Optional[bool] = None
+    cluster_size: Optional[int] = None
+    cluster_members: Optional[List[str]] = None
+    age_days: Optional[int] = None
+
+class PetitionChanges(BaseModel):
+    changes: List[PetitionOut]
+    next_token: str
+    has_more: bool
+    full: bool
+
+class TimelineEntryOut(MongoDocument):
+    id: Optional[ObjectIdStr] = Field(default=None, alias="_id")  # embedded legacy entries have none
+    timestamp: datetime
+    date: Optional[str] = None
+    time: Optional[str] = None
+    status: str
+    comment: Optional[str] = None
+    update_type: Optional[str] = None
+
+class TimelinePage(BaseModel):
+    success: bool
+    timeline: List[TimelineEntryOut]
+    next_cursor: Optional[str] = None
+
+class ReminderOut(MongoDocument):
+    grievance_id: ObjectIdStr  # the petition's _id when it had no tracking ID
+    department: Optional[str] = None
+    officer_id: Optional[str] = None
+    sent_at: datetime
+    reason: Optional[str] = None
+    petition_subject: Optional[str] = None
+    days_pending: Optional[int] = None
+
+class ReminderCandidate(MongoDocument):
+    tracking_id: str
+    subject: str
+    department: str
+    created_at: str
+    last_reminder: Optional[datetime] = None
+
+class ReminderList(BaseModel):
+    success: bool
+    data: Union[List[ReminderOut], List[ReminderCandidate]]
+
+class NotificationOut(MongoDocument):
+    grievance_id: Optional[str] = None
+    recipient_name: Optional[str] = None
+    recipient_phone: Optional[str] = None
+    notification_type: Optional[str] = None
+    old_status: Optional[str] = None
+    new_status: Optional[str] = None
+    sent_at: datetime
+    sms_content: Optional[str] = None
+    email_content: Optional[str] = None
+
+class NotificationLog(BaseModel):
+    success: bool
+    notifications: List[NotificationOut]
+
+# --------------------------- Response Cache ----------------------------
+
+# Admin listings are cached as serialized JSON in a per-worker LRU. Entries
+# are keyed by scope versions ("department:<name>", "reminders",
+# "notifications"); a write bumps the version of the scopes it touches, so
+# stale entries are never served. With RESPONSE_CACHE_SHARED=true versions
+# and bodies are also kept in MongoDB, so every worker sees every
+# invalidation and can reuse bodies rendered by other workers.
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_SHARED = os.environ.get("RESPONSE_CACHE_SHARED", "false").lower() == "true"
+CACHE_VERSIONS_COLLECTION = "cache_versions"
+CACHE_ENTRIES_COLLECTION = "response_cache"
+SHARED_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+class ResponseCache:
+    """
+    Versioned LRU of rendered JSON responses with an optional shared MongoDB tier
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, shared=RESPONSE_CACHE_SHARED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def versions(self, scopes):
+        """Current version of each scope, as a tuple in the order given"""
+        if self.shared:
+            rows = connect_to_db()[CACHE_VERSIONS_COLLECTION].find({'_id': {'$in': list(scopes)}})
+            found = {row['_id']: row.get('version', 0) for row in rows}
+            return tuple(found.get(scope, 0) for scope in scopes)
+        with self._lock:
+            return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+    def invalidate(self, *scopes):
+        """Bump the version of each scope so cached responses under it are no longer used"""
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+        if self.shared:
+            try:
+                versions = connect_to_db()[CACHE_VERSIONS_COLLECTION]
+                for scope in scopes:
+                    versions.update_one({'_id': scope}, {'$inc': {'version': 1}}, upsert=True)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate shared cache for {scopes}: {str(e)}")
+
+    def get(self, key):
+        """Return (body, etag) for key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] > now:
+                self._entries.move_to_end(key)
+                return entry[0], entry[1]
+            if entry:
+                del self._entries[key]
+        if self.shared:
+            row = connect_to_db()[CACHE_ENTRIES_COLLECTION].find_one({'_id': key})
+            if row and row['expires_at'] > datetime.now(timezone.utc).replace(tzinfo=None):
+                self._store_local(key, bytes(row['body']), row['etag'])
+                return bytes(row['body']), row['etag']
+        return None
+
+    def set(self, key, body, etag):
+        self._store_local(key, body, etag)
+        if self.shared and len(body) <= SHARED_CACHE_MAX_BYTES:
+            try:
+                expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+                connect_to_db()[CACHE_ENTRIES_COLLECTION].replace_one(
+                    {'_id': key},
+                    {'_id': key, 'body': body, 'etag': etag, 'expires_at': expires_at},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Failed to store shared cache entry: {str(e)}")
+
+    def _store_local(self, key, body, etag):
+        with self._lock:
+            self._entries[key] = (body, etag, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def memory_stats(self):
+        """Entries held by this worker and the bytes of their bodies"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "body_bytes": sum(len(entry[0]) for entry in self._entries.values()),
+                "scopes": len(self._versions)
+            }
+
+response_cache = ResponseCache()
+
+def ensure_cache_indexes(db):
+    """
+    Expire shared cache entries with a TTL index
+    """
+    if RESPONSE_CACHE_SHARED:
+        db[CACHE_ENTRIES_COLLECTION].create_index('expires_at', expireAfterSeconds=0, name='expires_at_ttl')
+
+async def cached_json_response(request, scopes, params, compute, model=None):
+    """
+    Serve compute() as JSON through the response cache, honouring If-None-Match
+    
+    The shared tier is pymongo, so with RESPONSE_CACHE_SHARED its reads and
+    writes run in the threadpool.
+    
+    Args:
+        request: The incoming request (for If-None-Match)
+        scopes: Cache scopes the response depends on
+        params: Query parameters that select the response
+        compute: Coroutine function producing the response content on a miss
+        model: Response model the content should match
+    """
+    async def shared_tier(fn, *args):
+        if RESPONSE_CACHE_SHARED:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    key = response_cache_key(request, scopes, await shared_tier(response_cache.versions, scopes), params)
+
+    async def render():
+        content = await compute()
+        validate_response(content, model)
+        body = encode_json(content)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        await shared_tier(response_cache.set, key, body, etag)
+        return body, etag
+
+    cached = await shared_tier(response_cache.get, key)
+    if cached:
+        body, etag = cached
+    else:
+        # Concurrent misses for the same key share one render
+        body, etag = await singleflight.do_async("response_cache", key, render)
+    return conditional_json_response(request, body, etag)
+
+def response_cache_key(request, scopes, versions, params):
+    key_source = json.dumps([request.url.path, scopes, versions, sorted(params.items())], default=str)
+    return hashlib.sha1(key_source.encode()).hexdigest()
+
+def conditional_json_response(request, body, etag):
+    """The cached body, or 304 when If-None-Match already has its ETag"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# --------------------------- Request Coalescing ----------------------------
+
+# Identical requests that arrive while the first one is still being computed
+# wait for its result instead of recomputing it (singleflight). Only the
+# in-flight computation is shared; nothing is kept once it finishes.
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one computation
+    
+    Works from both threads (sync routes run in the threadpool) and the event
+    loop: callers share a concurrent.futures.Future, which async callers
+    await through asyncio.wrap_future.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def _join(self, name, key):
+        # Returns (future, key, True) for the caller that has to compute the result
+        key = f"{name}:{key}"
+        with self._lock:
+            counts = self._stats.setdefault(name, {"calls": 0, "coalesced": 0})
+            counts["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+            else:
+                counts["coalesced"] += 1
+        COALESCING_CALLS.inc(name=name, result="computed" if leader else "coalesced")
+        return future, key, leader
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if isinstance(error, Exception):
+            future.set_exception(error)
+        elif error is not None:
+            # The leader was cancelled or interrupted; the callers waiting on it run fn themselves
+            future.cancel()
+        else:
+            future.set_result(result)
+
+    def do(self, name, key, fn, *args, **kwargs):
+        """Run fn, or wait for the identical call already running"""
+        if not SINGLEFLIGHT_ENABLED:
+            return fn(*args, **kwargs)
+        future, flight, leader = self._join(name, key)
+        if not leader:
+            try:
+                return future.result()
+            except concurrent.futures.CancelledError:
+                return self.do(name, key, fn, *args, **kwargs)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(flight, future, error=e)
+            raise
+        self._finish(flight, future, result)
+        return result
+
+    async def do_async(self, name, key, fn, *args, **kwargs):
+        """Async variant of do; fn may be a coroutine function or a plain function"""
+        if not SINGLEFLIGHT_ENABLED:
+            result = fn(*args, **kwargs)
+            return await result if inspect.isawaitable(result) else result
+        future, flight, leader = self._join(name, key)
+        if not leader:
+            try:
+                # Shielded so that a cancelled follower does not cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            return await self.do_async(name, key, fn, *args, **kwargs)
+        try:
+            result = fn(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+        except BaseException as e:
+            self._finish(flight, future, error=e)
+            raise
+        self._finish(flight, future, result)
+        return result
+
+    def stats(self):
+        """Calls, coalesced calls and hit rate per name"""
+        with self._lock:
+            return {
+                name: dict(
+                    counts,
+                    in_flight=sum(1 for key in self._calls if key.startswith(f"{name}:")),
+                    hit_rate=counts["coalesced"] / counts["calls"] if counts["calls"] else 0.0
+                )
+                for name, counts in self._stats.items()
+            }
+
+singleflight = SingleFlight()
+
+def _normalize_argument(value):
+    # Whitespace differences (e.g. a double-clicked form) must not split a flight
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, (list, tuple)):
+        return [_normalize_argument(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize_argument(v) for k, v in value.items()}
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return None  # Request, BackgroundTasks and the like never take part in the key
+
+def coalescing_key(args, kwargs):
+    normalized = [[_normalize_argument(v) for v in args], sorted((k, _normalize_argument(v)) for k, v in kwargs.items())]
+    return hashlib.sha1(json.dumps(normalized, default=str).encode()).hexdigest()
+
+def coalesce(name):
+    """
+    Decorator that coalesces concurrent calls with the same arguments
+    
+    Place it below the route decorator; the wrapped signature is kept so
+    FastAPI still sees the original parameters.
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                return await singleflight.do_async(name, coalescing_key(args, kwargs), fn, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return singleflight.do(name, coalescing_key(args, kwargs), fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def resolve_department(category):
+    """
+    Match a category against the known departments, ignoring case
+    
+    Returns the canonical department name, or None if it is unknown.
+    """
+    category_clean = category.strip()
+    if category_clean in department_tables:
+        return category_clean
+    for key in department_tables:
+        if key.lower() == category_clean.lower():
+            return key
+    return None
+
+# --------------------------- Request Profiling ----------------------------
+
+# Profile single requests in production. The hook only exists when
+# PROFILING_TOKEN is set: otherwise neither the middleware nor the endpoint
+# wrappers are installed and requests pay nothing. With it set, a request
+# carrying "X-Profile: <token>" is profiled, as is a PROFILING_SAMPLE_RATE
+# fraction of all requests. A sampler thread records the stacks of the
+# thread running the endpoint every PROFILING_INTERVAL_MS; the result is
+# saved under PROFILE_DIR in the collapsed-stack format read by
+# flamegraph.pl, speedscope and inferno, and its id is returned in the
+# X-Profile-Id response header.
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.environ.get("PROFILING_INTERVAL_MS", "2"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILING_KEEP = int(os.environ.get("PROFILING_KEEP", "50"))
+
+active_profile = contextvars.ContextVar("active_profile", default=None)
+recent_profiles = deque(maxlen=PROFILING_KEEP)
+
+class RequestProfile:
+    """
+    Statistical profile of one request
+
+    Only threads registered through running() are sampled, so other requests
+    served by the threadpool at the same time stay out of the profile. Async
+    endpoints run on the event loop thread, whose samples can include other
+    requests' coroutines while this one is awaiting.
+    """
+
+    def __init__(self, interval_ms=PROFILING_INTERVAL_MS):
+        self.id = uuid.uuid4().hex
+        self.interval = interval_ms / 1000
+        self.samples = {}
+        self._threads = set()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.id[:8]}", daemon=True)
+
+    @contextmanager
+    def running(self):
+        ident = threading.get_ident()
+        self._threads.add(ident)
+        try:
+            yield
+        finally:
+            self._threads.discard(ident)
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self._threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = self._collapse(frame)
+                    self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+def profile_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.collapsed")
+
+def save_profile(profile, metadata):
+    """Write the profile to PROFILE_DIR, removing the oldest once PROFILING_KEEP are kept"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(profile_path(profile.id), "w") as f:
+        f.write(profile.collapsed())
+    if len(recent_profiles) == recent_profiles.maxlen:
+        oldest = recent_profiles[0]
+        try:
+            os.remove(profile_path(oldest["id"]))
+        except OSError:
+            pass
+    recent_profiles.append(metadata)
+
+def profiling_authorized(request: Request):
+    """Whether the request carries the profiling token"""
+    supplied = request.headers.get("X-Profile", "")
+    return bool(PROFILING_TOKEN) and hmac.compare_digest(supplied.encode(), PROFILING_TOKEN.encode())
+
+def profiled(fn):
+    """Register the thread running an endpoint with the request's profile, if it has one"""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            profile = active_profile.get()
+            if profile is None:
+                return await fn(*args, **kwargs)
+            with profile.running():
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = active_profile.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        with profile.running():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def install_profiling_hooks(app):
+    """
+    Wrap every endpoint of the app with profiled(); called at startup once the routes are mounted
+
+    FastAPI calls dependant.call for the endpoint, and whether it is awaited
+    was decided when the route was added, so the wrapper keeps the same kind.
+    """
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and dependant.call is not None and not getattr(dependant.call, "_profiled", False):
+            dependant.call = profiled(dependant.call)
+            dependant.call._profiled = True
+
+async def profile_request(request: Request, call_next):
+    """Profile the request if it asks for it (with the token) or is sampled"""
+    if request.url.path.startswith("/admin/profiles"):
+        return await call_next(request)
+    requested = "X-Profile" in request.headers
+    if requested and not profiling_authorized(request):
+        return JSONResponse(status_code=403, content={"success": False, "message": "Invalid profiling token"})
+    if not requested and not (PROFILING_SAMPLE_RATE and random.random() < PROFILING_SAMPLE_RATE):
+        return await call_next(request)
+
+    profile = RequestProfile()
+    token = active_profile.set(profile)
+    start = time.perf_counter()
+    profile.start()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        profile.stop()
+        active_profile.reset(token)
+        route = request.scope.get("route")
+        metadata = {
+            "id": profile.id,
+            "method": request.method,
+            "path": request.url.path,
+            "route": getattr(route, "path", "unmatched"),
+            "status": status,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            "samples": sum(profile.samples.values()),
+            "sampled": not requested,
+            "created_at": datetime.now().isoformat()
+        }
+        try:
+            await run_in_threadpool(save_profile, profile, metadata)
+        except Exception as e:
+            logger.error(f"Error saving profile {profile.id}: {str(e)}")
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+# --------------------------- Basic Routes ----------------------------
+
+@router.get("/")
+def index():
+    return {"message": "API up and running."}
+
+# --------------------------- Rule-Based Classifier ----------------------------
+
+def simple_rule_classifier(text):
+    text = text.lower()
+    if any(term in text for term in ["budget", "finance", "fund", "loan", "startup", "tax"]):
+        return "Finance Department"
+    if any(term in text for term in ["teacher", "student", "college", "university", "school", "library"]):
+        return "Education Department"
+    # Tamil Nadu Water Supply and Drainage Board specific terms
+    if any(term in text for term in [
+        "water supply", "drinking water", "water connection", "water pipeline", "drainage system", 
+        "sewage treatment", "water quality", "water board", "water tank", "water distribution", 
+        "water bill", "water meter", "water leakage", "sewage block", "drainage block", "sewage overflow"
+    ]):
+        return "Tamil Nadu Water Supply and Drainage Board"
+    if any(term in text for term in [
+        "bridge", "road", "pipeline", "building", "stormwater", "area", "street", "home",
+        "maintenance", "borewell", "repair", "infrastructure", "public toilet", "canals", "irrigation"
+    ]):
+        return "Public Works Department"
+    return "General"  # Fallback category
+
+@timed_operation("classify_with_groq")
+def classify_with_groq(petition_text):
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        CLASSIFICATIONS.inc(outcome="groq_no_api_key")
+        return "General"  # fallback if no API key
+    url = os.environ.get("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    prompt = (
+        "You are a classifier that maps petitions to the correct Tamil Nadu government department. Based on the petition text below, return only the single most appropriate department name from this list. If unsure, pick the closest match from the list. Never return 'General', 'Unknown', or anything not in the list.\n\n"
+        "Adi Dravidar and Tribal Welfare Department\n"
+        "Agriculture and Farmers welfares Department\n"
+        "Animal Husbandry and Dairying and Fisheries and Fishermen Welfare Department\n"
+        "BC MBC and Minorities Welfare Department\n"
+        "Co-operation Food and Consumer Protection Department\n"
+        "Commercial Taxes and Registration Department\n"
+        "Energy Department\n"
+        "Environment Climate Change and Forests Department\n"
+        "Finance Department\n"
+        "Handlooms Handicrafts Textiles and Khadi Department\n"
+        "Health and Family Welfare Department\n"
+        "Higher Education Department\n"
+        "Highways and Minor Ports Department\n"
+        "Human Resources Management Department\n"
+        "Home Prohibition and Excise Department\n"
+        "Housing and Urban Development Department\n"
+        "Industries Department\n"
+        "Information Technology Department\n"
+        "Labour Welfare and Skill Development Department\n"
+        "Law Department\n"
+        "Legislative Assembly Department\n"
+        "Micro Small and Medium Enterprises Department\n"
+        "Municipal Administration and Water Supply Department\n"
+        "Public Elections Department\n"
+        "Public Department\n"
+        "Public Works Department\n"
+        "Revenue and Disaster Management Department\n"
+        "Rural Development and Panchayat Raj Department\n"
+        "School Education Department\n"
+        "Social Welfare and Women Empowerment Department\n"
+        "Tamil Dev. and Information Department\n"
+        "Tamil Nadu Water Supply and Drainage Board\n"
+        "Tourism Culture and Religious Endowments Department\n"
+        "Transport Department\n"
+        "Welfare of Differently Abled Persons\n"
+        "Youth Welfare and Sports Development Department\n"
+        "Water Resources Department\n"
+        "Planning Development Department\n"
+        "Special Programme Implementation\n\n"
+        f"Petition: '{petition_text}'\nDepartment:"
+    )
+    data = {
+        "model": "llama3-8b-8192",
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0,
+        "max_tokens": 50
+    }
+    try:
+        with span("groq.chat.completions", SPAN_KIND_CLIENT, {"http.method": "POST", "http.url": url, "llm.model": data["model"]}) as llm_span:
+            traceparent = current_traceparent()
+            if traceparent:
+                headers["traceparent"] = traceparent
+            response = requests.post(url, headers=headers, json=data, timeout=10)
+            if llm_span is not None:
+                llm_span.set_attribute("http.status_code", response.status_code)
+            response.raise_for_status()
+            result = response.json()
+        department = result["choices"][0]["message"]["content"].strip()
+        return department
+    except Exception:
+        CLASSIFICATIONS.inc(outcome="groq_error")
+        return "General"  # fallback on error
+
+# --------------------------- Auth: Register ----------------------------
+
+@router.post("/register")
+async def register_account(
+    full_name: str = Form(...),
     new_user: str = Form(...),
     new_pass: str = Form(...)
 ):
-    db = connect_to_db()
+    db = connect_to_async_db()
     users_collection = db["users"]  # Access the 'users' collection
 
     # Check if the username already exists
-    if users_collection.find_one({"username": new_user}):
+    if await users_collection.find_one({"username": new_user}):
         return {"error": "Username is already taken"}
 
-    # Hash the password and insert the new user
-    hashed_password = bcrypt.hashpw(new_pass.encode(), bcrypt.gensalt()).decode()
-    users_collection.insert_one({
+    # Hash the password and insert the new user (bcrypt is slow on purpose, keep it off the event loop)
+    hashed = await run_in_threadpool(bcrypt.hashpw, new_pass.encode(), bcrypt.gensalt())
+    hashed_password = hashed.decode()
+    await users_collection.insert_one({
         "name": full_name,
         "username": new_user,
         "password": hashed_password
@@ -222,8 +2200,8 @@ def register_account(
 
 # --------------------------- Auth: Login ----------------------------
 
-@app.post("/login")
-def login_user(user_id: str = Form(...), passcode: str = Form(...)):
+@router.post("/login")
+async def login_user(user_id: str = Form(...), passcode: str = Form(...)):
     predefined_admins = {
         "pwd": {"password": "123", "dashboard": "officer_dashboard.html", "department": "Public Works Department"},
         "fin": {"password": "123", "dashboard": "officer_dashboard.html", "department": "Finance Department"},
@@ -277,11 +2255,11 @@ def login_user(user_id: str = Form(...), passcode: str = Form(...)):
         }
 
     # User login
-    db = connect_to_db()
+    db = connect_to_async_db()
     users_collection = db["users"]  # Access the 'users' collection
-    user = users_collection.find_one({"username": user_id})  # Query the user by username
+    user = await users_collection.find_one({"username": user_id})  # Query the user by username
 
-    if user and bcrypt.checkpw(passcode.encode(), user["password"].encode()):
+    if user and await run_in_threadpool(bcrypt.checkpw, passcode.encode(), user["password"].encode()):
         return {
             "message": "User login successful",
             "role": "user",
@@ -292,12 +2270,19 @@ def login_user(user_id: str = Form(...), passcode: str = Form(...)):
 
 # --------------------------- Classify Petition ----------------------------
 
-@app.post("/classify")
+@classification_router.post("/classify")
+@coalesce("classify")
 def predict_category(petition_text: str = Form(...)):
     department_raw = classify_with_groq(petition_text)
     print(f"[DEBUG] Groq raw output: {department_raw}")
 
+    with span("match_department"):
+        return match_department(petition_text, department_raw)
+
+def match_department(petition_text, department_raw):
+    """Map the LLM's answer onto a known department, falling back to the rule-based classifier"""
     if not department_raw:
+        CLASSIFICATIONS.inc(outcome="unknown")
         return {"category": "Unknown"}
 
     department_clean = department_raw.strip().lower()
@@ -305,11 +2290,13 @@ def predict_category(petition_text: str = Form(...)):
     # Try exact match
     for dept in department_tables:
         if dept.lower() == department_clean:
+            CLASSIFICATIONS.inc(outcome="exact")
             return {"category": dept}
 
     # Try partial match (e.g., if LLM returns 'School Education Department' but you store 'Education Department')
     for dept in department_tables:
         if dept.lower() in department_clean or department_clean in dept.lower():
+            CLASSIFICATIONS.inc(outcome="partial")
             return {"category": dept}
 
     # Fuzzy match
@@ -318,19 +2305,22 @@ def predict_category(petition_text: str = Form(...)):
     if match:
         for dept in department_tables:
             if dept.lower() == match[0]:
+                CLASSIFICATIONS.inc(outcome="fuzzy")
                 return {"category": dept}
 
     # Fallback: Rule-based classification
     guessed = simple_rule_classifier(petition_text)
     if guessed in department_tables:
+        CLASSIFICATIONS.inc(outcome="rule_based")
         return {"category": guessed}
 
+    CLASSIFICATIONS.inc(outcome="unknown")
     return {"category": "Unknown"}
 
 # --------------------------- Submit Petition ----------------------------
 
-@app.post("/submit_to_department")
-def save_petition(
+@router.post("/submit_to_department")
+async def save_petition(
     name: str = Form(...),
     phone: str = Form(...),
     address: str = Form(...),
@@ -367,27 +2357,21 @@ def save_petition(
     """
     try:
         # Normalize category for lookup
-        category_clean = category.strip()
-        table = department_tables.get(category_clean)
-        if not table:
-            # Try case-insensitive match
-            for key in department_tables:
-                if key.lower() == category_clean.lower():
-                    table = department_tables[key]
-                    category_clean = key
-                    break
-        if not table:
+        with span("resolve_department"):
+            category_clean = resolve_department(category)
+        if not category_clean:
             return {"error": f"Invalid or undefined category: {category}"}
         
-        db = connect_to_db()
-        petitions_collection = db[table]
+        db = connect_to_async_db()
+        petitions = AsyncPetitionRepository(db)
         
         # Detect priority level based on subject and description
         combined_text = f"{petition_subject} {petition_description}"
-        priority_level = detect_priority(combined_text)
+        with span("detect_priority"):
+            priority_level = detect_priority(combined_text)
         
-        # Check for similar grievances
-        similar_grievances = find_similar_grievances(combined_text, category_clean)
+        # Check for similar grievances (CPU-bound, so in the threadpool)
+        similar_grievances = await run_in_threadpool(find_similar_grievances, combined_text, category_clean)
         
         # Generate a unique tracking ID
         tracking_id = generate_tracking_id()
@@ -395,30 +2379,17 @@ def save_petition(
         # Ensure the tracking ID is unique across all departments
         is_unique = False
         attempts = 0
-        while not is_unique and attempts < 10:
-            # Check if this tracking ID already exists in any department
-            exists = False
-            for dept_table in department_tables.values():
-                dept_collection = db[dept_table]
-                if dept_collection.find_one({"tracking_id": tracking_id}):
-                    exists = True
-                    break
-            
-            if not exists:
-                is_unique = True
-            else:
-                tracking_id = generate_tracking_id()
-                attempts += 1
+        with timed("tracking_id_uniqueness"):
+            while not is_unique and attempts < 10:
+                # Check if this tracking ID already exists in any department
+                if not await petitions.tracking_id_exists(tracking_id):
+                    is_unique = True
+                else:
+                    tracking_id = generate_tracking_id()
+                    attempts += 1
         
         # Initialize timeline with submission entry
-        initial_timeline = [{
-            'timestamp': datetime.now(),
-            'date': datetime.now().strftime("%d-%b-%Y"),
-            'time': datetime.now().strftime("%H:%M:%S"),
-            'status': 'pending',
-            'comment': 'Grievance submitted successfully',
-            'update_type': 'submission'
-        }]
+        initial_entry = build_timeline_entry('pending', 'Grievance submitted successfully', 'submission')
         
         # Prepare petition data
         petition_data = {
@@ -432,8 +2403,11 @@ def save_petition(
             "status": "pending",
             "priority": priority_level,
             "created_at": datetime.now().strftime("%d-%b-%Y"),
+            "created_at_utc": datetime.now(timezone.utc),
             "department": category_clean,
-            "timeline": initial_timeline,
+            "last_status": initial_entry['status'],
+            "last_activity_at": initial_entry['timestamp'],
+            "timeline_count": 1,
             "last_updated": datetime.now()
         }
         
@@ -441,11 +2415,25 @@ def save_petition(
         if similar_grievances:
             petition_data["related_to"] = [g['grievance_id'] for g in similar_grievances]
             petition_data["similarity_detected"] = True
+            # Clusters stay within a department; cross-department matches are only linked
+            same_department = [g for g in similar_grievances if g.get('department') == category_clean]
+            try:
+                if same_department:
+                    petition_data["cluster_id"] = await assign_to_cluster(db, petitions, category_clean, tracking_id, same_department)
+                    petition_data["cluster_member"] = True
+            except Exception as e:
+                logger.warning(f"Failed to assign {tracking_id} to a duplicate cluster: {str(e)}")
         else:
             petition_data["similarity_detected"] = False
         
-        # Insert the petition
-        petitions_collection.insert_one(petition_data)
+        # Insert the petition and its first timeline event
+        with span("insert_petition", attributes={"grievance.department": category_clean, "grievance.tracking_id": tracking_id}):
+            await petitions.insert_one(category_clean, petition_data)
+            await record_timeline_event(db, tracking_id, category_clean, initial_entry)
+            await record_new_petition_counter(db, petition_data)
+        await publish_grievance_event('petition_created', petition_data, initial_entry)
+        with span("similarity_index_add"):
+            await run_in_threadpool(similarity_index.add, petition_data, category_clean)
         
         # Prepare response
         response_data = {
@@ -461,6 +2449,8 @@ def save_petition(
         if similar_grievances:
             response_data["similar_grievances"] = similar_grievances
             response_data["similarity_message"] = f"Found {len(similar_grievances)} similar grievance(s). Your issue may be related to existing cases."
+            if petition_data.get("cluster_id"):
+                response_data["cluster_id"] = petition_data["cluster_id"]
         
         return response_data
         
@@ -471,79 +2461,225 @@ def save_petition(
 
 # --------------------------- Admin View Petitions ----------------------------
 
-@app.get("/admin/petitions")
-def list_petitions(department: str):
-    table = department_tables.get(department)
-    if not table:
+@router.get("/admin/petitions", **documented(List[PetitionOut]))
+async def list_petitions(
+    request: Request,
+    department: str,
+    created_from: str = None,
+    created_to: str = None,
+    sort: str = None,
+    collapse_clusters: bool = False
+):
+    """
+    List petitions for a department
+    
+    Responses are cached until the department is written to and carry an
+    ETag, so unchanged listings answer If-None-Match with 304.
+    
+    Args:
+        department: Department name
+        created_from: Optional ISO date, only petitions created on or after it
+        created_to: Optional ISO date, only petitions created before it
+        sort: Optional "oldest" or "newest" ordering by creation time
+        collapse_clusters: Show each duplicate cluster as its canonical grievance only
+    """
+    if department not in department_tables:
         return {"error": "Invalid department requested"}
 
-    db = connect_to_db()
-    petitions_collection = db[table]  # Access the collection for the department
-    result = list(petitions_collection.find())  # Retrieve all documents from the collection
+    try:
+        query = created_range_query(created_from, created_to)
+    except ValueError:
+        return {"error": "Invalid date range requested"}
+
+    if collapse_clusters:
+        query = dict(query or {}, **COLLAPSED_CLUSTERS_QUERY)
+
+    async def compute():
+        db = connect_to_async_db()
+        petitions = AsyncPetitionRepository(db)
+        cursor = petitions.find(department, query, {"timeline": 0})  # Retrieve documents without legacy timelines
+        if sort in ("oldest", "newest"):
+            cursor = cursor.sort("created_at_utc", 1 if sort == "oldest" else -1)
+        result = await cursor.to_list(length=None)
+        await backfill_tracking_ids(petitions, department, result)
+        if collapse_clusters:
+            await attach_cluster_sizes(db, result)
+        return result
+
+    params = {
+        "department": department,
+        "created_from": created_from,
+        "created_to": created_to,
+        "sort": sort,
+        "collapse_clusters": collapse_clusters
+    }
+    return await cached_json_response(request, [f"department:{department}"], params, compute, List[PetitionOut])
 
-    # Convert MongoDB documents to JSON-serializable format and add tracking IDs where missing
+async def backfill_tracking_ids(petitions, department, result):
+    """Give petitions of a listing that predate tracking IDs one, and store it"""
     for petition in result:
-        petition["_id"] = str(petition["_id"])
-        
-        # If petition doesn't have a tracking_id (for old records), generate one
         if not petition.get("tracking_id"):
             tracking_id = generate_tracking_id()
-            # Update the record in the database
-            petitions_collection.update_one(
-                {"_id": petition["_id"]}, 
-                {"$set": {"tracking_id": tracking_id}}
+            await petitions.update_one(
+                department,
+                {"_id": petition["_id"]},
+                {"$set": {"tracking_id": tracking_id, "last_updated": datetime.now()}}
             )
             petition["tracking_id"] = tracking_id
 
-    return result
+# Changes newer than this are held back until the next poll, so writes that
+# commit slightly out of last_updated order are never skipped by a token
+CHANGES_SETTLE_SECONDS = float(os.environ.get("CHANGES_SETTLE_SECONDS", "2"))
+CHANGES_PAGE_SIZE = 500
+
+@router.get("/admin/petitions/changes", **documented(PetitionChanges))
+async def list_petition_changes(department: str, since: str = None, limit: int = CHANGES_PAGE_SIZE):
+    """
+    Delta sync for officer dashboards
+    
+    Without since, returns every petition of the department plus a token.
+    With since, returns only petitions inserted or modified after the token,
+    ordered by last_updated, plus the token to pass on the next call. When
+    has_more is true the caller should fetch again straight away.
+    """
+    if department not in department_tables:
+        return {"error": "Invalid department requested"}
+
+    petitions = AsyncPetitionRepository(connect_to_async_db())
+    settled = datetime.now() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    settled_token = encode_cursor(settled, ObjectId("0" * 24))
+    limit = max(1, min(limit, CHANGES_PAGE_SIZE))
+
+    if not since:
+        # Full snapshot; changes after the settle point are sent again with the next delta
+        result = await petitions.find(department, {}, {"timeline": 0}).to_list(length=None)
+        return json_response(
+            {"changes": result, "next_token": settled_token, "has_more": False, "full": True}, PetitionChanges
+        )
+
+    try:
+        query = {"$and": [after_cursor_query("last_updated", since), {"last_updated": {"$lt": settled}}]}
+    except ValueError:
+        return {"error": "Invalid since token"}
+
+    # Fetch one extra petition to know whether another page exists
+    result = await (
+        petitions.find(department, query, {"timeline": 0})
+        .sort([("last_updated", 1), ("_id", 1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    has_more = len(result) > limit
+    result = result[:limit]
+
+    if has_more:
+        next_token = encode_cursor(result[-1]["last_updated"], result[-1]["_id"])
+    else:
+        next_token = settled_token
 
-@app.get("/admin/petitions/by_priority")
-def list_petitions_by_priority(department: str, priority: str = None):
+    return json_response(
+        {"changes": result, "next_token": next_token, "has_more": has_more, "full": False}, PetitionChanges
+    )
+
+@router.get("/admin/petitions/by_priority", **documented(List[PetitionOut]))
+async def list_petitions_by_priority(department: str, priority: str = None, collapse_clusters: bool = False):
     """
     List petitions for a department, optionally filtered by priority level
     
     Args:
         department: Department name
         priority: Optional priority filter ("High", "Medium", "Low")
+        collapse_clusters: Show each duplicate cluster as its canonical grievance only
         
     Returns:
         List of petitions matching the criteria
     """
-    table = department_tables.get(department)
-    if not table:
+    if department not in department_tables:
         return {"error": "Invalid department requested"}
 
-    db = connect_to_db()
-    petitions_collection = db[table]
+    db = connect_to_async_db()
+    petitions = AsyncPetitionRepository(db)
     
     # Build query filter
     query = {}
     if priority:
         query["priority"] = priority
+    if collapse_clusters:
+        query.update(COLLAPSED_CLUSTERS_QUERY)
     
     # Execute the query
-    result = list(petitions_collection.find(query))
+    result = await petitions.find(department, query, {"timeline": 0}).to_list(length=None)
+    await backfill_tracking_ids(petitions, department, result)
+    if collapse_clusters:
+        await attach_cluster_sizes(db, result)
+    return json_response(result, List[PetitionOut])
+
+@router.get("/admin/petitions/aging", **documented(List[PetitionOut]))
+@coalesce("aging")
+async def list_aging_petitions(department: str, limit: int = 50):
+    """
+    List the oldest open petitions for a department, oldest first
     
-    # Convert MongoDB documents to JSON-serializable format and add tracking IDs where missing
+    Served by the (status, created_at_utc) index without an in-memory sort.
+    """
+    if department not in department_tables:
+        return {"error": "Invalid department requested"}
+
+    petitions = AsyncPetitionRepository(connect_to_async_db())
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    limit = max(1, min(limit, 500))
+    result = await (
+        petitions
+        .find(department, {"status": {"$in": ["pending", "in_progress"]}, "created_at_utc": {"$exists": True}}, {"timeline": 0})
+        .sort("created_at_utc", 1)
+        .limit(limit)
+        .to_list(length=limit)
+    )
+
     for petition in result:
-        petition["_id"] = str(petition["_id"])
-        
-        # If petition doesn't have a tracking_id (for old records), generate one
-        if not petition.get("tracking_id"):
-            tracking_id = generate_tracking_id()
-            # Update the record in the database
-            petitions_collection.update_one(
-                {"_id": petition["_id"]}, 
-                {"$set": {"tracking_id": tracking_id}}
-            )
-            petition["tracking_id"] = tracking_id
+        petition["age_days"] = (now - petition["created_at_utc"]).days
+
+    return json_response(result, List[PetitionOut])
+
+@router.get("/admin/petitions/volume")
+@coalesce("volume")
+async def petition_volume(department: str, bucket: str = "day", created_from: str = None, created_to: str = None):
+    """
+    Count petitions created per day, week or month (UTC)
+    
+    The range filter and projection only touch created_at_utc, so the
+    aggregation is covered by the created_at_utc index.
+    """
+    if department not in department_tables:
+        return {"error": "Invalid department requested"}
 
-    return result
+    bucket_formats = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+    if bucket not in bucket_formats:
+        return {"error": "Invalid bucket, expected day, week or month"}
+
+    try:
+        query = created_range_query(created_from, created_to) or {"created_at_utc": {"$exists": True}}
+    except ValueError:
+        return {"error": "Invalid date range requested"}
+
+    petitions = AsyncPetitionRepository(connect_to_async_db())
+    pipeline = [
+        {"$match": query},
+        {"$project": {"_id": 0, "created_at_utc": 1}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": bucket_formats[bucket], "date": "$created_at_utc"}},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+    buckets = [{"bucket": row["_id"], "count": row["count"]} for row in await petitions.aggregate(department, pipeline)]
+
+    return {"department": department, "bucket": bucket, "data": buckets}
 
 # --------------------------- Track Grievance ----------------------------
 
-@app.post("/track_grievance")
-def track_grievance(grievance_id: str = Form(...), phone: str = Form(...)):
+@router.post("/track_grievance")
+async def track_grievance(grievance_id: str = Form(...), phone: str = Form(...)):
     """
     Track a grievance using the new tracking system
     
@@ -551,7 +2687,7 @@ def track_grievance(grievance_id: str = Form(...), phone: str = Form(...)):
     Phone number is used for additional verification
     """
     try:
-        db = connect_to_db()
+        petitions = AsyncPetitionRepository(connect_to_async_db())
         
         # Validate inputs
         if not grievance_id or grievance_id.strip() == "":
@@ -566,38 +2702,29 @@ def track_grievance(grievance_id: str = Form(...), phone: str = Form(...)):
         
         print(f"[DEBUG] Tracking grievance with ID: {grievance_id} and phone: {phone}")
         
-        # Search across all department tables for the tracking ID
-        found_petition = None
-        found_department = None
+        # Search across all departments for the tracking ID
+        with timed("track_grievance_lookup"):
+            found_petition, found_department = await petitions.find_one_any(
+                {"tracking_id": grievance_id}, {"timeline": 0}, include_archive=True
+            )
         
-        for department, table_name in department_tables.items():
-            collection = db[table_name]
-            
-            # Search by tracking_id
-            petition = collection.find_one({"tracking_id": grievance_id})
-            
-            if petition:
-                # Verify phone number matches for security
-                if petition.get("phone") == phone:
-                    found_petition = petition
-                    found_department = department
-                    print(f"[DEBUG] Found grievance {grievance_id} in {department}")
-                    break
-                else:
-                    print(f"[DEBUG] Found grievance {grievance_id} but phone number doesn't match")
-                    return {
-                        "found": False, 
-                        "message": "The phone number doesn't match the one used to file this grievance. Please check your phone number."
-                    }
+        if found_petition:
+            # Verify phone number matches for security
+            if found_petition.get("phone") == phone:
+                print(f"[DEBUG] Found grievance {grievance_id} in {found_department}")
+            else:
+                print(f"[DEBUG] Found grievance {grievance_id} but phone number doesn't match")
+                return {
+                    "found": False, 
+                    "message": "The phone number doesn't match the one used to file this grievance. Please check your phone number."
+                }
         
         if not found_petition:
             print(f"[DEBUG] No grievance found with tracking ID: {grievance_id}")
             # Check if there are any grievances for this phone number
             user_grievances = []
-            for department, table_name in department_tables.items():
-                collection = db[table_name]
-                petitions = list(collection.find({"phone": phone}))
-                for pet in petitions:
+            with timed("track_grievance_phone_lookup"):
+                async for pet, department in petitions.find_any({"phone": phone}, {"tracking_id": 1}, include_archive=True):
                     if pet.get("tracking_id"):
                         user_grievances.append(f"{pet['tracking_id']} ({department})")
             
@@ -667,8 +2794,9 @@ def track_grievance(grievance_id: str = Form(...), phone: str = Form(...)):
         print(f"[ERROR] Exception in track_grievance: {str(ex)}")
         return {"error": f"An error occurred while tracking your grievance: {str(ex)}"}
 
-@app.post("/update_grievance_status")
-def update_grievance_status(
+@router.post("/update_grievance_status")
+async def update_grievance_status(
+    background_tasks: BackgroundTasks,
     grievance_id: str = Form(...), 
     status: str = Form(...), 
     department: str = Form(...),
@@ -676,24 +2804,31 @@ def update_grievance_status(
 ):
     """
     Update the status of a grievance with timeline tracking and notifications
+    
+    Closing the canonical grievance of a duplicate cluster also closes its
+    open members; their notifications are sent in the background.
     """
     try:
-        db = connect_to_db()
+        db = connect_to_async_db()
         
         # Validate status
         valid_statuses = ["pending", "resolved", "rejected", "in_progress"]
         if status.lower() not in valid_statuses:
             return {"success": False, "message": "Invalid status value"}
             
-        # Get the department table name
-        table_name = department_tables.get(department)
-        if not table_name:
+        # Validate the department
+        if department not in department_tables:
             return {"success": False, "message": "Invalid department"}
             
-        collection = db[table_name]
+        petitions = AsyncPetitionRepository(db)
         
         # Find the petition using the tracking_id
-        petition = collection.find_one({"tracking_id": grievance_id})
+        with span("load_petition", attributes={"grievance.department": department, "grievance.tracking_id": grievance_id}):
+            petition = await petitions.find_one(department, {"tracking_id": grievance_id}, {"timeline": 0})
+            
+            # Archived grievances are moved back to the live collection when reopened or updated
+            if not petition and await petitions.restore_from_archive(department, {"tracking_id": grievance_id}):
+                petition = await petitions.find_one(department, {"tracking_id": grievance_id}, {"timeline": 0})
         
         if not petition:
             return {"success": False, "message": "Grievance not found with the provided tracking ID"}
@@ -703,34 +2838,40 @@ def update_grievance_status(
         new_status = status.lower()
         
         # Create timeline entry
-        timeline_entry = {
-            'timestamp': datetime.now(),
-            'date': datetime.now().strftime("%d-%b-%Y"),
-            'time': datetime.now().strftime("%H:%M:%S"),
-            'status': new_status,
-            'comment': comment if comment else f"Status updated to {new_status}",
-            'update_type': 'status_update'
-        }
-        
-        # Update the status and add timeline entry
-        update_result = collection.update_one(
-            {"tracking_id": grievance_id},
-            {
-                "$set": {
-                    "status": new_status,
-                    "last_updated": datetime.now()
-                },
-                "$push": {"timeline": timeline_entry}
-            }
+        timeline_entry = build_timeline_entry(
+            new_status,
+            comment if comment else f"Status updated to {new_status}",
+            'status_update'
         )
         
-        if update_result.modified_count == 0:
-            return {"success": False, "message": "Failed to update status"}
+        # Update the status and the timeline summary
+        update = timeline_summary_update(timeline_entry)
+        update["$set"]["status"] = new_status
+        with span("update_status", attributes={"grievance.old_status": old_status, "grievance.new_status": new_status}):
+            update_result = await petitions.update_one(department, {"tracking_id": grievance_id}, update)
+            
+            if update_result.modified_count == 0:
+                return {"success": False, "message": "Failed to update status"}
+            
+            await record_timeline_event(db, grievance_id, department, timeline_entry)
+            await record_status_change_counters(db, petition, old_status, new_status)
+        await run_in_threadpool(similarity_index.set_status, [grievance_id], new_status)
+        await publish_grievance_event('status_updated', dict(petition, department=department), timeline_entry)
+        
+        if petition.get('cluster_id') == grievance_id:
+            try:
+                with span("propagate_cluster_status"):
+                    member_notifications = await propagate_cluster_status(db, petitions, department, [grievance_id], new_status, timeline_entry)
+                if member_notifications:
+                    background_tasks.add_task(send_notifications_batch, member_notifications)
+            except Exception as e:
+                logger.warning(f"Failed to propagate status of cluster {grievance_id}: {str(e)}")
         
         # Send notification to petitioner if status changed
         if old_status != new_status:
             try:
-                send_notification_to_petitioner(petition, old_status, new_status)
+                with span("notify_petitioner"):
+                    await send_notification_to_petitioner(petition, old_status, new_status)
             except Exception as e:
                 logger.warning(f"Failed to send notification for {grievance_id}: {str(e)}")
                 # Don't fail the status update if notification fails
@@ -753,6 +2894,170 @@ def update_grievance_status(
     except Exception as ex:
         return {"success": False, "message": f"An error occurred: {str(ex)}"}
 
+BULK_STATUS_MAX_ITEMS = int(os.environ.get("BULK_STATUS_MAX_ITEMS", "1000"))
+
+async def apply_status_to_petitions(db, petitions, department, members, status, timeline_entry, propagate=True):
+    """
+    Move petitions of one department to status with a single bulk_write
+    
+    Timeline events and counters are written in one batch each. When a
+    cluster's canonical grievance is closed, its open members follow in one
+    more batch (see propagate_cluster_status).
+    
+    Returns (results by tracking_id, notifications to send) where each
+    notification is a (petition, old_status, new_status) tuple.
+    """
+    update = timeline_summary_update(timeline_entry)
+    update["$set"]["status"] = status
+
+    failed = {}
+    try:
+        await petitions.bulk_update(department, [({"tracking_id": p["tracking_id"]}, update) for p in members])
+    except BulkWriteError as e:
+        failed = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+
+    results = {}
+    notifications = []
+    updated = []
+    for index, petition in enumerate(members):
+        if index in failed:
+            results[petition["tracking_id"]] = {"success": False, "message": failed[index]}
+        else:
+            updated.append(dict(petition, department=department))
+    if not updated:
+        return results, notifications
+
+    await record_timeline_events(db, department, [p["tracking_id"] for p in updated], timeline_entry)
+    await run_in_threadpool(similarity_index.set_status, [p["tracking_id"] for p in updated], status)
+    counter_operations = []
+    for petition in updated:
+        old_status = petition.get("status", "unknown")
+        counter_operations += counter_status_change_operations(petition, old_status, status)
+        if old_status != status:
+            notifications.append((petition, old_status, status))
+        await publish_grievance_event('status_updated', petition, timeline_entry)
+        results[petition["tracking_id"]] = {"success": True, "old_status": old_status, "department": department}
+    if counter_operations:
+        try:
+            await db[COUNTERS_COLLECTION].bulk_write(counter_operations, ordered=False)
+        except Exception as e:
+            logger.warning(f"Failed to update counters for bulk update in {department}: {str(e)}")
+
+    if propagate:
+        canonical_ids = [p["tracking_id"] for p in updated if p.get("cluster_id") == p["tracking_id"]]
+        try:
+            notifications += await propagate_cluster_status(db, petitions, department, canonical_ids, status, timeline_entry)
+        except Exception as e:
+            logger.warning(f"Failed to propagate status to cluster members in {department}: {str(e)}")
+
+    return results, notifications
+
+async def find_petitions_for_bulk(petitions, tracking_ids, department=None):
+    """
+    Locate petitions by tracking ID, restoring archived ones to their live collection
+    
+    Returns a dict of tracking_id -> (petition, department).
+    """
+    query = {"tracking_id": {"$in": tracking_ids}}
+    if department:
+        found = {p["tracking_id"]: (p, department) async for p in petitions.find(department, query, {"timeline": 0})}
+    else:
+        found = {p["tracking_id"]: (p, dept) async for p, dept in petitions.find_any(query, {"timeline": 0})}
+
+    missing = [tracking_id for tracking_id in tracking_ids if tracking_id not in found]
+    if missing:
+        archived = [
+            (petition["tracking_id"], dept)
+            async for petition, dept in petitions.find_any({"tracking_id": {"$in": missing}}, {"tracking_id": 1}, include_archive=True)
+        ]
+        restored = {}
+        for tracking_id, dept in archived:
+            if (department is None or dept == department) and await petitions.restore_from_archive(dept, {"tracking_id": tracking_id}):
+                restored.setdefault(dept, []).append(tracking_id)
+        for dept, restored_ids in restored.items():
+            async for petition in petitions.find(dept, {"tracking_id": {"$in": restored_ids}}, {"timeline": 0}):
+                found[petition["tracking_id"]] = (petition, dept)
+    return found
+
+@router.post("/admin/petitions/bulk_status")
+async def bulk_update_grievance_status(request_data: dict, background_tasks: BackgroundTasks):
+    """
+    Update the status of many grievances at once
+    
+    Expects {"tracking_ids": [...], "status": "...", "comment": "...",
+    "department": "..."} (comment and department are optional). Petitions are
+    written with one bulk_write per department; timeline events and counters
+    are batched the same way and notifications are sent as one background
+    batch after the response. A failure for one grievance or department does
+    not stop the others; the outcome of each tracking ID is in "results" and
+    "success" is false when none of them was updated.
+    """
+    try:
+        tracking_ids = request_data.get("tracking_ids") or []
+        status = str(request_data.get("status", "")).lower()
+        comment = request_data.get("comment")
+        department = request_data.get("department")
+
+        valid_statuses = ["pending", "resolved", "rejected", "in_progress"]
+        if status not in valid_statuses:
+            return {"success": False, "message": "Invalid status value"}
+        if not isinstance(tracking_ids, list) or not tracking_ids:
+            return {"success": False, "message": "tracking_ids must be a non-empty list"}
+        if len(tracking_ids) > BULK_STATUS_MAX_ITEMS:
+            return {"success": False, "message": f"At most {BULK_STATUS_MAX_ITEMS} grievances can be updated at once"}
+        if department and department not in department_tables:
+            return {"success": False, "message": "Invalid department"}
+
+        # Keep the caller's order but update each grievance only once
+        tracking_ids = list(dict.fromkeys(str(tracking_id) for tracking_id in tracking_ids))
+
+        db = connect_to_async_db()
+        petitions = AsyncPetitionRepository(db)
+        found = await find_petitions_for_bulk(petitions, tracking_ids, department)
+
+        results = {}
+        by_department = {}
+        for tracking_id in tracking_ids:
+            if tracking_id in found:
+                petition, dept = found[tracking_id]
+                by_department.setdefault(dept, []).append(petition)
+            else:
+                results[tracking_id] = {"success": False, "message": "Grievance not found with the provided tracking ID"}
+
+        timeline_entry = build_timeline_entry(
+            status,
+            comment if comment else f"Status updated to {status}",
+            'status_update'
+        )
+
+        notifications = []
+        for dept, members in by_department.items():
+            try:
+                dept_results, dept_notifications = await apply_status_to_petitions(db, petitions, dept, members, status, timeline_entry)
+                results.update(dept_results)
+                notifications += dept_notifications
+            except Exception as e:
+                logger.error(f"Bulk status update failed for {dept}: {str(e)}")
+                for petition in members:
+                    results.setdefault(petition["tracking_id"], {"success": False, "message": f"An error occurred: {str(e)}"})
+
+        if notifications:
+            background_tasks.add_task(send_notifications_batch, notifications)
+
+        updated_count = sum(1 for result in results.values() if result["success"])
+        logger.info(f"Bulk status update to {status}: {updated_count}/{len(tracking_ids)} updated")
+        return {
+            "success": updated_count > 0,
+            "status": status,
+            "updated": updated_count,
+            "failed": len(tracking_ids) - updated_count,
+            "notifications_queued": len(notifications),
+            "results": [dict(results[tracking_id], tracking_id=tracking_id) for tracking_id in tracking_ids]
+        }
+
+    except Exception as ex:
+        return {"success": False, "message": f"An error occurred: {str(ex)}"}
+
 # --------------------------- Utility Functions ----------------------------
 
 import random
@@ -803,36 +3108,581 @@ def detect_priority(text: str) -> str:
     # Default to Medium for general grievances
     return "Medium"
 
-# --------------------------- Similarity Detection ---------------------------
+# --------------------------- Similarity Detection ---------------------------
+
+# Compare new grievances against open cases only, instead of every live grievance
+SIMILARITY_OPEN_ONLY = os.environ.get("SIMILARITY_OPEN_ONLY", "false").lower() == "true"
+
+# Similarity checks are served from a shared in-memory index over every
+# department (SIMILARITY_INDEX=false falls back to scanning one department).
+# SIMILARITY_SCOPE picks which departments a check spans: "department",
+# "related" (the department plus the groups in DEPARTMENT_GROUPS) or "all".
+SIMILARITY_INDEX_ENABLED = os.environ.get("SIMILARITY_INDEX", "true").lower() == "true"
+SIMILARITY_SCOPE = os.environ.get("SIMILARITY_SCOPE", "related")
+SIMILARITY_SCOPES = ("department", "related", "all")
+if SIMILARITY_SCOPE not in SIMILARITY_SCOPES:
+    raise RuntimeError(f"SIMILARITY_SCOPE must be one of {', '.join(SIMILARITY_SCOPES)}")
+SIMILARITY_HASH_FEATURES = int(os.environ.get("SIMILARITY_HASH_FEATURES", str(2 ** 18)))
+SIMILARITY_INDEX_MAX_AGE = int(os.environ.get("SIMILARITY_INDEX_MAX_AGE", "3600"))
+# Seconds before a failed build is retried; doubles with every further failure
+SIMILARITY_INDEX_RETRY = int(os.environ.get("SIMILARITY_INDEX_RETRY", "30"))
+
+# With SIMILARITY_INDEX_DIR set the index is persisted there so workers load
+# it memory-mapped instead of rebuilding it from MongoDB. Layout:
+#   manifest.json            {"format_version", "n_features", "generation",
+#                             "built_at", "segments": [base, delta, ...],
+#                             "statuses": {tracking_id: status}}
+#   <segment>/data.npy       CSR arrays (float32 data, int32 indices/indptr)
+#   <segment>/indices.npy
+#   <segment>/indptr.npy
+#   <segment>/entries.json   one {tracking_id, department, status, ...} per row
+# Status changes after a segment was written are kept in the manifest's
+# "statuses" map and override the status in entries.json.
+# Bump SIMILARITY_INDEX_FORMAT whenever the layout or the hashing changes;
+# an index written with another format or feature count is rebuilt.
+SIMILARITY_INDEX_DIR = os.environ.get("SIMILARITY_INDEX_DIR", "")
+SIMILARITY_INDEX_FORMAT = 1
+SIMILARITY_MAX_SEGMENTS = int(os.environ.get("SIMILARITY_MAX_SEGMENTS", "32"))
+
+# Departments whose grievances are commonly misrouted between each other
+DEPARTMENT_GROUPS = [
+    {  # water supply, drainage and leaks
+        "Municipal Administration and Water Supply Department",
+        "Tamil Nadu Water Supply and Drainage Board",
+        "Water Resources Department",
+        "Public Works Department",
+        "Rural Development and Panchayat Raj Department"
+    },
+    {  # roads, potholes and street works
+        "Public Works Department",
+        "Highways and Minor Ports Department",
+        "Municipal Administration and Water Supply Department",
+        "Rural Development and Panchayat Raj Department",
+        "Housing and Urban Development Department"
+    },
+    {  # power supply and street lights
+        "Energy Department",
+        "Municipal Administration and Water Supply Department",
+        "Rural Development and Panchayat Raj Department"
+    },
+    {  # schools and colleges
+        "School Education Department",
+        "Higher Education Department"
+    },
+    {  # welfare schemes and pensions
+        "Social Welfare and Women Empowerment Department",
+        "Adi Dravidar and Tribal Welfare Department",
+        "BC MBC and Minorities Welfare Department",
+        "Welfare of Differently Abled Persons",
+        "Revenue and Disaster Management Department"
+    },
+    {  # ration and food supply
+        "Co-operation Food and Consumer Protection Department",
+        "Revenue and Disaster Management Department"
+    }
+]
+
+def similarity_departments(department, scope=None):
+    """
+    The departments a similarity check for department should span
+    """
+    scope = scope or SIMILARITY_SCOPE
+    if scope == "all":
+        return set(department_tables)
+    departments = {department}
+    if scope == "related":
+        for group in DEPARTMENT_GROUPS:
+            if department in group:
+                departments |= group
+    return departments
+
+class SimilarityIndex:
+    """
+    Hashed TF-IDF vectors of every live grievance across all departments
+    
+    Texts are hashed into a fixed feature space, so one index serves every
+    department and new grievances are added without refitting a vocabulary.
+    Document frequencies are kept incrementally and IDF weights are applied
+    at query time. A query only scores the rows of the requested departments.
+    
+    Rows are stored as a list of CSR segments. With SIMILARITY_INDEX_DIR set,
+    every segment is also written to disk (see the format note above) and
+    loaded memory-mapped, so workers share the pages and start without
+    re-reading MongoDB. Each worker appends its new grievances as a delta
+    segment and picks up the deltas of other workers when the manifest
+    changes; once there are more than SIMILARITY_MAX_SEGMENTS segments they
+    are compacted into a new base.
+    """
+
+    def __init__(self, n_features=SIMILARITY_HASH_FEATURES, directory=SIMILARITY_INDEX_DIR):
+        self._vectorizer = None
+        self.n_features = n_features
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._building = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._backlog = []
+        self._reset()
+
+    def _reset(self):
+        self.segments = []
+        self.offsets = []
+        self.segment_names = set()
+        self.entries = []
+        self.positions = {}
+        self.department_rows = {}
+        self.df = None  # allocated with the first segment, so an unused index never imports numpy
+        self.generation = None
+        self.built_at = None
+        self.manifest_mtime = None
+
+    def _append_segment(self, name, matrix, entries):
+        # Rows whose grievance is already indexed stay in the segment but are never scored
+        offset = len(self.entries)
+        self.segments.append(matrix)
+        self.offsets.append(offset)
+        if name:
+            self.segment_names.add(name)
+        indexed = []
+        for row, entry in enumerate(entries, start=offset):
+            self.entries.append(entry)
+            if entry['tracking_id'] in self.positions:
+                continue
+            self.positions[entry['tracking_id']] = row
+            self.department_rows.setdefault(entry['department'], []).append(row)
+            indexed.append(row - offset)
+        if self.df is None:
+            self.df = np.zeros(self.n_features, dtype=np.float64)
+        if indexed and matrix.nnz:
+            # Document frequencies only count the rows that are scored
+            counted = matrix if len(indexed) == matrix.shape[0] else matrix[indexed]
+            self.df += np.bincount(counted.indices, minlength=self.n_features)
+
+    def _apply_statuses(self, statuses):
+        for tracking_id, status in statuses.items():
+            row = self.positions.get(tracking_id)
+            if row is not None:
+                self.entries[row]['status'] = status
+
+    @property
+    def vectorizer(self):
+        if self._vectorizer is None:
+            self._vectorizer = sklearn_text.HashingVectorizer(
+                stop_words='english',
+                ngram_range=(1, 2),
+                n_features=self.n_features,
+                alternate_sign=False,
+                norm=None
+            )
+        return self._vectorizer
+
+    @staticmethod
+    def petition_text(petition):
+        return f"{petition.get('petition_subject', '')} {petition.get('petition_description', '')}".lower().strip()
+
+    @staticmethod
+    def _entry(petition, department):
+        return {
+            'tracking_id': petition.get('tracking_id', str(petition.get('_id'))),
+            'department': department,
+            'status': petition.get('status', 'pending'),
+            'subject': petition.get('petition_subject', 'N/A'),
+            'description': petition.get('petition_description', 'N/A')[:100] + '...'
+        }
+
+    def _vectorize(self, texts):
+        matrix = self.vectorizer.transform(texts).tocsr()
+        matrix.sum_duplicates()
+        matrix.data = matrix.data.astype(np.float32)
+        matrix.indices = matrix.indices.astype(np.int32)
+        matrix.indptr = matrix.indptr.astype(np.int32)
+        return matrix
+
+    # --- on-disk segments ---
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def _file_lock(self):
+        """Exclusive lock on the index directory, shared by every worker on the host"""
+        lock_file = open(self._path("index.lock"), "a")
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _read_manifest(self):
+        try:
+            with open(self._path("manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("format_version") != SIMILARITY_INDEX_FORMAT or manifest.get("n_features") != self.n_features:
+            logger.warning("Ignoring similarity index on disk written with different settings")
+            return None
+        return manifest
+
+    def _write_manifest(self, manifest):
+        manifest = dict(manifest, format_version=SIMILARITY_INDEX_FORMAT, n_features=self.n_features)
+        temporary = self._path(f"manifest.json.{os.getpid()}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temporary, self._path("manifest.json"))
+
+    def _write_segment(self, kind, matrix, entries):
+        name = f"{kind}-{int(time.time() * 1000)}-{os.getpid()}-{random.randrange(16 ** 6):06x}"
+        temporary = self._path(name + ".tmp")
+        os.makedirs(temporary)
+        np.save(os.path.join(temporary, "data.npy"), matrix.data)
+        np.save(os.path.join(temporary, "indices.npy"), matrix.indices)
+        np.save(os.path.join(temporary, "indptr.npy"), matrix.indptr)
+        with open(os.path.join(temporary, "entries.json"), "w") as f:
+            json.dump(entries, f)
+        os.replace(temporary, self._path(name))
+        return name
+
+    def _read_segment(self, name, mmap=True):
+        mode = 'r' if mmap else None
+        data = np.load(self._path(name, "data.npy"), mmap_mode=mode)
+        indices = np.load(self._path(name, "indices.npy"), mmap_mode=mode)
+        indptr = np.load(self._path(name, "indptr.npy"), mmap_mode=mode)
+        with open(self._path(name, "entries.json")) as f:
+            entries = json.load(f)
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(entries), self.n_features), copy=False)
+        return matrix, entries
+
+    def _remove_unlisted_segments(self, manifest):
+        # Workers that still map a removed segment keep their pages until they reload
+        keep = set(manifest["segments"])
+        for name in os.listdir(self.directory):
+            if (name.startswith("base-") or name.startswith("delta-")) and name not in keep:
+                shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def load(self, retry=True):
+        """
+        Bring the in-memory index up to date with the manifest on disk
+        
+        Returns False when there is no usable index on disk.
+        """
+        try:
+            mtime = os.stat(self._path("manifest.json")).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.manifest_mtime:
+            return True
+        manifest = self._read_manifest()
+        if manifest is None:
+            return False
+        try:
+            with self._lock:
+                if manifest["generation"] != self.generation:
+                    self._reset()
+                    self.generation = manifest["generation"]
+                    self.built_at = manifest["built_at"]
+                for name in manifest["segments"]:
+                    if name not in self.segment_names:
+                        self._append_segment(name, *self._read_segment(name))
+                self._apply_statuses(manifest.get("statuses", {}))
+                self.manifest_mtime = mtime
+            return True
+        except OSError as e:
+            # A compaction removed a segment between reading the manifest and mapping it
+            logger.warning(f"Similarity index changed while loading: {str(e)}")
+            with self._lock:
+                self._reset()
+            return self.load(retry=False) if retry else False
+
+    def _publish_base(self, matrix, entries, built_at, since=None):
+        """Write matrix as a new base generation; deltas and status changes recorded after since was read are kept"""
+        since = since or {}
+        since_segments = set(since.get("segments", []))
+        since_statuses = since.get("statuses", {})
+        with self._file_lock():
+            current = self._read_manifest() or {"segments": []}
+            name = self._write_segment("base", matrix, entries)
+            later_deltas = [s for s in current["segments"] if s.startswith("delta-") and s not in since_segments]
+            later_statuses = {
+                tracking_id: status for tracking_id, status in current.get("statuses", {}).items()
+                if since_statuses.get(tracking_id) != status
+            }
+            manifest = {"generation": name, "built_at": built_at, "segments": [name] + later_deltas,
+                        "statuses": later_statuses}
+            self._write_manifest(manifest)
+            self._remove_unlisted_segments(manifest)
+
+    def compact(self):
+        """Merge every segment on disk into a new base, dropping duplicate rows"""
+        if not self.directory:
+            return
+        with self._file_lock():
+            manifest = self._read_manifest()
+            if not manifest or len(manifest["segments"]) <= 1:
+                return
+            matrices, entries, seen = [], [], set()
+            statuses = manifest.get("statuses", {})
+            for name in manifest["segments"]:
+                matrix, segment_entries = self._read_segment(name, mmap=False)
+                keep = []
+                for row, entry in enumerate(segment_entries):
+                    if entry['tracking_id'] not in seen:
+                        seen.add(entry['tracking_id'])
+                        keep.append(row)
+                        entries.append(dict(entry, status=statuses.get(entry['tracking_id'], entry['status'])))
+                matrices.append(matrix[keep])
+            merged = sp.vstack(matrices, format='csr') if matrices else sp.csr_matrix((0, self.n_features))
+            name = self._write_segment("base", merged, entries)
+            compacted = {"generation": name, "built_at": manifest["built_at"], "segments": [name]}
+            self._write_manifest(compacted)
+            self._remove_unlisted_segments(compacted)
+        logger.info(f"Similarity index compacted {len(manifest['segments'])} segments into {len(entries)} rows")
+        self.load()
+
+    # --- building and updating ---
+
+    def build(self):
+        """Rebuild the index from every live grievance"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        try:
+            start = time.monotonic()
+            since = None
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                since = self._read_manifest()
+            petitions = PetitionRepository(connect_to_db())
+            projection = {'petition_subject': 1, 'petition_description': 1, 'tracking_id': 1, 'status': 1}
+            entries, texts = [], []
+            for petition, department in petitions.find_any({}, projection):
+                text = self.petition_text(petition)
+                if text:
+                    entries.append(self._entry(petition, department))
+                    texts.append(text)
+            matrix = self._vectorize(texts) if texts else sp.csr_matrix((0, self.n_features), dtype=np.float32)
+
+            if self.directory:
+                self._publish_base(matrix, entries, time.time(), since)
+                with self._lock:
+                    self._reset()
+                self.load()
+            else:
+                with self._lock:
+                    self._reset()
+                    self._append_segment(None, matrix, entries)
+                    self.built_at = time.time()
+            with self._lock:
+                backlog, self._backlog = self._backlog, []
+            self._failures, self._retry_at = 0, 0.0
+            self._building = False
+            for petition, department in backlog:
+                self.add(petition, department)
+            logger.info(f"Similarity index built with {len(entries)} grievances in {time.monotonic() - start:.2f}s")
+        except Exception:
+            self._failures += 1
+            delay = min(SIMILARITY_INDEX_RETRY * 2 ** (self._failures - 1), SIMILARITY_INDEX_MAX_AGE)
+            self._retry_at = time.monotonic() + delay
+            raise
+        finally:
+            self._building = False
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            logger.error(f"Error building similarity index (retrying in {self._retry_at - time.monotonic():.0f}s): {str(e)}")
+
+    def ensure_fresh(self):
+        """
+        Load the index from disk, pick up other workers' deltas, and build it
+        in the background when there is none yet or it is older than
+        SIMILARITY_INDEX_MAX_AGE
+        
+        Returns False while there is no index to query yet. Never waits for a
+        build; a failed build is retried after SIMILARITY_INDEX_RETRY seconds.
+        """
+        if self.directory:
+            self.load()
+        stale = self.built_at is None or time.time() - self.built_at > SIMILARITY_INDEX_MAX_AGE
+        if stale and not self._building and time.monotonic() >= self._retry_at:
+            threading.Thread(target=self._build_in_background, daemon=True).start()
+        return self.built_at is not None
+
+    def add(self, petition, department):
+        """Add a newly submitted grievance"""
+        if not feature_enabled("similarity"):
+            return
+        text = self.petition_text(petition)
+        if not text:
+            return
+        matrix = self._vectorize([text])
+        entry = self._entry(petition, department)
+        with self._lock:
+            if self._building:
+                self._backlog.append((petition, department))
+            if entry['tracking_id'] in self.positions:
+                return
+
+        name = None
+        if self.directory and self.generation is not None:
+            try:
+                with self._file_lock():
+                    name = self._write_segment("delta", matrix, [entry])
+                    manifest = self._read_manifest()
+                    if manifest and manifest["generation"] == self.generation:
+                        manifest["segments"].append(name)
+                        self._write_manifest(manifest)
+                        segment_count = len(manifest["segments"])
+                    else:
+                        shutil.rmtree(self._path(name), ignore_errors=True)
+                        name, segment_count = None, 0
+                if segment_count > SIMILARITY_MAX_SEGMENTS:
+                    threading.Thread(target=self.compact, daemon=True).start()
+            except OSError as e:
+                logger.warning(f"Failed to persist similarity index delta: {str(e)}")
+                name = None
+
+        with self._lock:
+            if entry['tracking_id'] not in self.positions:
+                self._append_segment(name, matrix, [entry])
 
-def find_similar_grievances(petition_text, department, similarity_threshold=0.8):
+    def set_status(self, tracking_ids, status):
+        """Record status changes so open-only checks skip closed grievances"""
+        with self._lock:
+            statuses = {tracking_id: status for tracking_id in tracking_ids if tracking_id in self.positions}
+            self._apply_statuses(statuses)
+        if not statuses or not self.directory or self.generation is None:
+            return
+        # Persisted in the manifest so other workers and later loads see the change
+        try:
+            with self._file_lock():
+                manifest = self._read_manifest()
+                if manifest and manifest["generation"] == self.generation:
+                    manifest.setdefault("statuses", {}).update(statuses)
+                    self._write_manifest(manifest)
+        except OSError as e:
+            logger.warning(f"Failed to persist similarity index statuses: {str(e)}")
+
+    def query(self, text, departments, similarity_threshold=0.8, open_only=False):
+        """Grievances of the given departments whose cosine similarity to text reaches the threshold"""
+        with self._lock:
+            rows = sorted(row for department in departments for row in self.department_rows.get(department, []))
+            if open_only:
+                rows = [row for row in rows if self.entries[row]['status'] in OPEN_STATUSES]
+            SIMILARITY_CANDIDATES.observe(len(rows))
+            if not rows:
+                return []
+            rows = np.array(rows)
+            segment_ids = np.searchsorted(self.offsets, rows, side='right') - 1
+            parts = [
+                self.segments[segment][rows[segment_ids == segment] - self.offsets[segment]]
+                for segment in np.unique(segment_ids)
+            ]
+            entries = [self.entries[row] for row in rows]
+            n_documents = len(self.positions)
+            df = self.df.copy()
+
+        candidates = sp.vstack(parts, format='csr')
+        idf = np.log((1 + n_documents) / (1 + df)) + 1
+        weighted = sklearn_preprocessing.normalize(candidates.multiply(idf).tocsr())
+        query_vector = sklearn_preprocessing.normalize(self.vectorizer.transform([text.lower().strip()]).multiply(idf).tocsr())
+        scores = (weighted @ query_vector.T).toarray().ravel()
+
+        similar_grievances = []
+        for i in np.flatnonzero(scores >= similarity_threshold):
+            entry = entries[i]
+            similar_grievances.append({
+                'grievance_id': entry['tracking_id'],
+                'department': entry['department'],
+                'similarity_score': float(scores[i]),
+                'subject': entry['subject'],
+                'description': entry['description']
+            })
+        similar_grievances.sort(key=lambda x: x['similarity_score'], reverse=True)
+        return similar_grievances
+
+    def memory_stats(self):
+        """
+        Rows and matrix bytes of the index, split into heap arrays and
+        memory-mapped ones (shared with other workers through the page cache)
+        """
+        heap_bytes = mapped_bytes = 0
+        with self._lock:
+            for matrix in self.segments:
+                for array in (matrix.data, matrix.indices, matrix.indptr):
+                    if isinstance(array, np.memmap) or isinstance(array.base, np.memmap):
+                        mapped_bytes += array.nbytes
+                    else:
+                        heap_bytes += array.nbytes
+            return {
+                "rows": len(self.entries),
+                "live_rows": len(self.positions),
+                "segments": len(self.segments),
+                "matrix_heap_bytes": heap_bytes,
+                "matrix_mapped_bytes": mapped_bytes,
+                "df_bytes": self.df.nbytes if self.df is not None else 0,
+                "backlog": len(self._backlog)
+            }
+
+
+similarity_index = SimilarityIndex()
+
+@timed_operation("find_similar_grievances")
+def find_similar_grievances(petition_text, department, similarity_threshold=0.8, open_only=None, scope=None):
     """
     Find similar grievances using TF-IDF and cosine similarity
     
+    Archived grievances are never part of the corpus.
+    
     Args:
         petition_text: The text to compare (subject + description)
-        department: Department to search within
+        department: Department the grievance was classified into
         similarity_threshold: Minimum similarity score (default 0.8 for 80%)
+        open_only: Only compare against pending/in-progress grievances
+                   (defaults to the SIMILARITY_OPEN_ONLY setting)
+        scope: "department", "related" or "all" (defaults to SIMILARITY_SCOPE)
         
     Returns:
-        List of similar grievances with their similarity scores
+        List of similar grievances with their similarity scores and departments
+    """
+    if department not in department_tables or not feature_enabled("similarity"):
+        return []
+    if open_only is None:
+        open_only = SIMILARITY_OPEN_ONLY
+    if not SIMILARITY_INDEX_ENABLED:
+        return scan_similar_grievances(petition_text, department, similarity_threshold, open_only)
+    try:
+        if not similarity_index.ensure_fresh():
+            # The first build is still running or backing off; the submission does not wait for it
+            return scan_similar_grievances(petition_text, department, similarity_threshold, open_only)
+        departments = similarity_departments(department, scope)
+        return similarity_index.query(petition_text, departments, similarity_threshold, open_only)
+    except Exception as e:
+        logger.error(f"Error in similarity detection: {str(e)}")
+        return []
+
+def scan_similar_grievances(petition_text, department, similarity_threshold=0.8, open_only=False):
+    """
+    Find similar grievances by fitting TF-IDF over one department's grievances
+    
+    Used when the shared similarity index is disabled.
     """
     try:
-        db = connect_to_db()
-        table_name = department_tables.get(department)
-        if not table_name:
+        if department not in department_tables:
             return []
             
-        collection = db[table_name]
+        petitions = PetitionRepository(connect_to_db())
         
         # Get all existing grievances in this department
-        existing_grievances = list(collection.find({}, {
+        corpus_query = {'status': {'$in': OPEN_STATUSES}} if open_only else {}
+        existing_grievances = list(petitions.find(department, corpus_query, {
             'petition_subject': 1, 
             'petition_description': 1, 
             'tracking_id': 1,
             '_id': 1
         }))
         
+        SIMILARITY_CANDIDATES.observe(len(existing_grievances))
         if len(existing_grievances) < 1:
             return []
         
@@ -859,7 +3709,7 @@ def find_similar_grievances(petition_text, department, similarity_threshold=0.8)
             return []
         
         # Create TF-IDF vectors
-        vectorizer = TfidfVectorizer(
+        vectorizer = sklearn_text.TfidfVectorizer(
             stop_words='english',
             max_features=1000,
             ngram_range=(1, 2),  # Include unigrams and bigrams
@@ -870,7 +3720,7 @@ def find_similar_grievances(petition_text, department, similarity_threshold=0.8)
         tfidf_matrix = vectorizer.fit_transform(texts)
         
         # Calculate cosine similarity between new petition and all existing ones
-        similarity_scores = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+        similarity_scores = sklearn_pairwise.cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
         
         # Find similar grievances above threshold
         similar_grievances = []
@@ -880,6 +3730,7 @@ def find_similar_grievances(petition_text, department, similarity_threshold=0.8)
                 if grievance:
                     similar_grievances.append({
                         'grievance_id': grievance.get('tracking_id', str(grievance['_id'])),
+                        'department': department,
                         'similarity_score': float(score),
                         'subject': grievance.get('petition_subject', 'N/A'),
                         'description': grievance.get('petition_description', 'N/A')[:100] + '...'
@@ -894,98 +3745,793 @@ def find_similar_grievances(petition_text, department, similarity_threshold=0.8)
         logger.error(f"Error in similarity detection: {str(e)}")
         return []
 
-# --------------------------- Timeline Management ---------------------------
+# --------------------------- Duplicate Clusters ---------------------------
+
+# A cluster groups a canonical grievance with the duplicates that matched it.
+# The cluster ID is the canonical grievance's tracking ID; every petition in
+# a cluster carries cluster_id, and all but the canonical one are flagged
+# cluster_member so listings can collapse a cluster into a single row.
+CLUSTERS_COLLECTION = "grievance_clusters"
+COLLAPSED_CLUSTERS_QUERY = {"cluster_member": {"$ne": True}}
+
+def ensure_cluster_indexes(db):
+    """
+    Create the index used to list a department's clusters
+    """
+    db[CLUSTERS_COLLECTION].create_index([('department', 1), ('size', -1)], name='department_size')
+
+async def assign_to_cluster(db, petitions, department, tracking_id, similar_grievances):
+    """
+    Add a new grievance to the cluster of its closest match
+    
+    Matches are tried from the highest similarity down and the first one that
+    already belongs to a cluster wins. If none does, the closest match becomes
+    the canonical grievance of a new cluster. Clusters are never merged, so a
+    grievance that matches two clusters joins the closer one.
+    
+    Returns the cluster ID.
+    """
+    match_ids = [g['grievance_id'] for g in similar_grievances]
+    clustered = {
+        p['tracking_id']: p['cluster_id']
+        async for p in petitions.find(department, {"tracking_id": {"$in": match_ids}, "cluster_id": {"$exists": True}}, {"tracking_id": 1, "cluster_id": 1})
+    }
+    cluster_id = next((clustered[match_id] for match_id in match_ids if match_id in clustered), None)
+
+    now = datetime.now()
+    if cluster_id is None:
+        cluster_id = match_ids[0]
+        await petitions.update_one(department, {"tracking_id": cluster_id}, {"$set": {"cluster_id": cluster_id, "last_updated": now}})
+        await db[CLUSTERS_COLLECTION].update_one(
+            {"_id": cluster_id},
+            {"$setOnInsert": {"department": department, "created_at": now, "members": [], "size": 1}},
+            upsert=True
+        )
+
+    await db[CLUSTERS_COLLECTION].update_one(
+        {"_id": cluster_id, "members": {"$ne": tracking_id}},
+        {"$push": {"members": tracking_id}, "$inc": {"size": 1}, "$set": {"updated_at": now}}
+    )
+    return cluster_id
+
+async def propagate_cluster_status(db, petitions, department, canonical_ids, status, timeline_entry):
+    """
+    Give the open members of closed canonical grievances the same status
+    
+    All members are moved with one batched write per department through
+    apply_status_to_petitions. Returns the notifications to send.
+    """
+    if status not in CLOSED_STATUSES or not canonical_ids:
+        return []
+    members = await petitions.find(
+        department,
+        {"cluster_id": {"$in": canonical_ids}, "cluster_member": True, "status": {"$in": OPEN_STATUSES}},
+        {"timeline": 0}
+    ).to_list(length=None)
+    if not members:
+        return []
+
+    member_entry = dict(
+        timeline_entry,
+        comment=f"{timeline_entry.get('comment', '')} (closed with its duplicate cluster)".strip(),
+        update_type='cluster_update'
+    )
+    _, notifications = await apply_status_to_petitions(db, petitions, department, members, status, member_entry, propagate=False)
+    logger.info(f"Propagated status {status} to {len(members)} cluster member(s) in {department}")
+    return notifications
+
+async def attach_cluster_sizes(db, petitions_list):
+    """
+    Add cluster_size and cluster_members to canonical grievances in a listing (db is motor)
+    """
+    cluster_ids = [p["cluster_id"] for p in petitions_list if p.get("cluster_id")]
+    if not cluster_ids:
+        return petitions_list
+    clusters = {
+        c["_id"]: c
+        async for c in db[CLUSTERS_COLLECTION].find({"_id": {"$in": cluster_ids}}, {"members": 1, "size": 1})
+    }
+    for petition in petitions_list:
+        cluster = clusters.get(petition.get("cluster_id"))
+        if cluster:
+            petition["cluster_size"] = cluster.get("size", 1)
+            petition["cluster_members"] = cluster.get("members", [])
+    return petitions_list
+
+@router.get("/admin/clusters")
+async def list_clusters(department: str, min_size: int = 2, limit: int = 100):
+    """
+    List a department's duplicate clusters, largest first
+    """
+    if department not in department_tables:
+        return {"error": "Invalid department requested"}
+
+    db = connect_to_async_db()
+    limit = max(1, min(limit, 500))
+    clusters = await (
+        db[CLUSTERS_COLLECTION].find({"department": department, "size": {"$gte": min_size}})
+        .sort("size", -1)
+        .limit(limit)
+        .to_list(length=limit)
+    )
+    if clusters:
+        petitions = AsyncPetitionRepository(db)
+        canonical = {
+            p["tracking_id"]: p
+            async for p in petitions.find(
+                department,
+                {"tracking_id": {"$in": [c["_id"] for c in clusters]}},
+                {"tracking_id": 1, "petition_subject": 1, "status": 1, "priority": 1}
+            )
+        }
+        for cluster in clusters:
+            petition = canonical.get(cluster["_id"], {})
+            cluster["cluster_id"] = cluster.pop("_id")
+            cluster["petition_subject"] = petition.get("petition_subject")
+            cluster["status"] = petition.get("status")
+            cluster["priority"] = petition.get("priority")
+
+    return {"success": True, "department": department, "clusters": clusters}
+
+# --------------------------- Timeline Management ---------------------------
+
+# Timeline events live in their own append-only collection, indexed by
+# (tracking_id, timestamp). Petitions only keep a denormalized summary:
+# last_status, last_activity_at and timeline_count.
+TIMELINE_COLLECTION = "timeline_events"
+TIMELINE_PAGE_SIZE = 50
+
+def build_timeline_entry(status, comment="", update_type="status_update"):
+    """
+    Build a timeline entry stamped with the current time
+    """
+    now = datetime.now()
+    return {
+        'timestamp': now,
+        'date': now.strftime("%d-%b-%Y"),
+        'time': now.strftime("%H:%M:%S"),
+        'status': status,
+        'comment': comment,
+        'update_type': update_type
+    }
+
+def timeline_summary_update(entry):
+    """
+    Build the petition update that keeps the timeline summary in step with a new entry
+    """
+    return {
+        '$set': {
+            'last_status': entry['status'],
+            'last_activity_at': entry['timestamp'],
+            'last_updated': entry['timestamp']
+        },
+        '$inc': {'timeline_count': 1}
+    }
+
+async def record_timeline_event(db, tracking_id, department, entry):
+    """
+    Append a timeline entry to the timeline events collection (db is motor)
+    """
+    event = dict(entry)
+    event['tracking_id'] = tracking_id
+    event['department'] = department
+    await db[TIMELINE_COLLECTION].insert_one(event)
+    return event
+
+async def record_timeline_events(db, department, tracking_ids, entry):
+    """
+    Append the same timeline entry to several grievances with one insert (db is motor)
+    """
+    events = [dict(entry, tracking_id=tracking_id, department=department) for tracking_id in tracking_ids]
+    if events:
+        await db[TIMELINE_COLLECTION].insert_many(events, ordered=False)
+    return events
+
+def ensure_timeline_indexes(db):
+    """
+    Create the index used to page through a grievance's timeline
+    """
+    db[TIMELINE_COLLECTION].create_index(
+        [('tracking_id', 1), ('timestamp', 1)],
+        name='tracking_id_timestamp'
+    )
+
+async def add_timeline_entry(grievance_id, department, status, comment="", update_type="status_update"):
+    """
+    Add a timeline entry to a grievance
+    
+    Args:
+        grievance_id: Tracking ID of the grievance
+        department: Department name
+        status: New status
+        comment: Optional comment
+        update_type: Type of update (status_update, comment, reminder, etc.)
+    """
+    try:
+        if department not in department_tables:
+            return False
+            
+        db = connect_to_async_db()
+        
+        # Create timeline entry
+        timeline_entry = build_timeline_entry(status, comment, update_type)
+        
+        # Update the summary on the grievance, then append the event
+        result = await AsyncPetitionRepository(db).update_one(
+            department,
+            {'tracking_id': grievance_id},
+            timeline_summary_update(timeline_entry)
+        )
+        if result.matched_count == 0:
+            return False
+        
+        await record_timeline_event(db, grievance_id, department, timeline_entry)
+        await publish_grievance_event(
+            'timeline_entry', {'tracking_id': grievance_id, 'department': department}, timeline_entry
+        )
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error adding timeline entry: {str(e)}")
+        return False
+
+async def get_grievance_timeline(grievance_id, department, limit=TIMELINE_PAGE_SIZE, cursor=None):
+    """
+    Get one page of the timeline for a grievance, oldest first
+    
+    A grievance that still carries an embedded timeline is returned whole,
+    merged with its events, on a single page.
+    
+    Args:
+        grievance_id: Tracking ID of the grievance
+        department: Department name
+        limit: Maximum number of events to return
+        cursor: Cursor returned with the previous page, if any
+        
+    Returns:
+        Tuple of (timeline entries, cursor for the next page or None)
+    """
+    try:
+        if department not in department_tables:
+            return [], None
+        
+        db = connect_to_async_db()
+        timeline_events = db[TIMELINE_COLLECTION]
+        
+        if not cursor:
+            # Grievances that were not migrated yet still carry an embedded timeline,
+            # and events recorded since then are in the collection: return both at once
+            grievance = await AsyncPetitionRepository(db).find_one(
+                department, {'tracking_id': grievance_id}, {'timeline': 1}, include_archive=True
+            )
+            embedded = [entry for entry in (grievance or {}).get('timeline') or [] if isinstance(entry, dict)]
+            if embedded:
+                recorded = await (
+                    timeline_events.find({'tracking_id': grievance_id}, {'tracking_id': 0, 'department': 0})
+                    .to_list(length=None)
+                )
+                # Entries a partial migration already copied are in both places
+                copied = {(e.get('timestamp'), e.get('status'), e.get('update_type')) for e in recorded}
+                merged = recorded + [
+                    entry for entry in embedded
+                    if (entry.get('timestamp'), entry.get('status'), entry.get('update_type')) not in copied
+                ]
+                merged.sort(key=lambda entry: entry['timestamp'] if isinstance(entry.get('timestamp'), datetime) else datetime.min)
+                return merged, None
+        
+        query = {'tracking_id': grievance_id}
+        if cursor:
+            query.update(after_cursor_query('timestamp', cursor))
+        
+        # Fetch one extra event to know whether another page exists
+        events = await (
+            timeline_events
+            .find(query, {'tracking_id': 0, 'department': 0})
+            .sort([('timestamp', 1), ('_id', 1)])
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+        
+        next_cursor = None
+        if len(events) > limit:
+            events = events[:limit]
+            next_cursor = encode_cursor(events[-1]['timestamp'], events[-1]['_id'])
+        
+        return events, next_cursor
+        
+    except Exception as e:
+        logger.error(f"Error getting timeline: {str(e)}")
+        return [], None
+
+# --------------------------- Dashboard Counters ---------------------------
+
+# Petition counts materialized per (department, status, priority, day), where
+# day is the UTC creation day. Badges sum over days; trends sum over statuses.
+COUNTERS_COLLECTION = "dashboard_counters"
+UNKNOWN_COUNTER_DAY = "unknown"
+
+def ensure_counter_indexes(db):
+    """
+    Create the unique key for counter rows
+    """
+    db[COUNTERS_COLLECTION].create_index(
+        [('department', 1), ('day', 1), ('status', 1), ('priority', 1)],
+        name='department_day_status_priority',
+        unique=True
+    )
+
+def counter_day(petition):
+    """
+    The counter day bucket of a petition: its UTC creation date
+    """
+    created_at_utc = petition.get('created_at_utc')
+    if isinstance(created_at_utc, datetime):
+        return created_at_utc.strftime("%Y-%m-%d")
+    return UNKNOWN_COUNTER_DAY
+
+def counter_key(petition, status):
+    """
+    Key of the counter row a petition with the given status belongs to
+    """
+    return {
+        'department': petition.get('department'),
+        'status': status,
+        'priority': petition.get('priority', 'Medium'),
+        'day': counter_day(petition)
+    }
+
+async def record_new_petition_counter(db, petition):
+    """
+    Count a newly submitted petition (db is motor)
+    """
+    try:
+        await db[COUNTERS_COLLECTION].update_one(
+            counter_key(petition, petition.get('status', 'pending')),
+            {'$inc': {'count': 1}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning(f"Failed to update counters for {petition.get('tracking_id')}: {str(e)}")
+
+def counter_status_change_operations(petition, old_status, new_status):
+    """
+    Counter writes that move a petition from old_status to new_status
+    """
+    if old_status == new_status:
+        return []
+    return [
+        UpdateOne(counter_key(petition, old_status), {'$inc': {'count': -1}}, upsert=True),
+        UpdateOne(counter_key(petition, new_status), {'$inc': {'count': 1}}, upsert=True)
+    ]
+
+async def record_status_change_counters(db, petition, old_status, new_status):
+    """
+    Move a petition's count from its old status to its new status (db is motor)
+    """
+    operations = counter_status_change_operations(petition, old_status, new_status)
+    if not operations:
+        return
+    try:
+        await db[COUNTERS_COLLECTION].bulk_write(operations, ordered=False)
+    except Exception as e:
+        logger.warning(f"Failed to update counters for {petition.get('tracking_id')}: {str(e)}")
+
+def reconcile_dashboard_counters():
+    """
+    Rebuild the counters of every department from the petitions themselves
+    
+    Live and archived petitions are both counted. Writes that land while a
+    department is being rebuilt may be lost, so this runs outside office hours.
+    """
+    try:
+        logger.info("Starting dashboard counter reconciliation...")
+        db = connect_to_db()
+        petitions = PetitionRepository(db)
+        counters = db[COUNTERS_COLLECTION]
+        pipeline = [
+            {'$match': {}},
+            {'$group': {
+                '_id': {
+                    'status': '$status',
+                    'priority': '$priority',
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at_utc'}}
+                },
+                'count': {'$sum': 1}
+            }}
+        ]
+        
+        total_rows = 0
+        for department in department_tables:
+            try:
+                totals = {}
+                for row in petitions.aggregate(department, pipeline, include_archive=True):
+                    key = (
+                        row['_id'].get('status') or 'pending',
+                        row['_id'].get('priority') or 'Medium',
+                        row['_id'].get('day') or UNKNOWN_COUNTER_DAY
+                    )
+                    totals[key] = totals.get(key, 0) + row['count']
+                
+                operations = [
+                    UpdateOne(
+                        {'department': department, 'status': status, 'priority': priority, 'day': day},
+                        {'$set': {'count': count}},
+                        upsert=True
+                    )
+                    for (status, priority, day), count in totals.items()
+                ]
+                if operations:
+                    counters.bulk_write(operations, ordered=False)
+                
+                # Drop rows that no longer match any petition
+                for row in counters.find({'department': department}, {'status': 1, 'priority': 1, 'day': 1}):
+                    if (row.get('status'), row.get('priority'), row.get('day')) not in totals:
+                        counters.delete_one({'_id': row['_id']})
+                
+                total_rows += len(operations)
+                
+            except Exception as e:
+                logger.error(f"Error reconciling counters for {department}: {str(e)}")
+                continue
+        
+        logger.info(f"Dashboard counter reconciliation completed. Rows rebuilt: {total_rows}")
+        return total_rows
+        
+    except Exception as e:
+        logger.error(f"Error in dashboard counter reconciliation: {str(e)}")
+        return 0
+
+@router.get("/admin/stats")
+@coalesce("stats")
+def get_dashboard_stats(department: str, days: int = 30):
+    """
+    Dashboard badges and a daily submission trend for a department
+    
+    Reads only the counters collection, so the cost does not depend on how
+    many petitions the department holds.
+    """
+    if department not in department_tables:
+        return {"success": False, "message": "Invalid department"}
+    
+    try:
+        db = connect_to_db()
+        days = max(1, min(days, 366))
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        
+        pipeline = [
+            {'$match': {'department': department}},
+            {'$facet': {
+                'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': '$count'}}}],
+                'by_priority': [{'$group': {'_id': '$priority', 'count': {'$sum': '$count'}}}],
+                'trend': [
+                    {'$match': {'day': {'$gte': since, '$ne': UNKNOWN_COUNTER_DAY}}},
+                    {'$group': {'_id': '$day', 'count': {'$sum': '$count'}}},
+                    {'$sort': {'_id': 1}}
+                ]
+            }}
+        ]
+        result = next(db[COUNTERS_COLLECTION].aggregate(pipeline), {})
+        
+        by_status = {row['_id']: row['count'] for row in result.get('by_status', []) if row['_id']}
+        by_priority = {row['_id']: row['count'] for row in result.get('by_priority', []) if row['_id']}
+        
+        return {
+            "success": True,
+            "data": {
+                "department": department,
+                "total": sum(by_status.values()),
+                "by_status": by_status,
+                "by_priority": by_priority,
+                "trend": [{"day": row['_id'], "count": row['count']} for row in result.get('trend', [])]
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error getting dashboard stats: {str(e)}")
+        return {"success": False, "message": f"Error retrieving dashboard stats: {str(e)}"}
+
+@router.post("/admin/stats/reconcile")
+def manual_reconcile_counters():
+    """
+    Manually rebuild the dashboard counters from the petitions (for admin use)
+    """
+    rows = reconcile_dashboard_counters()
+    return {"message": "Counter reconciliation completed successfully", "rows": rows}
+
+# --------------------------- Event Feed (SSE) ---------------------------
+
+# Grievance events are published to an in-process bus and pushed to
+# dashboards and tracking pages over server-sent events. With more than one
+# worker, EVENT_BUS_BACKEND routes every event through MongoDB so that all
+# workers see it:
+#   local         - in-process only (single worker)
+#   capped        - tailable cursor on a capped collection (works on a standalone mongod)
+#   change_stream - change stream on the feed collection (needs a replica set)
+EVENT_BUS_BACKEND = os.environ.get("EVENT_BUS_BACKEND", "local")
+EVENT_FEED_COLLECTION = "event_feed"
+EVENT_FEED_SIZE_BYTES = int(os.environ.get("EVENT_FEED_SIZE_BYTES", str(16 * 1024 * 1024)))
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "100"))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+
+class EventSubscription:
+    """
+    One SSE client: a bounded queue owned by the event loop that serves it
+    
+    When the client falls behind the oldest event is dropped and the client
+    is told to resync through /admin/petitions/changes or /track_grievance.
+    """
+
+    def __init__(self, topics, loop, queue_size):
+        self.topics = set(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event):
+        # Runs on self.loop
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overflowed = True
+        self.queue.put_nowait(event)
+
+class EventBus:
+    """
+    In-process publish/subscribe for grievance events, keyed by topic
+    
+    publish() is a coroutine for the routes; delivery hops onto each
+    subscriber's event loop, so the backends' feed threads can deliver freely.
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.backend = None
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics):
+        """Register a subscriber on the running event loop"""
+        subscription = EventSubscription(topics, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    async def publish(self, event):
+        """Publish an event to every worker (through the backend, if any)"""
+        if self.backend:
+            await self.backend.publish(event)
+        else:
+            self.deliver(event)
+
+    def deliver(self, event):
+        """Hand an event to the local subscribers of its topics"""
+        topics = set(event.get('topics', []))
+        with self._lock:
+            targets = [sub for sub in self._subscriptions if sub.topics & topics]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop is closed; it will unsubscribe itself
+                continue
+
+class CappedCollectionBackend:
+    """
+    Fan-out through a capped collection that every worker tails
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._stop = threading.Event()
+        self._thread = None
+        self.collection = None
+
+    def _create_collection(self):
+        db = connect_to_db()
+        if EVENT_FEED_COLLECTION not in db.list_collection_names():
+            try:
+                db.create_collection(EVENT_FEED_COLLECTION, capped=True, size=EVENT_FEED_SIZE_BYTES)
+            except Exception:
+                # Another worker created it first
+                pass
+        return db[EVENT_FEED_COLLECTION]
+
+    async def publish(self, event):
+        await connect_to_async_db()[EVENT_FEED_COLLECTION].insert_one(dict(event))
+
+    def start(self):
+        # Checked once here, at startup, rather than on every publish
+        self.collection = self._create_collection()
+        self._thread = threading.Thread(target=self._tail, name="event-feed-tail", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _tail(self):
+        collection = self.collection
+        # Start after the newest existing event so history is not replayed
+        newest = list(collection.find({}, {'_id': 1}).sort('$natural', -1).limit(1))
+        last_id = newest[0]['_id'] if newest else None
+        while not self._stop.is_set():
+            try:
+                query = {'_id': {'$gt': last_id}} if last_id else {}
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT, max_await_time_ms=1000)
+                while cursor.alive and not self._stop.is_set():
+                    for event in cursor:
+                        last_id = event.pop('_id')
+                        self.bus.deliver(event)
+            except Exception as e:
+                logger.warning(f"Event feed tail interrupted: {str(e)}")
+            self._stop.wait(1)
+
+class ChangeStreamBackend:
+    """
+    Fan-out through a change stream on the feed collection (replica sets only)
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._stop = threading.Event()
+        self._thread = None
+        self.collection = None
+
+    def _create_collection(self):
+        collection = connect_to_db()[EVENT_FEED_COLLECTION]
+        collection.create_index('published_at', expireAfterSeconds=3600, name='published_at_ttl')
+        return collection
+
+    async def publish(self, event):
+        await connect_to_async_db()[EVENT_FEED_COLLECTION].insert_one(dict(event, published_at=datetime.now(timezone.utc)))
+
+    def start(self):
+        self.collection = self._create_collection()
+        self._thread = threading.Thread(target=self._watch, name="event-feed-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        collection = self.collection
+        resume_token = None
+        while not self._stop.is_set():
+            try:
+                with collection.watch(
+                    [{'$match': {'operationType': 'insert'}}],
+                    resume_after=resume_token,
+                    max_await_time_ms=1000
+                ) as stream:
+                    while stream.alive and not self._stop.is_set():
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is None:
+                            continue
+                        event = change['fullDocument']
+                        event.pop('_id', None)
+                        event.pop('published_at', None)
+                        self.bus.deliver(event)
+            except Exception as e:
+                logger.warning(f"Event feed change stream interrupted: {str(e)}")
+            self._stop.wait(1)
+
+event_bus = EventBus()
 
-def add_timeline_entry(grievance_id, department, status, comment="", update_type="status_update"):
+def start_event_bus():
     """
-    Add a timeline entry to a grievance
-    
-    Args:
-        grievance_id: Tracking ID of the grievance
-        department: Department name
-        status: New status
-        comment: Optional comment
-        update_type: Type of update (status_update, comment, reminder, etc.)
+    Attach the configured fan-out backend to the event bus
     """
+    backends = {'capped': CappedCollectionBackend, 'change_stream': ChangeStreamBackend}
+    if EVENT_BUS_BACKEND == 'local':
+        return
+    if EVENT_BUS_BACKEND not in backends:
+        logger.error(f"Unknown EVENT_BUS_BACKEND {EVENT_BUS_BACKEND}, using in-process events only")
+        return
     try:
-        db = connect_to_db()
-        table_name = department_tables.get(department)
-        if not table_name:
-            return False
-            
-        collection = db[table_name]
-        
-        # Create timeline entry
-        timeline_entry = {
-            'timestamp': datetime.now(),
-            'date': datetime.now().strftime("%d-%b-%Y"),
-            'time': datetime.now().strftime("%H:%M:%S"),
-            'status': status,
-            'comment': comment,
-            'update_type': update_type
-        }
-        
-        # Add timeline entry to the grievance
-        result = collection.update_one(
-            {'tracking_id': grievance_id},
-            {
-                '$push': {'timeline': timeline_entry},
-                '$set': {'last_updated': datetime.now()}
-            }
-        )
-        
-        return result.modified_count > 0
-        
+        backend = backends[EVENT_BUS_BACKEND](event_bus)
+        backend.start()
+        event_bus.backend = backend
+        logger.info(f"Event bus using {EVENT_BUS_BACKEND} fan-out")
     except Exception as e:
-        logger.error(f"Error adding timeline entry: {str(e)}")
-        return False
+        logger.error(f"Error starting event bus backend: {str(e)}")
+
+def stop_event_bus():
+    if event_bus.backend:
+        event_bus.backend.stop()
+        event_bus.backend = None
 
-def get_grievance_timeline(grievance_id, department):
+async def publish_grievance_event(event_type, petition, entry):
     """
-    Get the complete timeline for a grievance
+    Publish a grievance event to the department and tracking ID topics
+    
+    Never raises: a failed publish must not fail the write that caused it.
     """
     try:
-        db = connect_to_db()
-        table_name = department_tables.get(department)
-        if not table_name:
-            return []
-            
-        collection = db[table_name]
-        grievance = collection.find_one({'tracking_id': grievance_id}, {'timeline': 1})
-        
-        if grievance and 'timeline' in grievance:
-            timeline = grievance['timeline']
-            # Convert datetime objects to strings for JSON serialization
-            for entry in timeline:
-                if isinstance(entry.get('timestamp'), datetime):
-                    entry['timestamp'] = entry['timestamp'].isoformat()
-            return timeline
-        
-        return []
-        
+        tracking_id = petition.get('tracking_id')
+        department = petition.get('department')
+        await event_bus.publish({
+            'type': event_type,
+            'topics': [f"department:{department}", f"tracking:{tracking_id}"],
+            'tracking_id': tracking_id,
+            'department': department,
+            'status': entry.get('status'),
+            'comment': entry.get('comment'),
+            'update_type': entry.get('update_type'),
+            'timestamp': entry['timestamp'].isoformat()
+        })
     except Exception as e:
-        logger.error(f"Error getting timeline: {str(e)}")
-        return []
+        logger.warning(f"Failed to publish {event_type} event: {str(e)}")
+
+def sse_stream(request, topics):
+    """
+    Stream events for the given topics as text/event-stream with heartbeats
+    """
+    async def stream():
+        subscription = event_bus.subscribe(topics)
+        try:
+            yield f"retry: {int(EVENT_HEARTBEAT_SECONDS * 1000)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield "event: resync\ndata: {}\n\n"
+                payload = {key: value for key, value in event.items() if key != 'topics'}
+                yield f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/admin/events")
+async def department_event_feed(request: Request, department: str):
+    """
+    Server-sent events for every new or updated grievance in a department
+    """
+    if department not in department_tables:
+        raise HTTPException(status_code=400, detail="Invalid department")
+    return sse_stream(request, [f"department:{department}"])
+
+@router.get("/grievance/events")
+async def grievance_event_feed(request: Request, tracking_id: str, phone: str):
+    """
+    Server-sent events for a single grievance, verified by phone like /track_grievance
+    """
+    tracking_id = tracking_id.strip().upper()
+    petition, _ = await AsyncPetitionRepository(connect_to_async_db()).find_one_any(
+        {"tracking_id": tracking_id}, {"phone": 1}, include_archive=True
+    )
+    if not petition or petition.get("phone") != phone.strip():
+        raise HTTPException(status_code=404, detail="No grievance found with the provided tracking ID and phone number")
+    return sse_stream(request, [f"tracking:{tracking_id}"])
 
 # --------------------------- Notification System ---------------------------
 
-def send_notification_to_petitioner(grievance_data, old_status, new_status):
+def compose_notification(grievance_data, old_status, new_status):
     """
-    Simulate sending notifications to petitioners via SMS/Email
+    Simulate sending the SMS/Email for a status change and build its log record
     
     Args:
         grievance_data: Complete grievance information
         old_status: Previous status
         new_status: Updated status
     """
-    try:
-        tracking_id = grievance_data.get('tracking_id', 'N/A')
-        name = grievance_data.get('name', 'N/A')
-        phone = grievance_data.get('phone', 'N/A')
-        subject = grievance_data.get('petition_subject', 'N/A')
-        
-        # Simulate SMS notification
-        sms_message = f"""
+    tracking_id = grievance_data.get('tracking_id', 'N/A')
+    name = grievance_data.get('name', 'N/A')
+    phone = grievance_data.get('phone', 'N/A')
+    subject = grievance_data.get('petition_subject', 'N/A')
+    
+    # Simulate SMS notification
+    sms_message = f"""
 Tamil Nadu Grievance Portal - Status Update
 
 Dear {name},
@@ -998,10 +4544,10 @@ Track your grievance at: portal.tn.gov.in/track
 
 Regards,
 TN Grievance Portal
-        """.strip()
-        
-        # Simulate Email notification
-        email_message = f"""
+    """.strip()
+    
+    # Simulate Email notification
+    email_message = f"""
 Subject: Grievance Status Update - {tracking_id}
 
 Dear {name},
@@ -1018,36 +4564,51 @@ You can track your grievance status at: portal.tn.gov.in/track
 
 Best regards,
 Tamil Nadu Grievance Portal Team
-        """.strip()
-        
-        # Log the notifications (simulating actual sending)
-        logger.info(f"📱 SMS NOTIFICATION SENT to {phone}:")
-        logger.info(sms_message)
-        print(f"\n📱 SMS NOTIFICATION SENT to {phone}:")
-        print(sms_message)
-        print("-" * 60)
-        
-        logger.info(f"📧 EMAIL NOTIFICATION SENT to petitioner:")
-        logger.info(email_message)
-        print(f"\n📧 EMAIL NOTIFICATION SENT to petitioner:")
-        print(email_message)
-        print("-" * 60)
+    """.strip()
+    
+    # Log the notifications (simulating actual sending)
+    logger.info(f"📱 SMS NOTIFICATION SENT to {phone}:")
+    logger.info(sms_message)
+    print(f"\n📱 SMS NOTIFICATION SENT to {phone}:")
+    print(sms_message)
+    print("-" * 60)
+    
+    logger.info(f"📧 EMAIL NOTIFICATION SENT to petitioner:")
+    logger.info(email_message)
+    print(f"\n📧 EMAIL NOTIFICATION SENT to petitioner:")
+    print(email_message)
+    print("-" * 60)
+    
+    return {
+        'grievance_id': tracking_id,
+        'recipient_name': name,
+        'recipient_phone': phone,
+        'notification_type': 'status_update',
+        'old_status': old_status,
+        'new_status': new_status,
+        'sent_at': datetime.now(),
+        'sms_content': sms_message,
+        'email_content': email_message
+    }
+
+async def send_notification_to_petitioner(grievance_data, old_status, new_status):
+    """
+    Simulate sending notifications to petitioners via SMS/Email
+    
+    Args:
+        grievance_data: Complete grievance information
+        old_status: Previous status
+        new_status: Updated status
+    """
+    if not feature_enabled("notifications"):
+        return False
+    try:
+        notification_log = compose_notification(grievance_data, old_status, new_status)
         
         # Store notification log in database
-        db = connect_to_db()
-        notification_log = {
-            'grievance_id': tracking_id,
-            'recipient_name': name,
-            'recipient_phone': phone,
-            'notification_type': 'status_update',
-            'old_status': old_status,
-            'new_status': new_status,
-            'sent_at': datetime.now(),
-            'sms_content': sms_message,
-            'email_content': email_message
-        }
-        
-        db.notification_logs.insert_one(notification_log)
+        db = connect_to_async_db()
+        await db.notification_logs.insert_one(notification_log)
+        await invalidate_cache_async("notifications")
         
         return True
         
@@ -1055,15 +4616,45 @@ Tamil Nadu Grievance Portal Team
         logger.error(f"Error sending notifications: {str(e)}")
         return False
 
+async def send_notifications_batch(notifications):
+    """
+    Send a batch of status notifications and store their logs with one insert
+    
+    Args:
+        notifications: List of (grievance_data, old_status, new_status) tuples
+    """
+    if not feature_enabled("notifications"):
+        return 0
+    logs = []
+    for grievance_data, old_status, new_status in notifications:
+        try:
+            logs.append(compose_notification(grievance_data, old_status, new_status))
+        except Exception as e:
+            logger.error(f"Error sending notification for {grievance_data.get('tracking_id')}: {str(e)}")
+    if not logs:
+        return 0
+    try:
+        await connect_to_async_db().notification_logs.insert_many(logs, ordered=False)
+        await invalidate_cache_async("notifications")
+    except Exception as e:
+        logger.error(f"Error storing notification logs: {str(e)}")
+    return len(logs)
+
 # --------------------------- Reminder System ---------------------------
 
 def get_last_timeline_update(petition):
     """
     Get the timestamp of the last timeline update for a petition
     """
+    last_activity_at = petition.get('last_activity_at')
+    if isinstance(last_activity_at, datetime):
+        return last_activity_at
+    
     timeline = petition.get('timeline', [])
     if not timeline:
-        # If no timeline, use created_at or current time
+        # If no timeline, use created_at_utc, created_at or current time
+        if isinstance(petition.get('created_at_utc'), datetime):
+            return utc_to_local(petition['created_at_utc'])
         created_at = petition.get('created_at')
         if created_at:
             try:
@@ -1149,33 +4740,39 @@ def should_send_reminder(petition):
     
     return True
 
+def build_reminder(petition, department):
+    """
+    Build the reminder record for a petition
+    """
+    return {
+        'grievance_id': petition.get('tracking_id', petition.get('_id', 'Unknown')),
+        'department': department,
+        'officer_id': f"officer_{department.lower().replace(' ', '_')}",
+        'sent_at': datetime.now(),
+        'reason': 'No status update in 3 days',
+        'petition_subject': petition.get('petition_subject', 'N/A'),
+        'days_pending': (datetime.now() - get_last_timeline_update(petition)).days
+    }
+
 def send_reminder_for_petition(petition, department):
     """
     Send a reminder for a specific petition
     """
+    tracking_id = petition.get('tracking_id', petition.get('_id', 'Unknown'))
     try:
         db = connect_to_db()
         
-        tracking_id = petition.get('tracking_id', petition.get('_id', 'Unknown'))
-        
         # Create reminder record
-        reminder_data = {
-            'grievance_id': tracking_id,
-            'department': department,
-            'officer_id': f"officer_{department.lower().replace(' ', '_')}",
-            'sent_at': datetime.now(),
-            'reason': 'No status update in 3 days',
-            'petition_subject': petition.get('petition_subject', 'N/A'),
-            'days_pending': (datetime.now() - get_last_timeline_update(petition)).days
-        }
+        reminder_data = build_reminder(petition, department)
         
         # Insert reminder into reminders collection
         db.reminders.insert_one(reminder_data)
+        response_cache.invalidate("reminders")
         
         # Update petition with last reminded timestamp
-        department_table = department_tables.get(department)
-        if department_table:
-            db[department_table].update_one(
+        if department in department_tables:
+            PetitionRepository(db).update_one(
+                department,
                 {'_id': petition['_id']},
                 {'$set': {'last_reminded_at': datetime.now()}}
             )
@@ -1189,61 +4786,128 @@ def send_reminder_for_petition(petition, department):
         logger.error(f"Error sending reminder for petition {tracking_id}: {str(e)}")
         return False
 
+async def send_reminder_for_petition_async(petition, department):
+    """
+    send_reminder_for_petition on motor, for async routes
+    """
+    tracking_id = petition.get('tracking_id', petition.get('_id', 'Unknown'))
+    try:
+        db = connect_to_async_db()
+        reminder_data = build_reminder(petition, department)
+        await db.reminders.insert_one(reminder_data)
+        await invalidate_cache_async("reminders")
+        
+        if department in department_tables:
+            await AsyncPetitionRepository(db).update_one(
+                department,
+                {'_id': petition['_id']},
+                {'$set': {'last_reminded_at': datetime.now()}}
+            )
+        
+        logger.info(f"Reminder sent to officer {reminder_data['officer_id']} for grievance {tracking_id}")
+        print(f"Reminder sent to officer {reminder_data['officer_id']} for grievance {tracking_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Error sending reminder for petition {tracking_id}: {str(e)}")
+        return False
+
+def reminder_candidate_query():
+    """
+    Query for open petitions that have not been reminded in the last 3 days
+    """
+    return {
+        'status': {'$in': ['pending', 'in_progress']},
+        '$or': [
+            {'last_reminded_at': {'$exists': False}},
+            {'last_reminded_at': {'$lt': datetime.now() - timedelta(days=3)}}
+        ]
+    }
+
+@timed_operation("reminder_sweep")
 def check_and_send_reminders():
     """
     Background task to check all departments for inactive grievances and send reminders
     """
     try:
         logger.info("Starting automated reminder check...")
-        db = connect_to_db()
+        petitions = PetitionRepository(connect_to_db())
         
         total_reminders = 0
+        department_reminders = {}
         
-        # Check each department
-        for department, table_name in department_tables.items():
+        # Check every department in one pass over the candidates
+        for petition, department in petitions.find_any(reminder_candidate_query()):
             try:
-                collection = db[table_name]
-                
-                # Find petitions that need reminders
-                petitions_needing_reminders = list(collection.find({
-                    'status': {'$in': ['pending', 'in_progress']},
-                    '$or': [
-                        {'last_reminded_at': {'$exists': False}},
-                        {'last_reminded_at': {'$lt': datetime.now() - timedelta(days=3)}}
-                    ]
-                }))
-                
-                department_reminders = 0
-                for petition in petitions_needing_reminders:
-                    if should_send_reminder(petition):
-                        if send_reminder_for_petition(petition, department):
-                            department_reminders += 1
-                            total_reminders += 1
-                
-                if department_reminders > 0:
-                    logger.info(f"Sent {department_reminders} reminders for {department}")
-                    
+                if should_send_reminder(petition):
+                    if send_reminder_for_petition(petition, department):
+                        department_reminders[department] = department_reminders.get(department, 0) + 1
+                        total_reminders += 1
             except Exception as e:
                 logger.error(f"Error checking reminders for {department}: {str(e)}")
                 continue
         
+        for department, count in department_reminders.items():
+            logger.info(f"Sent {count} reminders for {department}")
+        
         logger.info(f"Automated reminder check completed. Total reminders sent: {total_reminders}")
         
     except Exception as e:
         logger.error(f"Error in automated reminder system: {str(e)}")
 
-# Initialize scheduler
-scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Kolkata'))
+# --------------------------- Archive Tiering ---------------------------
+
+def archive_closed_grievances():
+    """
+    Background task to move closed grievances older than ARCHIVE_AFTER_DAYS into the archive
+    
+    Works in batches of ARCHIVE_BATCH_SIZE so each pass holds little in memory.
+    """
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+    try:
+        logger.info("Starting archive of closed grievances...")
+        petitions = PetitionRepository(connect_to_db())
+        cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        
+        total_archived = 0
+        for department in department_tables:
+            try:
+                department_archived = 0
+                while True:
+                    moved = petitions.archive_closed(department, cutoff)
+                    if moved == 0:
+                        break
+                    department_archived += moved
+                
+                if department_archived > 0:
+                    logger.info(f"Archived {department_archived} closed grievances for {department}")
+                total_archived += department_archived
+                
+            except Exception as e:
+                logger.error(f"Error archiving grievances for {department}: {str(e)}")
+                continue
+        
+        logger.info(f"Archive of closed grievances completed. Total archived: {total_archived}")
+        return total_archived
+        
+    except Exception as e:
+        logger.error(f"Error in grievance archiver: {str(e)}")
+        return 0
+
+# Created by start_reminder_scheduler(), so workers without the scheduler feature never import APScheduler
+scheduler = None
 
 def start_reminder_scheduler():
     """
     Start the background scheduler for automated reminders
     """
+    global scheduler
     try:
+        scheduler = apscheduler_background.BackgroundScheduler(timezone=pytz.timezone('Asia/Kolkata'))
         # Schedule the reminder check to run daily at 9 AM IST
         scheduler.add_job(
             func=check_and_send_reminders,
-            trigger=CronTrigger(hour=9, minute=0),  # 9:00 AM daily
+            trigger=apscheduler_cron.CronTrigger(hour=9, minute=0),  # 9:00 AM daily
             id='daily_reminder_check',
             name='Daily Grievance Reminder Check',
             replace_existing=True
@@ -1252,12 +4916,30 @@ def start_reminder_scheduler():
         # Also add a job that runs every 6 hours for more frequent checks
         scheduler.add_job(
             func=check_and_send_reminders,
-            trigger=CronTrigger(hour='*/6'),  # Every 6 hours
+            trigger=apscheduler_cron.CronTrigger(hour='*/6'),  # Every 6 hours
             id='frequent_reminder_check',
             name='Frequent Grievance Reminder Check',
             replace_existing=True
         )
         
+        # Archive closed grievances nightly at 2 AM IST, outside office hours
+        scheduler.add_job(
+            func=archive_closed_grievances,
+            trigger=apscheduler_cron.CronTrigger(hour=2, minute=0),
+            id='nightly_archive',
+            name='Nightly Closed Grievance Archive',
+            replace_existing=True
+        )
+        
+        # Rebuild dashboard counters from source nightly at 3 AM IST
+        scheduler.add_job(
+            func=reconcile_dashboard_counters,
+            trigger=apscheduler_cron.CronTrigger(hour=3, minute=0),
+            id='nightly_counter_reconcile',
+            name='Nightly Dashboard Counter Reconciliation',
+            replace_existing=True
+        )
+        
         scheduler.start()
         logger.info("Reminder scheduler started successfully")
         
@@ -1268,71 +4950,280 @@ def stop_reminder_scheduler():
     """
     Stop the background scheduler
     """
+    if scheduler is None:
+        return
     try:
         scheduler.shutdown()
         logger.info("Reminder scheduler stopped")
     except Exception as e:
         logger.error(f"Error stopping reminder scheduler: {str(e)}")
 
+# --------------------------- Memory Diagnostics ---------------------------
+
+# tracemalloc is off by default because it slows every allocation down. Start
+# it from /admin/memory/tracing/start (or run with PYTHONTRACEMALLOC=<frames>),
+# take snapshots some time apart and diff them to see which call sites keep
+# growing. Snapshots hold every traced block, so only the last
+# MEMORY_SNAPSHOT_KEEP of them are kept.
+MEMORY_TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", "10"))
+MEMORY_SNAPSHOT_KEEP = int(os.environ.get("MEMORY_SNAPSHOT_KEEP", "5"))
+MEMORY_GROUP_BY = ("lineno", "filename", "traceback")
+
+memory_snapshots = OrderedDict()
+_memory_snapshots_lock = threading.Lock()
+
+def process_memory():
+    """Resident and peak resident memory of this worker in MB"""
+    memory = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    memory["rss_mb" if name == "VmRSS" else "peak_rss_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        if resource is None:
+            return memory
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["peak_rss_mb"] = round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    return memory
+
+def resident_structures():
+    """Size of the caches and indexes this worker keeps in memory"""
+    with event_bus._lock:
+        subscriptions = list(event_bus._subscriptions)
+    return {
+        "response_cache": response_cache.memory_stats(),
+        "similarity_index": similarity_index.memory_stats(),
+        "singleflight_in_flight": sum(counts["in_flight"] for counts in singleflight.stats().values()),
+        "slow_query_log_entries": len(slow_query_log.entries),
+        "request_profiles": len(recent_profiles),
+        "event_subscribers": len(subscriptions),
+        "event_queued": sum(subscription.queue.qsize() for subscription in subscriptions),
+        "metric_series": sum(len(metric._series) for metric in METRICS),
+        "mongo_clients": {kind: {"max_pool_size": MONGO_MAX_POOL_SIZE} for kind in _mongo_clients},
+        "memory_snapshots": len(memory_snapshots)
+    }
+
+def _filtered_snapshot(snapshot):
+    # Leave out allocations made by tracemalloc itself and by the import machinery
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>")
+    ))
+
+def _format_stat(stat, group_by):
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    row = {
+        "location": frames[0] if frames else "<unknown>",
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count
+    }
+    if group_by == "traceback":
+        row["traceback"] = frames
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        row["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        row["count_diff"] = stat.count_diff
+    return row
+
+@router.get("/admin/memory")
+def get_memory_report():
+    """
+    Process memory, tracemalloc status and the size of resident caches and indexes
+    """
+    gc_counts = gc.get_count()
+    report = {
+        "success": True,
+        "process": dict(process_memory(), threads=threading.active_count(), gc_counts=list(gc_counts)),
+        "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+        "resident": resident_structures()
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["tracemalloc"].update(
+            frames=tracemalloc.get_traceback_limit(),
+            traced_mb=round(current / (1024 * 1024), 2),
+            traced_peak_mb=round(peak / (1024 * 1024), 2),
+            overhead_mb=round(tracemalloc.get_tracemalloc_memory() / (1024 * 1024), 2)
+        )
+    return report
+
+@router.post("/admin/memory/tracing/start")
+def start_memory_tracing(frames: int = MEMORY_TRACE_FRAMES):
+    """
+    Start tracemalloc, storing up to frames frames per allocation
+    """
+    if tracemalloc.is_tracing():
+        return {"success": False, "message": f"tracemalloc is already tracing {tracemalloc.get_traceback_limit()} frames"}
+    tracemalloc.start(max(1, frames))
+    logger.info(f"tracemalloc started with {frames} frames")
+    return {"success": True, "frames": tracemalloc.get_traceback_limit()}
+
+@router.post("/admin/memory/tracing/stop")
+def stop_memory_tracing():
+    """
+    Stop tracemalloc and drop the snapshots taken so far
+    """
+    tracemalloc.stop()
+    with _memory_snapshots_lock:
+        memory_snapshots.clear()
+    return {"success": True}
+
+@router.post("/admin/memory/snapshots")
+def take_memory_snapshot(limit: int = 20, group_by: str = "lineno"):
+    """
+    Take a tracemalloc snapshot and return its top allocating call sites
+    """
+    if group_by not in MEMORY_GROUP_BY:
+        return {"success": False, "message": f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}"}
+    if not tracemalloc.is_tracing():
+        return {"success": False, "message": "tracemalloc is not tracing; start it first"}
+    snapshot = _filtered_snapshot(tracemalloc.take_snapshot())
+    snapshot_id = uuid.uuid4().hex[:12]
+    with _memory_snapshots_lock:
+        memory_snapshots[snapshot_id] = (snapshot, datetime.now())
+        while len(memory_snapshots) > MEMORY_SNAPSHOT_KEEP:
+            memory_snapshots.popitem(last=False)
+    stats = snapshot.statistics(group_by)
+    return {
+        "success": True,
+        "snapshot_id": snapshot_id,
+        "traced_mb": round(sum(stat.size for stat in stats) / (1024 * 1024), 2),
+        "top": [_format_stat(stat, group_by) for stat in stats[:limit]]
+    }
+
+@router.get("/admin/memory/snapshots")
+def list_memory_snapshots():
+    """
+    Snapshots kept for diffing, oldest first
+    """
+    with _memory_snapshots_lock:
+        snapshots = list(memory_snapshots.items())
+    return {
+        "success": True,
+        "snapshots": [{"snapshot_id": snapshot_id, "taken_at": taken_at.isoformat()} for snapshot_id, (_, taken_at) in snapshots]
+    }
+
+@router.get("/admin/memory/snapshots/{snapshot_id}/diff")
+def diff_memory_snapshots(snapshot_id: str, base: str = None, limit: int = 20, group_by: str = "lineno"):
+    """
+    Call sites whose allocations grew the most between base (default: the
+    snapshot taken before this one) and this snapshot
+    """
+    if group_by not in MEMORY_GROUP_BY:
+        return {"success": False, "message": f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}"}
+    with _memory_snapshots_lock:
+        ids = list(memory_snapshots)
+        if snapshot_id not in memory_snapshots:
+            return {"success": False, "message": f"Snapshot {snapshot_id} not found"}
+        if base is None:
+            position = ids.index(snapshot_id)
+            if position == 0:
+                return {"success": False, "message": "No earlier snapshot to compare with"}
+            base = ids[position - 1]
+        if base not in memory_snapshots:
+            return {"success": False, "message": f"Snapshot {base} not found"}
+        snapshot, taken_at = memory_snapshots[snapshot_id]
+        base_snapshot, base_taken_at = memory_snapshots[base]
+    stats = snapshot.compare_to(base_snapshot, group_by)
+    return {
+        "success": True,
+        "snapshot_id": snapshot_id,
+        "base": base,
+        "seconds_between": (taken_at - base_taken_at).total_seconds(),
+        "size_diff_mb": round(sum(stat.size_diff for stat in stats) / (1024 * 1024), 2),
+        "top": [_format_stat(stat, group_by) for stat in stats[:limit]]
+    }
+
 # --------------------------- FastAPI Startup/Shutdown Events ---------------------------
 
-@app.on_event("startup")
-async def startup_event():
-    """Start the reminder scheduler when the app starts"""
-    start_reminder_scheduler()
-    logger.info("Grievance Portal API started with automated reminder system")
+async def startup_event(app):
+    """Create indexes, warm up the enabled features and start the reminder scheduler and event bus"""
+    global running_features
+    running_features = app.state.features
+    startup_report = app.state.startup_report
+    start = time.perf_counter()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if APP_WARMUP:
+        await run_in_threadpool(warm_up, running_features)
+    startup_report["warmup_seconds"] = round(time.perf_counter() - start, 3)
+    try:
+        await run_in_threadpool(ensure_indexes)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {str(e)}")
+    if feature_enabled("scheduler"):
+        start_reminder_scheduler()
+    start_event_bus()
+    if feature_enabled("similarity") and SIMILARITY_INDEX_ENABLED:
+        threading.Thread(target=similarity_index.ensure_fresh, daemon=True).start()
+    startup_report.update(
+        startup_seconds=round(time.perf_counter() - start, 3),
+        rss_mb_after_startup=process_memory().get("rss_mb")
+    )
+    logger.info(
+        f"Grievance Portal API started in {startup_report['import_seconds'] + startup_report['startup_seconds']:.2f}s "
+        f"(import {startup_report['import_seconds']:.2f}s, startup {startup_report['startup_seconds']:.2f}s) "
+        f"with features: {', '.join(sorted(running_features)) or 'none'}"
+    )
 
-@app.on_event("shutdown")
 async def shutdown_event():
-    """Stop the reminder scheduler when the app shuts down"""
+    """Stop the reminder scheduler and event bus when the app shuts down"""
     stop_reminder_scheduler()
+    stop_event_bus()
+    if TRACING_ENABLED:
+        span_exporter.flush()
+    close_db_clients()
     logger.info("Grievance Portal API stopped")
 
 # --------------------------- Manual Reminder Management ---------------------------
 
-@app.post("/admin/send_reminders")
+@router.post("/admin/send_reminders")
 async def manual_reminder_check():
     """
     Manually trigger the reminder check (for testing and admin use)
     """
     try:
-        check_and_send_reminders()
+        # The sweep is shared with the scheduler and uses pymongo, so keep it off the event loop
+        await run_in_threadpool(check_and_send_reminders)
         return {"message": "Reminder check completed successfully"}
     except Exception as e:
         logger.error(f"Error in manual reminder check: {str(e)}")
         raise HTTPException(status_code=500, detail="Error checking reminders")
 
-@app.get("/admin/reminders")
+@router.post("/admin/archive_closed")
+def manual_archive_closed():
+    """
+    Manually trigger the archive of closed grievances (for admin use)
+    """
+    archived = archive_closed_grievances()
+    return {"message": "Archive completed successfully", "archived": archived}
+
+@router.get("/admin/reminders", **documented(ReminderList))
 async def get_reminders_for_department(department: str = None):
     """
     Get reminders for a specific department or all reminders
     """
     try:
-        db = connect_to_db()
+        db = connect_to_async_db()
         
         # If department is specified, get grievances that need reminders from that department
         if department:
-            table_name = department_tables.get(department)
-            if not table_name:
+            if department not in department_tables:
                 return {"success": False, "message": "Invalid department"}
             
-            collection = db[table_name]
-            
             # Find petitions that need reminders
-            petitions_needing_reminders = list(collection.find({
-                'status': {'$in': ['pending', 'in_progress']},
-                '$or': [
-                    {'last_reminded_at': {'$exists': False}},
-                    {'last_reminded_at': {'$lt': datetime.now() - timedelta(days=3)}}
-                ]
-            }))
+            petitions_needing_reminders = await AsyncPetitionRepository(db).find(
+                department, reminder_candidate_query(), {"timeline": 0}
+            ).to_list(length=None)
             
             # Format the data for frontend
             formatted_reminders = []
             for petition in petitions_needing_reminders:
                 if should_send_reminder(petition):
                     formatted_reminders.append({
-                        '_id': str(petition['_id']),
+                        '_id': petition['_id'],
                         'tracking_id': petition.get('tracking_id', 'N/A'),
                         'subject': petition.get('petition_subject', 'N/A'),
                         'department': department,
@@ -1340,50 +5231,46 @@ async def get_reminders_for_department(department: str = None):
                         'last_reminder': petition.get('last_reminded_at')
                     })
             
-            return {
+            return json_response({
                 "success": True,
                 "data": formatted_reminders
-            }
+            }, ReminderList)
         else:
             # Get all reminder history
-            reminders = list(db.reminders.find().sort("sent_at", -1).limit(50))
-            
-            # Convert ObjectId to string for JSON serialization
-            for reminder in reminders:
-                reminder["_id"] = str(reminder["_id"])
-                if isinstance(reminder.get("sent_at"), datetime):
-                    reminder["sent_at"] = reminder["sent_at"].isoformat()
-            
-            return {
+            reminders = await db.reminders.find().sort("sent_at", -1).limit(50).to_list(length=50)
+            return json_response({
                 "success": True,
                 "data": reminders
-            }
+            }, ReminderList)
             
     except Exception as e:
         logger.error(f"Error getting reminders: {str(e)}")
         return {"success": False, "message": f"Error retrieving reminders: {str(e)}"}
 
-@app.get("/admin/reminder_stats")
-async def get_reminder_stats():
+@router.get("/admin/reminder_stats")
+async def get_reminder_stats(request: Request):
     """
     Get statistics about reminders sent
+    
+    Cached until the next reminder is sent (or RESPONSE_CACHE_TTL passes,
+    which bounds how stale the 7-day "recent" count can get).
     """
-    try:
-        db = connect_to_db()
+    async def compute():
+        db = connect_to_async_db()
         
         # Get total reminders sent
-        total_reminders = db.reminders.count_documents({})
+        total_reminders = await db.reminders.count_documents({})
         
         # Get reminders sent in the last 7 days
         week_ago = datetime.now() - timedelta(days=7)
-        recent_reminders = db.reminders.count_documents({"sent_at": {"$gte": week_ago}})
+        recent_reminders = await db.reminders.count_documents({"sent_at": {"$gte": week_ago}})
         
         # Get reminders by department
         pipeline = [
             {"$group": {"_id": "$department", "count": {"$sum": 1}}},
             {"$sort": {"count": -1}}
         ]
-        by_department = list(db.reminders.aggregate(pipeline))
+        by_department = await db.reminders.aggregate(pipeline).to_list(length=None)
         
         return {
             "success": True,
@@ -1393,11 +5280,14 @@ async def get_reminder_stats():
                 "by_department": by_department
             }
         }
+
+    try:
+        return await cached_json_response(request, ["reminders"], {}, compute)
     except Exception as e:
         logger.error(f"Error getting reminder stats: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving reminder statistics")
 
-@app.post("/admin/send_individual_reminder")
+@router.post("/admin/send_individual_reminder")
 async def send_individual_reminder(request_data: dict):
     """
     Send an individual reminder for a specific grievance
@@ -1407,26 +5297,19 @@ async def send_individual_reminder(request_data: dict):
         if not reminder_id:
             return {"success": False, "message": "Reminder ID is required"}
         
-        db = connect_to_db()
+        petitions = AsyncPetitionRepository(connect_to_async_db())
         
         # Find the grievance across all departments
-        grievance_found = None
-        department_found = None
-        
-        for department, table_name in department_tables.items():
-            collection = db[table_name]
-            grievance = collection.find_one({"_id": reminder_id}) or collection.find_one({"tracking_id": reminder_id})
-            
-            if grievance:
-                grievance_found = grievance
-                department_found = department
-                break
+        matches = [{"_id": reminder_id}, {"tracking_id": reminder_id}]
+        if ObjectId.is_valid(reminder_id):
+            matches.insert(1, {"_id": ObjectId(reminder_id)})
+        grievance_found, department_found = await petitions.find_one_any({"$or": matches}, {"timeline": 0})
         
         if not grievance_found:
             return {"success": False, "message": "Grievance not found"}
         
         # Send the reminder
-        success = send_reminder_for_petition(grievance_found, department_found)
+        success = await send_reminder_for_petition_async(grievance_found, department_found)
         
         if success:
             return {
@@ -1445,27 +5328,34 @@ async def send_individual_reminder(request_data: dict):
 
 # --------------------------- New Timeline and Similarity Endpoints ---------------------------
 
-@app.get("/grievance/timeline")
-def get_timeline(tracking_id: str, department: str):
+@router.get("/grievance/timeline", **documented(TimelinePage))
+async def get_timeline(tracking_id: str, department: str, limit: int = TIMELINE_PAGE_SIZE, cursor: str = None):
     """
-    Get the complete timeline for a specific grievance
+    Get the timeline for a specific grievance, one page at a time
+    
+    Pass the returned next_cursor back as cursor to fetch the following page.
     """
     try:
-        timeline = get_grievance_timeline(tracking_id, department)
-        return {
+        limit = max(1, min(limit, 500))
+        timeline, next_cursor = await get_grievance_timeline(tracking_id, department, limit, cursor)
+        return json_response({
             "success": True,
-            "timeline": timeline
-        }
+            "timeline": timeline,
+            "next_cursor": next_cursor
+        }, TimelinePage)
     except Exception as e:
         return {"success": False, "message": f"Error retrieving timeline: {str(e)}"}
 
-@app.get("/grievance/similar")
-def check_similar_grievances(department: str, text: str, threshold: float = 0.8):
+@similarity_router.get("/grievance/similar")
+@coalesce("similar")
+def check_similar_grievances(department: str, text: str, threshold: float = 0.8, open_only: bool = None, scope: str = None):
     """
     Check for similar grievances (useful for testing or manual checks)
     """
     try:
-        similar = find_similar_grievances(text, department, threshold)
+        if scope and scope not in SIMILARITY_SCOPES:
+            return {"success": False, "message": "Invalid scope, expected department, related or all"}
+        similar = find_similar_grievances(text, department, threshold, open_only, scope)
         return {
             "success": True,
             "similar_grievances": similar,
@@ -1474,29 +5364,110 @@ def check_similar_grievances(department: str, text: str, threshold: float = 0.8)
     except Exception as e:
         return {"success": False, "message": f"Error checking similarity: {str(e)}"}
 
-@app.get("/admin/notifications")
-def get_notification_logs(limit: int = 50):
+@router.get("/metrics")
+def get_metrics():
+    """
+    Metrics of this worker in the Prometheus text format
+    """
+    SIMILARITY_INDEX_ROWS.set(len(similarity_index.positions))
+    lines = []
+    for metric in METRICS:
+        lines += metric.expose()
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@router.get("/admin/slow_queries")
+def get_slow_queries(limit: int = 100, collection: str = None, route: str = None, source: str = "memory"):
+    """
+    MongoDB commands slower than SLOW_QUERY_MS, newest first, with a summary by filter shape
+
+    source=memory reads this worker's ring buffer; source=db reads
+    SLOW_QUERY_COLLECTION, which has the entries of every worker.
+    """
+    limit = max(1, min(limit, SLOW_QUERY_BUFFER))
+    if source == "db":
+        if not SLOW_QUERY_COLLECTION:
+            return {"success": False, "message": "SLOW_QUERY_COLLECTION is not set"}
+        query = {}
+        if collection:
+            query["collection"] = collection
+        if route:
+            query["route"] = route
+        entries = list(connect_to_db()[SLOW_QUERY_COLLECTION].find(query, {"_id": 0}).sort("recorded_at", -1).limit(limit))
+    elif source == "memory":
+        entries = slow_query_log.recent(limit, collection, route)
+    else:
+        return {"success": False, "message": "source must be memory or db"}
+    return {
+        "success": True,
+        "enabled": SLOW_QUERY_ENABLED,
+        "threshold_ms": slow_query_log.threshold_ms,
+        "dropped": slow_query_log.dropped,
+        "summary": summarize_slow_queries(entries),
+        "entries": jsonable_encoder(entries)
+    }
+
+@router.get("/admin/profiles")
+def list_profiles(request: Request):
     """
-    Get notification logs for administrative purposes
+    Profiles recorded by this worker, newest first (requires the X-Profile token header)
     """
+    if not profiling_authorized(request):
+        return JSONResponse(status_code=403, content={"success": False, "message": "Profiling is disabled or the token is invalid"})
+    return {"success": True, "sample_rate": PROFILING_SAMPLE_RATE, "profiles": list(reversed(recent_profiles))}
+
+@router.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, request: Request):
+    """
+    One profile as collapsed stacks, ready for flamegraph.pl or speedscope
+    """
+    if not profiling_authorized(request):
+        return JSONResponse(status_code=403, content={"success": False, "message": "Profiling is disabled or the token is invalid"})
+    if not all(c in string.hexdigits for c in profile_id):
+        return JSONResponse(status_code=404, content={"success": False, "message": "Profile not found"})
     try:
-        db = connect_to_db()
-        notifications = list(db.notification_logs.find().sort("sent_at", -1).limit(limit))
-        
-        # Convert ObjectId and datetime to strings for JSON serialization
-        for notification in notifications:
-            notification["_id"] = str(notification["_id"])
-            if isinstance(notification.get("sent_at"), datetime):
-                notification["sent_at"] = notification["sent_at"].isoformat()
-        
+        with open(profile_path(profile_id)) as f:
+            content = f.read()
+    except FileNotFoundError:
+        return JSONResponse(status_code=404, content={"success": False, "message": "Profile not found"})
+    return Response(content=content, media_type="text/plain")
+
+@router.get("/admin/coalescing")
+def get_coalescing_stats():
+    """
+    How often identical concurrent requests were served from one computation
+    """
+    return {"success": True, "enabled": SINGLEFLIGHT_ENABLED, "stats": singleflight.stats()}
+
+@similarity_router.post("/admin/similarity_index/rebuild")
+def rebuild_similarity_index():
+    """
+    Rebuild the shared similarity index from the live grievances
+    """
+    try:
+        similarity_index.build()
+        return {"success": True, "indexed": len(similarity_index.entries)}
+    except Exception as e:
+        return {"success": False, "message": f"Error rebuilding similarity index: {str(e)}"}
+
+@notifications_router.get("/admin/notifications", **documented(NotificationLog))
+async def get_notification_logs(request: Request, limit: int = 50):
+    """
+    Get notification logs for administrative purposes (cached until the next notification)
+    """
+    async def compute():
+        db = connect_to_async_db()
+        notifications = await db.notification_logs.find().sort("sent_at", -1).limit(limit).to_list(length=limit)
         return {
             "success": True,
             "notifications": notifications
         }
+
+    try:
+        return await cached_json_response(request, ["notifications"], {"limit": limit}, compute, NotificationLog)
     except Exception as e:
         return {"success": False, "message": f"Error retrieving notifications: {str(e)}"}
 
-@app.post("/admin/test_similarity")
+@similarity_router.post("/admin/test_similarity")
 def test_similarity_detection():
     """
     Test endpoint to verify similarity detection is working
@@ -1519,8 +5490,8 @@ def test_similarity_detection():
     except Exception as e:
         return {"success": False, "message": f"Similarity test failed: {str(e)}"}
 
-@app.post("/admin/test_notifications")
-def test_notification_system():
+@notifications_router.post("/admin/test_notifications")
+async def test_notification_system():
     """
     Test endpoint to verify notification system is working
     """
@@ -1534,7 +5505,7 @@ def test_notification_system():
         }
         
         # Send test notification
-        success = send_notification_to_petitioner(test_grievance, 'pending', 'in_progress')
+        success = await send_notification_to_petitioner(test_grievance, 'pending', 'in_progress')
         
         return {
             "success": success,
@@ -1542,3 +5513,85 @@ def test_notification_system():
         }
     except Exception as e:
         return {"success": False, "message": f"Notification test failed: {str(e)}"}
+
+# --------------------------- App Factory ---------------------------
+
+@router.get("/admin/startup")
+def get_startup_report(request: Request):
+    """
+    How long this worker took to import and start, and what each feature's heavy imports cost
+    """
+    features = {
+        feature: {"enabled": feature in request.app.state.features, "modules": [], "import_seconds": 0.0, "import_rss_mb": 0.0}
+        for feature in FEATURES
+    }
+    for name, load in module_loads.items():
+        feature = features[load["feature"]]
+        feature["modules"].append(name)
+        feature["import_seconds"] = round(feature["import_seconds"] + load["seconds"], 3)
+        feature["import_rss_mb"] = round(feature["import_rss_mb"] + load["rss_mb"], 1)
+    return {
+        "success": True,
+        "warmup": APP_WARMUP,
+        "report": request.app.state.startup_report,
+        "features": features,
+        "modules": module_loads,
+        "rss_mb": process_memory().get("rss_mb")
+    }
+
+def create_app(features=None):
+    """
+    Build the API with the given features (default: APP_FEATURES)
+
+    features is "all" or an iterable of names from FEATURES. Only the
+    routers of enabled features are mounted and only their heavy modules
+    are warmed up at startup; the rest of the code checks feature_enabled().
+    """
+    if features is None:
+        features = ENABLED_FEATURES
+    else:
+        features = parse_features(features if isinstance(features, str) else ",".join(features))
+
+    app = FastAPI(default_response_class=BSONJSONResponse)
+    app.state.features = frozenset(features)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"]
+    )
+    app.middleware("http")(record_request_metrics)
+    if TRACING_ENABLED:
+        app.middleware("http")(trace_request)
+    if PROFILING_TOKEN:
+        app.middleware("http")(profile_request)
+
+    app.include_router(router)
+    for feature, feature_router in FEATURE_ROUTERS.items():
+        if feature in app.state.features:
+            app.include_router(feature_router)
+
+    async def on_startup():
+        await startup_event(app)
+
+    app.add_event_handler("startup", on_startup)
+    if PROFILING_TOKEN:
+        # At startup rather than here, so routes added to the app later are wrapped too
+        app.add_event_handler("startup", lambda: install_profiling_hooks(app))
+    app.add_event_handler("shutdown", shutdown_event)
+    # Filled in further by startup_event(), served at /admin/startup
+    app.state.startup_report = {
+        "features": sorted(app.state.features),
+        "import_seconds": round(time.perf_counter() - IMPORT_STARTED, 3),
+        "rss_mb_after_import": process_memory().get("rss_mb")
+    }
+    return app
+
+def __getattr__(name):
+    # main:app is built on first access, so importing create_app (as main_fixed does) builds nothing else
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,33 @@
 """
 Migration script to add tracking IDs to existing grievances
 This should be run once to update all existing grievances with proper tracking IDs
+
+Usage:
+    python migrate_tracking_ids.py              # add missing tracking IDs
+    python migrate_tracking_ids.py timelines    # move embedded timelines into timeline_events
+    python migrate_tracking_ids.py created_at   # backfill native created_at_utc datetimes
+    python migrate_tracking_ids.py unify        # copy per-department petitions into the unified collection
+
+To move to the unified layout: run the API with PETITION_STORAGE_MODE=dual_write,
+run the unify migration (re-run until it reports nothing left to reconcile), then
+switch to PETITION_STORAGE_MODE=unified.
 """
 
 import os
+import sys
 from dotenv import load_dotenv
 load_dotenv()
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReplaceOne
 import random
 import string
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+
+TIMELINE_COLLECTION = "timeline_events"
+UNIFIED_COLLECTION = "petitions"
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "500"))
+MIGRATION_BATCH_PAUSE = float(os.environ.get("MIGRATION_BATCH_PAUSE", "0.1"))
 
 def generate_tracking_id():
     """Generate a unique tracking ID in the format GR-YYYY-XXXXXX"""
@@ -25,51 +42,51 @@ def connect_to_db():
     client = MongoClient(mongo_uri)
     return client.petition_db
 
+department_tables = {
+    "Adi Dravidar and Tribal Welfare Department": "petitions_adi_dravidar_tribal_welfare",
+    "Agriculture and Farmers welfares Department": "petitions_agriculture_farmers_welfare",
+    "Animal Husbandry and Dairying and Fisheries and Fishermen Welfare Department": "petitions_animal_husbandry_fisheries",
+    "BC MBC and Minorities Welfare Department": "petitions_bc_mbc_minorities_welfare",
+    "Co-operation Food and Consumer Protection Department": "petitions_cooperation_food_consumer_protection",
+    "Commercial Taxes and Registration Department": "petitions_commercial_taxes_registration",
+    "Energy Department": "petitions_energy",
+    "Environment Climate Change and Forests Department": "petitions_environment_climate_forests",
+    "Finance Department": "petitions_finance",
+    "Handlooms Handicrafts Textiles and Khadi Department": "petitions_handlooms_handicrafts_textiles_khadi",
+    "Health and Family Welfare Department": "petitions_health_family_welfare",
+    "Higher Education Department": "petitions_higher_education",
+    "Highways and Minor Ports Department": "petitions_highways_minor_ports",
+    "Human Resources Management Department": "petitions_human_resources_management",
+    "Home Prohibition and Excise Department": "petitions_home_prohibition_excise",
+    "Housing and Urban Development Department": "petitions_housing_urban_development",
+    "Industries Department": "petitions_industries",
+    "Information Technology Department": "petitions_information_technology",
+    "Labour Welfare and Skill Development Department": "petitions_labour_welfare_skill_development",
+    "Law Department": "petitions_law",
+    "Legislative Assembly Department": "petitions_legislative_assembly",
+    "Micro Small and Medium Enterprises Department": "petitions_micro_small_medium_enterprises",
+    "Municipal Administration and Water Supply Department": "petitions_municipal_admin_water_supply",
+    "Public Elections Department": "petitions_public_elections",
+    "Public Department": "petitions_public",
+    "Public Works Department": "petitions_pwd",
+    "Revenue and Disaster Management Department": "petitions_revenue_disaster_management",
+    "Rural Development and Panchayat Raj Department": "petitions_rural_development_panchayat_raj",
+    "School Education Department": "petitions_school_education",
+    "Social Welfare and Women Empowerment Department": "petitions_social_welfare_women_empowerment",
+    "Tamil Dev. and Information Department": "petitions_tamil_dev_information",
+    "Tamil Nadu Water Supply and Drainage Board": "petitions_tn_water_supply_drainage_board",
+    "Tourism Culture and Religious Endowments Department": "petitions_tourism_culture_religious_endowments",
+    "Transport Department": "petitions_transport",
+    "Welfare of Differently Abled Persons": "petitions_welfare_diff_abled_persons",
+    "Youth Welfare and Sports Development Department": "petitions_youth_welfare_sports_development",
+    "Water Resources Department": "petitions_water_resources",
+    "Planning Development Department": "petitions_planning_development",
+    "Special Programme Implementation": "petitions_special_programme_implementation"
+}
+
 def migrate_tracking_ids():
     """Add tracking IDs to all existing grievances that don't have them"""
     
-    department_tables = {
-        "Adi Dravidar and Tribal Welfare Department": "petitions_adi_dravidar_tribal_welfare",
-        "Agriculture and Farmers welfares Department": "petitions_agriculture_farmers_welfare",
-        "Animal Husbandry and Dairying and Fisheries and Fishermen Welfare Department": "petitions_animal_husbandry_fisheries",
-        "BC MBC and Minorities Welfare Department": "petitions_bc_mbc_minorities_welfare",
-        "Co-operation Food and Consumer Protection Department": "petitions_cooperation_food_consumer_protection",
-        "Commercial Taxes and Registration Department": "petitions_commercial_taxes_registration",
-        "Energy Department": "petitions_energy",
-        "Environment Climate Change and Forests Department": "petitions_environment_climate_forests",
-        "Finance Department": "petitions_finance",
-        "Handlooms Handicrafts Textiles and Khadi Department": "petitions_handlooms_handicrafts_textiles_khadi",
-        "Health and Family Welfare Department": "petitions_health_family_welfare",
-        "Higher Education Department": "petitions_higher_education",
-        "Highways and Minor Ports Department": "petitions_highways_minor_ports",
-        "Human Resources Management Department": "petitions_human_resources_management",
-        "Home Prohibition and Excise Department": "petitions_home_prohibition_excise",
-        "Housing and Urban Development Department": "petitions_housing_urban_development",
-        "Industries Department": "petitions_industries",
-        "Information Technology Department": "petitions_information_technology",
-        "Labour Welfare and Skill Development Department": "petitions_labour_welfare_skill_development",
-        "Law Department": "petitions_law",
-        "Legislative Assembly Department": "petitions_legislative_assembly",
-        "Micro Small and Medium Enterprises Department": "petitions_micro_small_medium_enterprises",
-        "Municipal Administration and Water Supply Department": "petitions_municipal_admin_water_supply",
-        "Public Elections Department": "petitions_public_elections",
-        "Public Department": "petitions_public",
-        "Public Works Department": "petitions_pwd",
-        "Revenue and Disaster Management Department": "petitions_revenue_disaster_management",
-        "Rural Development and Panchayat Raj Department": "petitions_rural_development_panchayat_raj",
-        "School Education Department": "petitions_school_education",
-        "Social Welfare and Women Empowerment Department": "petitions_social_welfare_women_empowerment",
-        "Tamil Dev. and Information Department": "petitions_tamil_dev_information",
-        "Tamil Nadu Water Supply and Drainage Board": "petitions_tn_water_supply_drainage_board",
-        "Tourism Culture and Religious Endowments Department": "petitions_tourism_culture_religious_endowments",
-        "Transport Department": "petitions_transport",
-        "Welfare of Differently Abled Persons": "petitions_welfare_diff_abled_persons",
-        "Youth Welfare and Sports Development Department": "petitions_youth_welfare_sports_development",
-        "Water Resources Department": "petitions_water_resources",
-        "Planning Development Department": "petitions_planning_development",
-        "Special Programme Implementation": "petitions_special_programme_implementation"
-    }
-    
     db = connect_to_db()
     used_tracking_ids = set()
     total_updated = 0
@@ -125,5 +142,207 @@ def migrate_tracking_ids():
     
     print(f"\nMigration complete! Updated {total_updated} petitions with tracking IDs.")
 
+def migrate_timelines():
+    """Move embedded timeline arrays out of petitions into the timeline_events collection"""
+    
+    db = connect_to_db()
+    events_collection = db[TIMELINE_COLLECTION]
+    events_collection.create_index(
+        [("tracking_id", 1), ("timestamp", 1)],
+        name="tracking_id_timestamp"
+    )
+    total_migrated = 0
+    
+    print("Starting migration of embedded timelines...")
+    
+    for department, table_name in department_tables.items():
+        collection = db[table_name]
+        
+        # Find petitions that still carry an embedded timeline
+        petitions_with_timeline = list(collection.find(
+            {"timeline": {"$exists": True}, "tracking_id": {"$exists": True}},
+            {"tracking_id": 1, "timeline": 1}
+        ))
+        
+        if not petitions_with_timeline:
+            print(f"No embedded timelines to migrate in {department}")
+            continue
+        
+        print(f"Found {len(petitions_with_timeline)} embedded timelines in {department}")
+        
+        for petition in petitions_with_timeline:
+            tracking_id = petition["tracking_id"]
+            timeline = [entry for entry in petition.get("timeline") or [] if isinstance(entry, dict)]
+            
+            # Upsert each event so the migration can be re-run safely after an interruption
+            operations = []
+            for entry in timeline:
+                event = dict(entry, tracking_id=tracking_id, department=department)
+                key = {
+                    "tracking_id": tracking_id,
+                    "timestamp": entry.get("timestamp"),
+                    "status": entry.get("status"),
+                    "update_type": entry.get("update_type")
+                }
+                operations.append(UpdateOne(key, {"$setOnInsert": event}, upsert=True))
+            if operations:
+                events_collection.bulk_write(operations, ordered=False)
+            
+            # Keep only the denormalized summary on the petition
+            update = {
+                "$set": {"timeline_count": events_collection.count_documents({"tracking_id": tracking_id})},
+                "$unset": {"timeline": ""}
+            }
+            stamped = [entry for entry in timeline if isinstance(entry.get("timestamp"), datetime)]
+            if stamped:
+                latest = max(stamped, key=lambda entry: entry["timestamp"])
+                update["$set"]["last_status"] = latest.get("status")
+                update["$set"]["last_activity_at"] = latest["timestamp"]
+            
+            collection.update_one({"_id": petition["_id"]}, update)
+            total_migrated += 1
+        
+    print(f"\nMigration complete! Moved timelines of {total_migrated} petitions.")
+
+def created_at_to_utc(petition):
+    """Derive a UTC creation datetime from the display string and the ObjectId"""
+    object_time = None
+    if hasattr(petition["_id"], "generation_time"):
+        object_time = petition["_id"].generation_time
+    
+    created_at = petition.get("created_at")
+    if isinstance(created_at, datetime):
+        return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+    
+    if isinstance(created_at, str):
+        for fmt in ["%d-%b-%Y", "%Y-%m-%d", "%d/%m/%Y"]:
+            try:
+                created_date = datetime.strptime(created_at, fmt).date()
+            except ValueError:
+                continue
+            # The ObjectId carries the exact insert time when it agrees with the display date,
+            # which was written in the server's local time
+            if object_time and object_time.astimezone().date() == created_date:
+                return object_time
+            return datetime(created_date.year, created_date.month, created_date.day, tzinfo=timezone.utc)
+    
+    return object_time
+
+def migrate_created_at():
+    """Backfill created_at_utc in small batches so the portal can keep serving traffic"""
+    
+    db = connect_to_db()
+    total_updated = 0
+    
+    print("Starting migration of created_at_utc...")
+    
+    for department, table_name in department_tables.items():
+        collection = db[table_name]
+        collection.create_index([("created_at_utc", 1)], name="created_at_utc")
+        collection.create_index([("status", 1), ("created_at_utc", 1)], name="status_created_at_utc")
+        
+        department_updated = 0
+        last_id = None
+        while True:
+            # Walk the collection in _id order so each batch is a cheap index range scan
+            query = {"created_at_utc": {"$exists": False}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = list(
+                collection.find(query, {"created_at": 1})
+                .sort("_id", 1)
+                .limit(MIGRATION_BATCH_SIZE)
+            )
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            
+            operations = []
+            for petition in batch:
+                created_at_utc = created_at_to_utc(petition)
+                if created_at_utc is None:
+                    print(f"  Could not derive created_at_utc for petition {petition['_id']}")
+                    continue
+                # Guard on the field so a concurrent writer's value is never overwritten
+                operations.append(UpdateOne(
+                    {"_id": petition["_id"], "created_at_utc": {"$exists": False}},
+                    {"$set": {"created_at_utc": created_at_utc}}
+                ))
+            if operations:
+                result = collection.bulk_write(operations, ordered=False)
+                department_updated += result.modified_count
+            
+            time.sleep(MIGRATION_BATCH_PAUSE)
+        
+        if department_updated:
+            print(f"Backfilled created_at_utc for {department_updated} petitions in {department}")
+        total_updated += department_updated
+    
+    print(f"\nMigration complete! Backfilled created_at_utc for {total_updated} petitions.")
+
+def migrate_to_unified():
+    """Backfill the unified petitions collection from the per-department collections"""
+    
+    db = connect_to_db()
+    unified = db[UNIFIED_COLLECTION]
+    unified.create_index([("department", 1), ("tracking_id", 1)], name="department_tracking_id")
+    total_copied = 0
+    total_reconciled = 0
+    
+    print("Starting backfill of the unified petitions collection...")
+    
+    for department, table_name in department_tables.items():
+        collection = db[table_name]
+        department_copied = 0
+        department_reconciled = 0
+        last_id = None
+        while True:
+            query = {} if last_id is None else {"_id": {"$gt": last_id}}
+            batch = list(collection.find(query).sort("_id", 1).limit(MIGRATION_BATCH_SIZE))
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            
+            # Insert petitions that are missing; dual-written ones already exist
+            operations = []
+            for petition in batch:
+                petition["department"] = department
+                fields = {key: value for key, value in petition.items() if key != "_id"}
+                operations.append(UpdateOne({"_id": petition["_id"]}, {"$setOnInsert": fields}, upsert=True))
+            result = unified.bulk_write(operations, ordered=False)
+            department_copied += result.upserted_count
+            
+            # Re-copy petitions whose unified copy is older than the source
+            # (updated between our read and the dual-write being enabled)
+            existing = {
+                doc["_id"]: doc.get("last_updated")
+                for doc in unified.find({"_id": {"$in": [p["_id"] for p in batch]}}, {"last_updated": 1})
+            }
+            stale = [
+                ReplaceOne({"_id": petition["_id"]}, petition)
+                for petition in batch
+                if petition.get("last_updated") and (
+                    existing.get(petition["_id"]) is None or existing[petition["_id"]] < petition["last_updated"]
+                )
+            ]
+            if stale:
+                department_reconciled += unified.bulk_write(stale, ordered=False).modified_count
+            
+            time.sleep(MIGRATION_BATCH_PAUSE)
+        
+        if department_copied or department_reconciled:
+            print(f"Copied {department_copied} and reconciled {department_reconciled} petitions from {department}")
+        total_copied += department_copied
+        total_reconciled += department_reconciled
+    
+    print(f"\nBackfill complete! Copied {total_copied} petitions, reconciled {total_reconciled}.")
+
 if __name__ == "__main__":
-    migrate_tracking_ids()
+    if len(sys.argv) > 1 and sys.argv[1] == "timelines":
+        migrate_timelines()
+    elif len(sys.argv) > 1 and sys.argv[1] == "created_at":
+        migrate_created_at()
+    elif len(sys.argv) > 1 and sys.argv[1] == "unify":
+        migrate_to_unified()
+    else:
+        migrate_tracking_ids()